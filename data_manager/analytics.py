@@ -0,0 +1,198 @@
+import time
+import numpy as np
+
+# Anomaly flags (bitmask so several can be raised by one sample)
+FLAG_NONE = 0
+FLAG_STUCK = 1   # Sensor keeps reporting the same value
+FLAG_SPIKE = 2   # Sample far outside the recent statistical band
+FLAG_JUMP = 4    # Physically implausible change between two samples
+
+FLAG_NAMES = {
+    FLAG_STUCK: "stuck",
+    FLAG_SPIKE: "spike",
+    FLAG_JUMP: "jump",
+}
+
+
+def describe_flags(mask):
+    """Return the list of flag names set in an anomaly bitmask."""
+    return [name for bit, name in FLAG_NAMES.items() if int(mask) & bit]
+
+
+class SensorAnalytics:
+    """
+    Streaming anomaly detection for sensor telemetry.
+    Keeps per-device EWMA, EWMA variance and rate-of-change in flat NumPy
+    arrays indexed by a device slot, so each sample costs O(1) time and the
+    memory per device is constant no matter how long the stream runs.
+    """
+
+    def __init__(self, alpha=0.1, spike_sigma=4.0, min_std=0.5, max_jump=10.0,
+                 stuck_samples=20, stuck_epsilon=1e-6, warmup=5, capacity=64):
+        self.alpha = alpha
+        self.spike_sigma = spike_sigma
+        self.min_std = min_std
+        self.max_jump = max_jump
+        self.stuck_samples = stuck_samples
+        self.stuck_epsilon = stuck_epsilon
+        self.warmup = warmup
+
+        # Device id -> slot in the state arrays
+        self.slots = {}
+        self.device_ids = []
+
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.last = np.zeros(capacity, dtype=np.float64)
+        self.last_ts = np.zeros(capacity, dtype=np.float64)
+        self.ewma = np.zeros(capacity, dtype=np.float64)
+        self.ewvar = np.zeros(capacity, dtype=np.float64)
+        self.rate = np.zeros(capacity, dtype=np.float64)
+        self.stuck_run = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        """Double the capacity of every state array."""
+        for name in ("count", "last", "last_ts", "ewma", "ewvar", "rate", "stuck_run"):
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _slot(self, device_id):
+        slot = self.slots.get(device_id)
+        if slot is None:
+            slot = len(self.device_ids)
+            if slot >= len(self.count):
+                self._grow()
+            self.slots[device_id] = slot
+            self.device_ids.append(device_id)
+        return slot
+
+    def update(self, device_id, value, timestamp=None):
+        """Feed one sample and return its anomaly bitmask."""
+        if timestamp is None:
+            timestamp = time.time()
+        value = float(value)
+        i = self._slot(device_id)
+
+        n = int(self.count[i])
+        if n == 0:
+            self.count[i] = 1
+            self.last[i] = value
+            self.last_ts[i] = timestamp
+            self.ewma[i] = value
+            self.ewvar[i] = 0.0
+            return FLAG_NONE
+
+        mask = FLAG_NONE
+        last = float(self.last[i])
+        ewma = float(self.ewma[i])
+        ewvar = float(self.ewvar[i])
+
+        delta = value - last
+        dt = max(timestamp - float(self.last_ts[i]), 1e-6)
+        self.rate[i] = delta / dt
+
+        if abs(delta) >= self.max_jump:
+            mask |= FLAG_JUMP
+
+        std = max(ewvar ** 0.5, self.min_std)
+        if n >= self.warmup and abs(value - ewma) > self.spike_sigma * std:
+            mask |= FLAG_SPIKE
+
+        # Only report a stuck sensor once, when the run crosses the threshold
+        if abs(delta) <= self.stuck_epsilon:
+            run = int(self.stuck_run[i]) + 1
+            self.stuck_run[i] = run
+            if run == self.stuck_samples:
+                mask |= FLAG_STUCK
+        else:
+            self.stuck_run[i] = 0
+
+        # Incremental EWMA / EWMA variance update
+        diff = value - ewma
+        incr = self.alpha * diff
+        self.ewma[i] = ewma + incr
+        self.ewvar[i] = (1.0 - self.alpha) * (ewvar + diff * incr)
+
+        self.count[i] = n + 1
+        self.last[i] = value
+        self.last_ts[i] = timestamp
+        return mask
+
+    def update_batch(self, device_ids, values, timestamps=None):
+        """
+        Feed a burst of samples and return one anomaly bitmask per sample.
+        Samples are applied in order; a device appearing several times in
+        the burst is handled in successive vectorized rounds.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if timestamps is None:
+            timestamps = np.full(len(values), time.time())
+        else:
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+        slots = np.fromiter((self._slot(d) for d in device_ids),
+                            dtype=np.int64, count=len(values))
+        masks = np.zeros(len(values), dtype=np.uint8)
+        if len(values) == 0:
+            return masks
+
+        # Rank of each sample among the samples of the same device
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - group_start
+
+        for r in range(int(rank.max()) + 1):
+            sel = np.flatnonzero(rank == r)
+            masks[sel] = self._update_vector(slots[sel], values[sel], timestamps[sel])
+        return masks
+
+    def _update_vector(self, s, value, ts):
+        """Vectorized update for a set of distinct slots."""
+        mask = np.zeros(len(s), dtype=np.uint8)
+        n = self.count[s]
+        fresh = n == 0
+        seen = ~fresh
+
+        last = self.last[s]
+        ewma = np.where(fresh, value, self.ewma[s])
+        ewvar = np.where(fresh, 0.0, self.ewvar[s])
+
+        delta = np.where(fresh, 0.0, value - last)
+        dt = np.maximum(ts - self.last_ts[s], 1e-6)
+        self.rate[s] = np.where(fresh, 0.0, delta / dt)
+
+        mask[seen & (np.abs(delta) >= self.max_jump)] |= FLAG_JUMP
+
+        std = np.maximum(np.sqrt(ewvar), self.min_std)
+        spike = seen & (n >= self.warmup) & (np.abs(value - ewma) > self.spike_sigma * std)
+        mask[spike] |= FLAG_SPIKE
+
+        flat = seen & (np.abs(delta) <= self.stuck_epsilon)
+        run = np.where(flat, self.stuck_run[s] + 1, 0)
+        self.stuck_run[s] = run
+        mask[flat & (run == self.stuck_samples)] |= FLAG_STUCK
+
+        diff = value - ewma
+        incr = self.alpha * diff
+        self.ewma[s] = ewma + incr
+        self.ewvar[s] = (1.0 - self.alpha) * (ewvar + diff * incr)
+
+        self.count[s] = n + 1
+        self.last[s] = value
+        self.last_ts[s] = ts
+        return mask
+
+    def stats(self, device_id):
+        """Return the current EWMA, standard deviation and rate for a device."""
+        i = self.slots.get(device_id)
+        if i is None:
+            return None
+        return {
+            "samples": int(self.count[i]),
+            "ewma": float(self.ewma[i]),
+            "std": float(np.sqrt(self.ewvar[i])),
+            "rate": float(self.rate[i]),
+        }
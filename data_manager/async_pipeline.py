@@ -0,0 +1,219 @@
+"""
+Headless asyncio data manager.
+
+Runs the manager's decode -> control -> persist pipeline as coroutines on
+the asyncio MQTT transport. Control decisions run sequentially on the
+event loop (they share one state) and never wait for I/O themselves:
+
+    writes      bounded queue drained by a fixed pool of writer tasks,
+                each running database calls in a worker thread
+    outgoing    bounded queue of commands and alarms, published in order
+                by one sender task that waits for each PUBACK
+
+A full queue makes the message loop wait (backpressure) instead of
+growing memory. AC commands carry a command_id and are matched with the
+relay's status acknowledgements by the same CommandTracker the Qt
+manager uses, including retries and the retry limit.
+
+Usage:
+    python data_manager/async_pipeline.py [--persist-workers 2] [--queue-size 1000]
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
+                        TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC,
+                        CONTROL_TOPIC, STATUS_TOPIC, ALARM_TOPIC)
+from mqtt_pool import make_client_id
+from mqtt_async import AsyncMqttClient
+from mqtt_codec import (CodecError, decode_message, format_timestamp,
+                        ControlMessage, AlarmMessage)
+from data_manager.storage import open_storage
+from data_manager.control import ControlParams, decide_ac_action, ACTION_NONE
+from data_manager.commands import CommandTracker
+
+# Queued database writes and outgoing publishes before the message loop waits
+QUEUE_SIZE = 1000
+# How often unacknowledged commands are checked (seconds)
+COMMAND_CHECK_INTERVAL = 1.0
+# Time allowed at shutdown for queued writes and publishes (seconds)
+DRAIN_TIMEOUT = 10.0
+
+
+class AsyncIngestPipeline:
+    """Decode, control and persist stages of the data manager as coroutines."""
+
+    def __init__(self, client, db, params=None, persist_workers=2, queue_size=QUEUE_SIZE):
+        self.client = client
+        self.db = db
+        self.params = params or ControlParams()
+        self.persist_workers = persist_workers
+        self.writes = asyncio.Queue(maxsize=queue_size)  # (database method, args)
+        self.outgoing = asyncio.Queue(maxsize=queue_size)  # (topic, payload)
+        self.commands = CommandTracker(timeout=3.0, max_retries=2)
+        self.current_temp = None
+        self.current_humidity = None
+        self.setpoint = None
+        self.ac_status = False
+        self.confirmed_ac_status = None  # Last state reported by the relay
+
+    async def run(self):
+        for topic in (TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC, STATUS_TOPIC):
+            await self.client.subscribe(topic, 1)
+        print("Async pipeline subscribed, waiting for messages")
+
+        tasks = [asyncio.create_task(self.persist_worker()) for _ in range(self.persist_workers)]
+        tasks.append(asyncio.create_task(self.publish_worker()))
+        timeouts = asyncio.create_task(self.check_pending_commands())
+        try:
+            async for msg in self.client.messages():
+                message = self.decode(msg)
+                if message is None:
+                    continue
+                if getattr(message, "buffered", False):
+                    # Late samples are stored with their own timestamp, never acted on
+                    if msg.topic in (TEMP_TOPIC, HUMIDITY_TOPIC) and message.timestamp:
+                        if msg.topic == TEMP_TOPIC:
+                            row = (message.timestamp, message.value, None, None, None)
+                        else:
+                            row = (message.timestamp, None, message.value, None, None)
+                        await self.persist("insert_readings", [row])
+                    continue
+                await self.control(msg.topic, message)
+                if self.current_temp is not None:
+                    await self.persist("insert_reading", self.current_temp, self.current_humidity,
+                                       self.setpoint, 1 if self.ac_status else 0)
+        finally:
+            timeouts.cancel()
+            # Let queued writes and publishes finish before the database is closed
+            try:
+                await asyncio.wait_for(asyncio.gather(self.writes.join(), self.outgoing.join()), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"Shutdown with {self.writes.qsize()} writes and {self.outgoing.qsize()} publishes queued")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(timeouts, *tasks, return_exceptions=True)
+
+    def decode(self, msg):
+        try:
+            return decode_message(msg.topic, msg.payload)
+        except CodecError as e:
+            print(f"Dropping malformed payload on {msg.topic}: {e}")
+            return None
+
+    async def control(self, topic, message):
+        """Update state and run the control rules; sequential on the event loop."""
+        if topic == TEMP_TOPIC:
+            self.current_temp = message.value
+        elif topic == HUMIDITY_TOPIC:
+            self.current_humidity = message.value
+            return
+        elif topic == SETPOINT_TOPIC:
+            self.setpoint = message.value
+        elif topic == STATUS_TOPIC:
+            self.ac_status = message.state == "on"
+            self.confirmed_ac_status = self.ac_status
+            self.handle_command_ack(message)
+            return
+
+        if self.current_temp is None or self.setpoint is None:
+            return
+        action, emergency, alert = decide_ac_action(
+            float(self.current_temp), float(self.setpoint), self.ac_status, self.params)
+        if alert:
+            await self.alarm(f"High temperature alert: {self.current_temp}°C")
+        if action != ACTION_NONE:
+            await self.send_command(action)
+        if emergency:
+            await self.alarm(f"EMERGENCY: Force turning AC ON due to very high temperature: {self.current_temp}°C")
+            await self.send_command("on")
+
+    def handle_command_ack(self, message):
+        """Match a relay status message with the command it confirms"""
+        relay_id = message.relay_id or "unknown"
+        if not message.command_id:
+            return
+        ack = self.commands.acknowledge(message.command_id, relay_id)
+        if ack is not None:
+            command, latency = ack
+            print(f"Command '{command}' acknowledged by {relay_id} in {latency * 1000:.0f} ms")
+
+    async def check_pending_commands(self):
+        """Retry unacknowledged AC commands and give up after the retry limit"""
+        while True:
+            await asyncio.sleep(COMMAND_CHECK_INTERVAL)
+            retries, failures = self.commands.check_timeouts()
+            for entry in retries:
+                print(f"No ack for '{entry.command}' ({entry.command_id}), retry {entry.attempts - 1}")
+                await self.send_command(entry.command, entry.command_id)
+            for entry in failures:
+                await self.alarm(f"AC command '{entry.command}' not acknowledged after {entry.attempts} attempts")
+                # Fall back to the last state the relay actually reported
+                if self.confirmed_ac_status is not None:
+                    self.ac_status = self.confirmed_ac_status
+
+    async def send_command(self, command, command_id=None):
+        if command_id is None:
+            command_id = self.commands.register(command)
+            self.ac_status = command == "on"
+        payload = ControlMessage(command=command, command_id=command_id, timestamp=format_timestamp()).encode()
+        await self.outgoing.put((CONTROL_TOPIC, payload))
+        await self.alarm(f"Sent AC command: {command}")
+
+    async def alarm(self, message):
+        print(f"ALARM: {message}")
+        await self.persist("insert_alarm", message)
+        payload = AlarmMessage(message=message, timestamp=format_timestamp()).encode()
+        await self.outgoing.put((ALARM_TOPIC, payload))
+
+    async def persist(self, method, *args):
+        """Queue a database call; waits while the queue is full."""
+        await self.writes.put((method, args))
+
+    async def persist_worker(self):
+        while True:
+            method, args = await self.writes.get()
+            try:
+                await asyncio.to_thread(getattr(self.db, method), *args)
+            except Exception as e:
+                print(f"Database write error: {e}")
+            finally:
+                self.writes.task_done()
+
+    async def publish_worker(self):
+        """Publish queued commands and alarms in order, each waiting for its PUBACK."""
+        while True:
+            topic, payload = await self.outgoing.get()
+            try:
+                await self.client.publish(topic, payload, qos=1)
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                print(f"Publish on {topic} failed: {e}")
+            finally:
+                self.outgoing.task_done()
+
+
+async def main(persist_workers, queue_size):
+    db = open_storage()
+    try:
+        async with AsyncMqttClient(make_client_id("async_manager"), USERNAME, PASSWORD) as client:
+            await client.connect(BROKER_IP, BROKER_PORT)
+            await AsyncIngestPipeline(client, db, persist_workers=persist_workers, queue_size=queue_size).run()
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless asyncio data manager")
+    parser.add_argument("--persist-workers", type=int, default=2,
+                        help="Database writer tasks")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="Queued writes and publishes before ingest waits")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.persist_workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,188 @@
+"""
+Online backups of the Smart AC SQLite store.
+
+BackupScheduler copies the live database with SQLite's online backup API
+from a background thread, a limited number of pages per step. Each step
+runs under Database.lock on the writer's own connection, so rows written
+between steps are carried into the copy (no restart), and a writer never
+waits longer than one step. The copy is checked with PRAGMA
+integrity_check before it replaces the partial file, and only the newest
+`keep` snapshots are kept:
+
+    backups/ac_control-20261019_101500_250.db
+
+Duration, longest writer stall and failures are exported as metrics and
+reported through the log callback.
+
+Usage (one-off backup):
+    python data_manager/backup.py --db ac_control.db --out backups
+"""
+
+import os
+import sys
+import glob
+import time
+import sqlite3
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import REGISTRY
+
+BACKUP_SECONDS = REGISTRY.histogram("backup_duration_seconds", "Time to take and verify one backup",
+                                    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+BACKUP_STEP_SECONDS = REGISTRY.histogram("backup_step_seconds",
+                                         "Database.lock hold time per backup step (writer stall)")
+BACKUP_FAILURES = REGISTRY.counter("backup_failures_total", "Backups that failed or did not verify")
+BACKUP_LAST_SUCCESS = REGISTRY.gauge("backup_last_success_timestamp_seconds", "Unix time of the last good backup")
+BACKUP_SIZE = REGISTRY.gauge("backup_size_bytes", "Size of the last good backup")
+
+# Pages copied per step (4 KiB pages: 256 KiB under the lock at a time)
+DEFAULT_PAGES = 64
+# Pause between steps, with the lock released (seconds)
+DEFAULT_STEP_SLEEP = 0.005
+
+
+class BackupScheduler:
+    """Periodic paged backups of a Database on a daemon thread."""
+
+    def __init__(self, db, backup_dir="backups", interval=3600, keep=5, pages=DEFAULT_PAGES,
+                 step_sleep=DEFAULT_STEP_SLEEP, log=print):
+        if getattr(db, "name", None) != "sqlite":
+            # Other backends keep readings outside the SQLite file; a copy of it would have none
+            raise ValueError(f"Online backups need the sqlite storage backend, not '{getattr(db, 'name', db)}'")
+        self.db = db
+        self.backup_dir = backup_dir
+        self.interval = interval
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.log = log
+        self.stop_event = threading.Event()
+        self.run_lock = threading.Lock()
+        self.thread = None
+        base = os.path.splitext(os.path.basename(db.db_file))[0]
+        self.prefix = os.path.join(backup_dir, base + "-")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="db-backup", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.run_now()
+
+    def run_now(self):
+        """Take, verify and rotate one backup; returns its path or None on failure."""
+        with self.run_lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            path = self.snapshot_path()
+            partial = path + ".partial"
+            start = time.perf_counter()
+            try:
+                steps, longest = self.copy(partial)
+                verdict = self.verify(partial)
+                if verdict != "ok":
+                    raise sqlite3.DatabaseError(f"integrity check failed: {verdict}")
+                os.replace(partial, path)
+            except (sqlite3.Error, OSError) as e:
+                BACKUP_FAILURES.inc()
+                if os.path.exists(partial):
+                    os.remove(partial)
+                self.log(f"Backup failed: {e}")
+                return None
+
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(path)
+            BACKUP_SECONDS.observe(elapsed)
+            BACKUP_LAST_SUCCESS.set(time.time())
+            BACKUP_SIZE.set(size)
+            removed = self.rotate()
+            self.log(f"Backup {os.path.basename(path)}: {size / 1e6:.1f} MB in {elapsed:.2f}s, "
+                     f"{steps} steps, longest writer stall {longest * 1000:.1f} ms, integrity ok"
+                     + (f", removed {removed} old" if removed else ""))
+            return path
+
+    def snapshot_path(self):
+        """Timestamped (ms) snapshot name; a counter suffix keeps same-millisecond backups apart."""
+        now = time.time()
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        path = self.prefix + stamp + ".db"
+        count = 1
+        while os.path.exists(path):
+            # "_" sorts after ".", so rotation still sees the suffixed copy as newer
+            path = f"{self.prefix}{stamp}_{count}.db"
+            count += 1
+        return path
+
+    def copy(self, target_path):
+        """
+        Paged copy under Database.lock, released between steps.
+        Returns (steps, longest lock hold in seconds).
+        """
+        lock = self.db.lock
+        stats = {"steps": 0, "longest": 0.0, "held_since": 0.0}
+
+        def between_steps(status, remaining, total):
+            held = time.perf_counter() - stats["held_since"]
+            BACKUP_STEP_SECONDS.observe(held)
+            stats["steps"] += 1
+            stats["longest"] = max(stats["longest"], held)
+            lock.release()
+            time.sleep(self.step_sleep)
+            lock.acquire()
+            stats["held_since"] = time.perf_counter()
+
+        target = sqlite3.connect(target_path)
+        try:
+            with lock:
+                stats["held_since"] = time.perf_counter()
+                self.db.conn.backup(target, pages=self.pages, progress=between_steps)
+                held = time.perf_counter() - stats["held_since"]
+            stats["longest"] = max(stats["longest"], held)
+            # The copy inherits WAL mode; store it as a single self-contained file
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+        return stats["steps"], stats["longest"]
+
+    @staticmethod
+    def verify(path):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return "; ".join(row[0] for row in conn.execute("PRAGMA integrity_check"))
+        finally:
+            conn.close()
+
+    def rotate(self):
+        """Delete all but the newest `keep` snapshots; returns how many were removed."""
+        snapshots = sorted(glob.glob(glob.escape(self.prefix) + "*.db"))
+        old = snapshots[:-self.keep] if self.keep > 0 else []
+        for path in old:
+            os.remove(path)
+        return len(old)
+
+
+if __name__ == '__main__':
+    from data_manager.db import Database
+
+    parser = argparse.ArgumentParser(description="Online backup of the Smart AC database")
+    parser.add_argument("--db", default=os.environ.get("DB_FILE", "ac_control.db"), help="SQLite database file")
+    parser.add_argument("--out", default="backups", help="backup directory")
+    parser.add_argument("--keep", type=int, default=5, help="snapshots to keep")
+    # A paged copy restarts whenever another process writes, so copy in one step by default
+    parser.add_argument("--pages", type=int, default=-1, help="pages copied per step (-1 = all at once)")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        path = BackupScheduler(db, args.out, keep=args.keep, pages=args.pages).run_now()
+    finally:
+        db.close()
+    sys.exit(0 if path else 1)
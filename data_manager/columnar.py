@@ -0,0 +1,493 @@
+"""
+Memory-mapped columnar time-series store for Smart AC readings.
+
+Each device gets a directory of fixed-size segments. A segment keeps one
+raw file per column, opened as a NumPy memmap:
+
+    ts           int64    epoch microseconds
+    temperature  float32  NaN when missing
+    humidity     float32
+    setpoint     float32
+    ac_status    uint8    0/1, 255 when missing
+
+plus index.json listing each segment's row count, time range and whether
+it is time-ordered. Range queries pick segments from the index and return
+memmap views, so aggregations run vectorized over the mapped pages without
+copying rows out first. ColumnarDatabase keeps the Database API and puts
+readings in the store while alarms stay in SQLite.
+
+Usage (benchmark against the SQLite readings table):
+    python data_manager/columnar.py --rows 2000000
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.db import Database, DB_WRITE_SECONDS, DB_ROWS_WRITTEN
+
+COLUMNS = {
+    "ts": np.dtype("<i8"),
+    "temperature": np.dtype("<f4"),
+    "humidity": np.dtype("<f4"),
+    "setpoint": np.dtype("<f4"),
+    "ac_status": np.dtype("u1"),
+}
+VALUE_COLUMNS = ("temperature", "humidity", "setpoint", "ac_status")
+STATUS_UNKNOWN = 255
+# Rows per segment file (about 5 MB of columns per segment)
+SEGMENT_ROWS = 262144
+# Seconds between ColumnarDatabase flushes of the memmaps and index.json
+# (appended rows are readable at once; a crash loses at most this much)
+FLUSH_INTERVAL = 1.0
+US_PER_SECOND = 1000000
+
+
+def to_epoch_us(timestamp):
+    """ISO timestamp (naive = local time, as format_timestamp writes it) -> epoch microseconds."""
+    dt = datetime.fromisoformat(timestamp)
+    return int(dt.timestamp()) * US_PER_SECOND + dt.microsecond
+
+
+def from_epoch_us(ts_us):
+    """Epoch microseconds -> ISO timestamp in local time."""
+    ts_us = int(ts_us)
+    return datetime.fromtimestamp(ts_us // US_PER_SECOND).replace(
+        microsecond=ts_us % US_PER_SECOND).isoformat()
+
+
+def _missing(name, values):
+    if name == "ac_status":
+        return values == STATUS_UNKNOWN
+    return np.isnan(values)
+
+
+def _as_column(name, values):
+    """Convert a sequence with None for missing values to the column dtype."""
+    if isinstance(values, np.ndarray):
+        return values.astype(COLUMNS[name], copy=False)
+    missing = STATUS_UNKNOWN if name == "ac_status" else np.nan
+    return np.array([missing if v is None else v for v in values], dtype=COLUMNS[name])
+
+
+class _Segment:
+    """One segment: a memmap per column and its index entry."""
+
+    def __init__(self, directory, entry, capacity, writable):
+        self.entry = entry
+        mode = "r+" if writable else "r"
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(directory, f"{entry['id']:06d}.{name}")
+            if not os.path.exists(path):
+                np.memmap(path, dtype=dtype, mode="w+", shape=(capacity,)).flush()
+            self.columns[name] = np.memmap(path, dtype=dtype, mode=mode, shape=(capacity,))
+
+    def flush(self):
+        for column in self.columns.values():
+            if column.mode == "r+":
+                column.flush()
+
+
+class _DeviceSeries:
+    """Segments of one device plus its index file."""
+
+    def __init__(self, directory, segment_rows):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+        else:
+            index = {"segment_rows": segment_rows, "segments": []}
+        self.segment_rows = index["segment_rows"]
+        self.segments = [self.open(entry, writable=False) for entry in index["segments"][:-1]]
+        if index["segments"]:
+            self.segments.append(self.open(index["segments"][-1], writable=True))
+        self.dirty = False
+
+    def open(self, entry, writable):
+        return _Segment(self.directory, entry, self.segment_rows, writable)
+
+    def append(self, columns, count):
+        """Append count rows from the column arrays, rolling over full segments."""
+        done = 0
+        while done < count:
+            if not self.segments or self.segments[-1].entry["rows"] >= self.segment_rows:
+                if self.segments:
+                    self.seal()
+                entry = {"id": len(self.segments), "rows": 0, "t_min": None, "t_max": None, "sorted": True}
+                self.segments.append(self.open(entry, writable=True))
+            segment = self.segments[-1]
+            entry = segment.entry
+            start = entry["rows"]
+            take = min(count - done, self.segment_rows - start)
+            for name, values in columns.items():
+                segment.columns[name][start:start + take] = values[done:done + take]
+
+            ts = columns["ts"][done:done + take]
+            t_min, t_max = int(ts.min()), int(ts.max())
+            ordered = bool(take < 2 or np.all(ts[1:] >= ts[:-1]))
+            if entry["t_max"] is not None and ts[0] < entry["t_max"]:
+                ordered = False
+            entry["sorted"] = entry["sorted"] and ordered
+            entry["t_min"] = t_min if entry["t_min"] is None else min(entry["t_min"], t_min)
+            entry["t_max"] = t_max if entry["t_max"] is None else max(entry["t_max"], t_max)
+            entry["rows"] = start + take
+            done += take
+        self.dirty = True
+
+    def seal(self):
+        """Flush the full last segment, record it in the index and reopen it read-only."""
+        segment = self.segments[-1]
+        segment.flush()
+        self.dirty = True
+        self.write_index()
+        self.segments[-1] = self.open(segment.entry, writable=False)
+
+    def write_index(self):
+        if not self.dirty:
+            return
+        index = {"segment_rows": self.segment_rows,
+                 "segments": [segment.entry for segment in self.segments]}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
+
+    def flush(self):
+        if not self.dirty:
+            return
+        if self.segments:
+            self.segments[-1].flush()
+        self.write_index()
+
+
+class ColumnarStore:
+    """
+    Append-only per-device column segments with range queries and vectorized aggregation.
+    Appends are serialized by a lock; readers get views of committed rows.
+    """
+
+    def __init__(self, base_dir="columnar", segment_rows=SEGMENT_ROWS):
+        self.base_dir = base_dir
+        self.segment_rows = segment_rows
+        self.series = {}
+        self.lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    @staticmethod
+    def _dirname(device):
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", device) or "_"
+
+    def devices(self):
+        return sorted(name for name in os.listdir(self.base_dir)
+                      if os.path.exists(os.path.join(self.base_dir, name, "index.json")))
+
+    def _series(self, device):
+        series = self.series.get(device)
+        if series is None:
+            series = _DeviceSeries(os.path.join(self.base_dir, self._dirname(device)), self.segment_rows)
+            self.series[device] = series
+        return series
+
+    def append(self, device, ts_us, temperature=None, humidity=None, setpoint=None, ac_status=None):
+        """Append one row; None values are stored as missing."""
+        self.append_many(device, [ts_us], [temperature], [humidity], [setpoint], [ac_status])
+
+    def append_many(self, device, ts_us, temperature, humidity, setpoint, ac_status):
+        """Append equally long sequences (None or NaN = missing); returns the row count."""
+        count = len(ts_us)
+        if count == 0:
+            return 0
+        columns = {"ts": np.asarray(ts_us, dtype=COLUMNS["ts"])}
+        for name, values in zip(VALUE_COLUMNS, (temperature, humidity, setpoint, ac_status)):
+            columns[name] = _as_column(name, values)
+            if len(columns[name]) != count:
+                raise ValueError(f"Column {name} has {len(columns[name])} values, expected {count}")
+        with self.lock:
+            self._series(device).append(columns, count)
+        return count
+
+    def flush(self):
+        """Persist the index so appended rows survive a restart."""
+        with self.lock:
+            for series in self.series.values():
+                series.flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.series = {}
+
+    def scan(self, device, start=None, end=None, columns=COLUMNS):
+        """
+        Yield {column: array} per segment overlapping [start, end) (epoch us).
+        Time-ordered segments yield zero-copy views; unordered ones a filtered copy.
+        """
+        with self.lock:
+            segments = [(segment, dict(segment.entry)) for segment in self._series(device).segments]
+        for segment, entry in segments:
+            rows = entry["rows"]
+            if not rows:
+                continue
+            if (start is not None and entry["t_max"] < start) or (end is not None and entry["t_min"] >= end):
+                continue
+            ts = segment.columns["ts"][:rows]
+            if start is None and end is None:
+                yield {name: segment.columns[name][:rows] for name in columns}
+            elif entry["sorted"]:
+                lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+                hi = rows if end is None else int(np.searchsorted(ts, end, "left"))
+                if hi > lo:
+                    yield {name: segment.columns[name][lo:hi] for name in columns}
+            else:
+                mask = np.ones(rows, dtype=bool)
+                if start is not None:
+                    mask &= ts >= start
+                if end is not None:
+                    mask &= ts < end
+                if mask.any():
+                    yield {name: segment.columns[name][:rows][mask] for name in columns}
+
+    def aggregate(self, device, name, start=None, end=None):
+        """count / mean / min / max of one column over [start, end), skipping missing values."""
+        count, total = 0, 0.0
+        low, high = np.inf, -np.inf
+        for chunk in self.scan(device, start, end, (name,)):
+            values = chunk[name]
+            if name == "ac_status":
+                values = values[values != STATUS_UNKNOWN]
+            present = values.size if name == "ac_status" else values.size - int(np.count_nonzero(np.isnan(values)))
+            if not present:
+                continue
+            count += present
+            total += float(np.nansum(values, dtype=np.float64))
+            low = min(low, float(np.nanmin(values)))
+            high = max(high, float(np.nanmax(values)))
+        if not count:
+            return {"count": 0, "mean": None, "min": None, "max": None}
+        return {"count": count, "mean": total / count, "min": low, "max": high}
+
+    def resample(self, device, name, bucket_seconds, start, end):
+        """
+        Fixed-width buckets over [start, end) epoch us.
+        Returns (bucket start us, count, mean, min, max) arrays; empty buckets are NaN.
+        """
+        bucket = int(bucket_seconds * US_PER_SECOND)
+        n = max(0, -(-(end - start) // bucket))
+        counts = np.zeros(n, dtype=np.int64)
+        sums = np.zeros(n, dtype=np.float64)
+        lows = np.full(n, np.inf)
+        highs = np.full(n, -np.inf)
+        for chunk in self.scan(device, start, end, ("ts", name)):
+            values = chunk[name]
+            keep = ~_missing(name, values)
+            slots = (chunk["ts"][keep] - start) // bucket
+            values = values[keep].astype(np.float64)
+            counts += np.bincount(slots, minlength=n)
+            sums += np.bincount(slots, weights=values, minlength=n)
+            np.minimum.at(lows, slots, values)
+            np.maximum.at(highs, slots, values)
+        empty = counts == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(empty, np.nan, sums / counts)
+        lows[empty] = np.nan
+        highs[empty] = np.nan
+        return start + np.arange(n, dtype=np.int64) * bucket, counts, means, lows, highs
+
+    def tail(self, device, limit):
+        """The newest limit rows by insertion order, as {column: array} copies, newest first."""
+        with self.lock:
+            segments = [(segment, segment.entry["rows"]) for segment in self._series(device).segments]
+        parts = []
+        for segment, rows in reversed(segments):
+            if limit <= 0:
+                break
+            take = min(limit, rows)
+            parts.append({name: segment.columns[name][rows - take:rows][::-1] for name in COLUMNS})
+            limit -= take
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def rows(self, device, start, stop=None):
+        """Rows at insertion positions [start, stop), as {column: array} copies, oldest first."""
+        with self.lock:
+            segments = [(segment, segment.entry["rows"]) for segment in self._series(device).segments]
+        parts = []
+        offset = 0
+        for segment, rows in segments:
+            lo, hi = max(start - offset, 0), rows if stop is None else min(stop - offset, rows)
+            if hi > lo:
+                parts.append({name: np.array(segment.columns[name][lo:hi]) for name in COLUMNS})
+            offset += rows
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+class ColumnarDatabase(Database):
+    """
+    Database API with readings kept in a ColumnarStore.
+    Alarms (free text) stay in the SQLite file; readings go to one device series.
+    A reading's id is its 1-based insertion position in that series.
+    """
+
+    name = "columnar"
+
+    def __init__(self, db_file="ac_control.db", columnar_dir="columnar", device="home",
+                 flush_interval=FLUSH_INTERVAL):
+        super().__init__(db_file)
+        self.store = ColumnarStore(columnar_dir)
+        self.device = device
+        # Inserts only append to the memmaps; this thread persists them
+        self.flush_interval = flush_interval
+        self.stop_event = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, name="columnar-flush", daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.store.flush()
+            except OSError as e:
+                print(f"Columnar flush error: {e}")
+
+    def insert_reading(self, temperature=None, humidity=None, setpoint=None, ac_status=None):
+        """Insert a new sensor reading stamped with the current time."""
+        self.insert_readings([(datetime.now().isoformat(), temperature, humidity, setpoint, ac_status)])
+
+    def insert_readings(self, rows):
+        """Bulk insert (timestamp, temperature, humidity, setpoint, ac_status) rows."""
+        rows = list(rows)
+        if not rows:
+            return
+        start = time.perf_counter()
+        timestamps, temperature, humidity, setpoint, ac_status = zip(*rows)
+        count = self.store.append_many(self.device, [to_epoch_us(ts) for ts in timestamps],
+                                       temperature, humidity, setpoint, ac_status)
+        DB_WRITE_SECONDS.labels("insert_readings").observe(time.perf_counter() - start)
+        DB_ROWS_WRITTEN.labels("readings").inc(count)
+
+    @staticmethod
+    def _rows(columns):
+        """Column arrays -> (timestamp, temperature, humidity, setpoint, ac_status) rows."""
+        def value(v):
+            # str() gives the shortest decimal that round-trips the float32: 22.3, not 22.299999237
+            return None if np.isnan(v) else float(str(v))
+
+        return [(from_epoch_us(ts), value(t), value(h), value(s), None if a == STATUS_UNKNOWN else int(a))
+                for ts, t, h, s, a in zip(columns["ts"], columns["temperature"], columns["humidity"],
+                                          columns["setpoint"], columns["ac_status"])]
+
+    def get_recent_readings(self, limit=100):
+        """Most recent readings, newest first."""
+        return self._rows(self.store.tail(self.device, limit))
+
+    def get_readings_between(self, start, end):
+        """Readings with start <= timestamp < end (ISO strings), oldest first."""
+        rows = []
+        for chunk in self.store.scan(self.device, to_epoch_us(start), to_epoch_us(end)):
+            rows.extend(self._rows(chunk))
+        return sorted(rows, key=lambda row: row[0])
+
+    def get_readings_since(self, after_id, limit=None):
+        """Readings with id > after_id (id appended to each row), oldest first."""
+        stop = None if limit is None else after_id + max(limit, 0)
+        rows = self._rows(self.store.rows(self.device, after_id, stop))
+        return [row + (after_id + i + 1,) for i, row in enumerate(rows)]
+
+    def close(self):
+        self.stop_event.set()
+        self.flusher.join()
+        self.store.close()
+        super().close()
+
+
+def benchmark(rows, interval=5.0):
+    """Load the same synthetic history into SQLite and the columnar store and time range queries."""
+    with tempfile.TemporaryDirectory(prefix="columnar_bench_") as workdir:
+        return _run_benchmark(workdir, rows, interval)
+
+
+def _run_benchmark(workdir, rows, interval):
+    rng = np.random.default_rng(1)
+    end_us = int(time.time()) * US_PER_SECOND
+    ts = end_us - (np.arange(rows, dtype=np.int64)[::-1] * int(interval * US_PER_SECOND))
+    temperature = (24 + 4 * np.sin(np.arange(rows) / 2000) + rng.normal(0, 0.3, rows)).astype(np.float32)
+    humidity = rng.uniform(40, 60, rows).astype(np.float32)
+    setpoint = np.full(rows, 22.0, dtype=np.float32)
+    status = (temperature > 24).astype(np.uint8)
+
+    db = Database(os.path.join(workdir, "bench.db"))
+    start = time.perf_counter()
+    timestamps = [from_epoch_us(t) for t in ts]
+    with db.lock:
+        db.db_executor.executemany(
+            "INSERT INTO readings (timestamp, temperature, humidity, setpoint, ac_status) VALUES (?, ?, ?, ?, ?)",
+            zip(timestamps, temperature.tolist(), humidity.tolist(), setpoint.tolist(), status.tolist()))
+        db.conn.commit()
+    sqlite_load = time.perf_counter() - start
+
+    store = ColumnarStore(os.path.join(workdir, "columnar"))
+    start = time.perf_counter()
+    store.append_many("home", ts, temperature, humidity, setpoint, status)
+    store.flush()
+    columnar_load = time.perf_counter() - start
+
+    # Last 30 days, mean/min/max temperature and a daily resample
+    range_start = end_us - 30 * 86400 * US_PER_SECOND
+    iso_start = from_epoch_us(range_start)
+    timings = {}
+
+    start = time.perf_counter()
+    with db.lock:
+        db.db_executor.execute("SELECT COUNT(temperature), AVG(temperature), MIN(temperature), MAX(temperature) "
+                               "FROM readings WHERE timestamp >= ?", (iso_start,))
+        sqlite_result = db.db_executor.fetchone()
+    timings["sqlite aggregate 30d"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columnar_result = store.aggregate("home", "temperature", range_start, end_us + 1)
+    timings["columnar aggregate 30d"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with db.lock:
+        db.db_executor.execute("SELECT substr(timestamp, 1, 10), AVG(temperature) FROM readings "
+                               "GROUP BY substr(timestamp, 1, 10)")
+        sqlite_days = db.db_executor.fetchall()
+    timings["sqlite daily means, all"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columnar_days = store.resample("home", "temperature", 86400, int(ts[0]), end_us + 1)
+    timings["columnar daily means, all"] = time.perf_counter() - start
+
+    print(f"{rows} rows: load sqlite {sqlite_load:.2f}s, columnar {columnar_load:.2f}s")
+    print(f"sqlite 30d: {sqlite_result[0]} rows, mean {sqlite_result[1]:.3f}")
+    print(f"columnar 30d: {columnar_result['count']} rows, mean {columnar_result['mean']:.3f}")
+    print(f"daily buckets: sqlite {len(sqlite_days)}, columnar {int(np.count_nonzero(columnar_days[1]))}")
+    for name, seconds in timings.items():
+        print(f"  {name:<28}{seconds * 1000:10.1f} ms")
+    db.close()
+    store.close()
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Columnar store vs SQLite readings benchmark")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between synthetic readings")
+    args = parser.parse_args()
+    benchmark(args.rows, args.interval)
@@ -0,0 +1,138 @@
+import time
+import uuid
+import bisect
+import threading
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram.
+    Bucket bounds are upper limits in milliseconds; the last bucket
+    catches everything slower.
+    """
+
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value_ms):
+        self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def percentile(self, q):
+        """Approximate percentile (0-100) as the upper bound of its bucket."""
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class PendingCommand:
+    """An AC command waiting for the relay to acknowledge it."""
+
+    __slots__ = ("command_id", "command", "first_sent", "sent_at", "attempts")
+
+    def __init__(self, command_id, command, now):
+        self.command_id = command_id
+        self.command = command
+        self.first_sent = now
+        self.sent_at = now
+        self.attempts = 1
+
+
+class CommandTracker:
+    """
+    Correlates AC commands with relay status acknowledgements.
+    Keeps the pending-command table, decides on retries and timeouts
+    and records command-to-ack latency per relay.
+    Thread-safe: acks arrive on the MQTT thread, timeouts on the UI timer.
+    """
+
+    def __init__(self, timeout=3.0, max_retries=2):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pending = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def register(self, command, now=None):
+        """Create a pending entry for a new command and return its correlation id."""
+        now = time.monotonic() if now is None else now
+        command_id = uuid.uuid4().hex
+        with self.lock:
+            # A newer command supersedes anything still in flight
+            self.pending.clear()
+            self.pending[command_id] = PendingCommand(command_id, command, now)
+        return command_id
+
+    def acknowledge(self, command_id, device_id, now=None):
+        """
+        Match a status message to its command.
+        Returns the (command, latency in seconds) or None if the id is unknown.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.pending.pop(command_id, None)
+            if entry is None:
+                return None
+            latency = now - entry.first_sent
+            histogram = self.histograms.get(device_id)
+            if histogram is None:
+                histogram = self.histograms[device_id] = LatencyHistogram()
+            histogram.observe(latency * 1000.0)
+        return entry.command, latency
+
+    def check_timeouts(self, now=None):
+        """
+        Return (retries, failures): commands to publish again and commands
+        that exhausted their retries and were dropped.
+        """
+        now = time.monotonic() if now is None else now
+        retries, failures = [], []
+        with self.lock:
+            for command_id, entry in list(self.pending.items()):
+                if now - entry.sent_at < self.timeout:
+                    continue
+                if entry.attempts > self.max_retries:
+                    del self.pending[command_id]
+                    failures.append(entry)
+                else:
+                    entry.attempts += 1
+                    entry.sent_at = now
+                    retries.append(entry)
+        return retries, failures
+
+    def latency_summary(self, device_id=None):
+        """Latency summary for one relay, or for all relays keyed by id."""
+        with self.lock:
+            if device_id is not None:
+                histogram = self.histograms.get(device_id)
+                return histogram.summary() if histogram else {"count": 0}
+            return {device: h.summary() for device, h in self.histograms.items()}
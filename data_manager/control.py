@@ -0,0 +1,66 @@
+"""
+AC control decision logic for Smart AC Control System.
+Kept free of MQTT and Qt so the same rules drive the live manager
+and the historical replay engine.
+"""
+
+# Control actions
+ACTION_NONE = "none"
+ACTION_ON = "on"
+ACTION_OFF = "off"
+
+
+class ControlParams:
+    """Thresholds used by the automatic AC control logic."""
+
+    def __init__(self, on_delta=5.0, off_delta=-1.0, alert_temp=30.0, emergency_temp=35.0):
+        self.on_delta = float(on_delta)            # Turn ON when this far above setpoint
+        self.off_delta = float(off_delta)          # Turn OFF when this far below setpoint
+        self.alert_temp = float(alert_temp)        # High temperature alert
+        self.emergency_temp = float(emergency_temp)  # Force AC ON regardless of setpoint
+
+    @classmethod
+    def parse(cls, text):
+        """Build parameters from 'on_delta,off_delta,alert_temp,emergency_temp'."""
+        values = [float(part) for part in text.split(",")]
+        return cls(*values)
+
+    def __repr__(self):
+        return (f"ControlParams(on={self.on_delta:+g}, off={self.off_delta:+g}, "
+                f"alert={self.alert_temp:g}, emergency={self.emergency_temp:g})")
+
+
+def decide_ac_action(temperature, setpoint, ac_status, params):
+    """
+    Evaluate the hysteresis control rules for one temperature reading.
+
+    Returns (action, emergency, alert):
+    action is ACTION_ON, ACTION_OFF or ACTION_NONE from the hysteresis band,
+    emergency is True when the AC must additionally be forced ON,
+    alert is True when the high temperature alert threshold is reached.
+    """
+    alert = temperature >= params.alert_temp
+    difference = temperature - setpoint
+
+    action = ACTION_NONE
+    if difference >= params.on_delta and not ac_status:
+        action = ACTION_ON
+        ac_status = True
+    elif difference <= params.off_delta and ac_status:
+        action = ACTION_OFF
+        ac_status = False
+
+    emergency = temperature >= params.emergency_temp and not ac_status
+    return action, emergency, alert
+
+
+def step_ac_status(temperature, setpoint, ac_status, params):
+    """
+    Vectorized form of decide_ac_action for NumPy arrays of rooms.
+    Returns the new boolean AC status array.
+    """
+    difference = temperature - setpoint
+    turn_on = (difference >= params.on_delta) & ~ac_status
+    turn_off = (difference <= params.off_delta) & ac_status
+    new_status = (ac_status | turn_on) & ~turn_off
+    return new_status | (temperature >= params.emergency_temp)
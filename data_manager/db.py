@@ -1,21 +1,46 @@
 import sqlite3
-import threading
+import time
 from datetime import datetime
 
-class Database:
+from metrics import REGISTRY, InstrumentedLock
+from data_manager.storage import Storage, HotCache
+
+DB_LOCK_WAIT = REGISTRY.histogram("db_lock_wait_seconds", "Time spent waiting for Database.lock")
+DB_WRITE_SECONDS = REGISTRY.histogram("db_write_seconds", "Database insert time including commit",
+                                      ("operation",))
+DB_COMMIT_SECONDS = REGISTRY.histogram("db_commit_seconds", "Database commit time")
+DB_ROWS_WRITTEN = REGISTRY.counter("db_rows_written_total", "Rows inserted", ("table",))
+DB_CACHE_READS = REGISTRY.counter("db_cache_reads_total", "Recent/incremental reads by table and result",
+                                  ("table", "result"))
+
+# Newest readings and alarms kept in memory for dashboard reads
+CACHE_ROWS = 1000
+
+class Database(Storage):
     """
     Database handler for Smart AC Control System.
     Stores temperature, humidity, setpoint readings and alarm messages.
     Thread-safe operations with locking mechanism.
+
+    The newest cache_rows readings and alarms are also kept in memory and
+    extended by the insert methods, so recent and incremental reads are
+    answered without SQLite. This assumes this object is the only writer
+    of the file, as the manager is.
     """
+
+    name = "sqlite"
     
-    def __init__(self, db_file="ac_control.db"):
+    def __init__(self, db_file="ac_control.db", cache_rows=CACHE_ROWS):
         """Initialize database connection and create tables if they don't exist."""
         self.db_file = db_file
-        self.lock = threading.Lock()
+        self.lock = InstrumentedLock(DB_LOCK_WAIT)
+        self.reading_cache = HotCache(cache_rows)
+        self.alarm_cache = HotCache(cache_rows)
         
         with self.lock:
             self.conn = sqlite3.connect(db_file, check_same_thread=False)
+            # WAL lets readers on other connections (export, dashboards) run alongside commits
+            self.conn.execute("PRAGMA journal_mode=WAL")
             self.db_executor = self.conn.cursor()
             
             # Create readings table if it doesn't exist
@@ -40,12 +65,22 @@ class Database:
             ''')
             
             self.conn.commit()
+
+            # Warm the caches with the newest rows
+            self.db_executor.execute(
+                "SELECT timestamp, temperature, humidity, setpoint, ac_status, id "
+                "FROM readings ORDER BY id DESC LIMIT ?", (cache_rows,))
+            self.reading_cache.extend(reversed(self.db_executor.fetchall()))
+            self.db_executor.execute(
+                "SELECT timestamp, message, id FROM alarms ORDER BY id DESC LIMIT ?", (cache_rows,))
+            self.alarm_cache.extend(reversed(self.db_executor.fetchall()))
     
     def insert_reading(self, temperature=None, humidity=None, setpoint=None, ac_status=None):
         """Insert a new sensor reading into the database."""
         timestamp = datetime.now().isoformat()
         
         with self.lock:
+            start = time.perf_counter()
             self.db_executor.execute(
                 """
                 INSERT INTO readings (timestamp, temperature, humidity, setpoint, ac_status)
@@ -53,13 +88,43 @@ class Database:
                 """,
                 (timestamp, temperature, humidity, setpoint, ac_status)
             )
-            self.conn.commit()
+            self._commit()
+            self.reading_cache.extend([(timestamp, temperature, humidity, setpoint, ac_status,
+                                        self.db_executor.lastrowid)])
+            DB_WRITE_SECONDS.labels("insert_reading").observe(time.perf_counter() - start)
+        DB_ROWS_WRITTEN.labels("readings").inc()
     
+    def insert_readings(self, rows):
+        """
+        Bulk insert readings that carry their own timestamps.
+        rows: iterable of (timestamp, temperature, humidity, setpoint, ac_status).
+        Used for late, buffered samples; one transaction for the whole batch.
+        """
+        rows = [tuple(row) for row in rows]
+        with self.lock:
+            start = time.perf_counter()
+            self.db_executor.executemany(
+                """
+                INSERT INTO readings (timestamp, temperature, humidity, setpoint, ac_status)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            count = self.db_executor.rowcount
+            self._commit()
+            # One transaction on the only writing connection: the ids are consecutive
+            last_id = self.db_executor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            first_id = last_id - len(rows) + 1
+            self.reading_cache.extend(row + (first_id + i,) for i, row in enumerate(rows))
+            DB_WRITE_SECONDS.labels("insert_readings").observe(time.perf_counter() - start)
+        DB_ROWS_WRITTEN.labels("readings").inc(max(count, 0))
+
     def insert_alarm(self, message):
         """Insert a new alarm message into the database."""
         timestamp = datetime.now().isoformat()
         
         with self.lock:
+            start = time.perf_counter()
             self.db_executor.execute(
                 """
                 INSERT INTO alarms (timestamp, message)
@@ -67,10 +132,23 @@ class Database:
                 """,
                 (timestamp, message)
             )
-            self.conn.commit()
+            self._commit()
+            self.alarm_cache.extend([(timestamp, message, self.db_executor.lastrowid)])
+            DB_WRITE_SECONDS.labels("insert_alarm").observe(time.perf_counter() - start)
+        DB_ROWS_WRITTEN.labels("alarms").inc()
     
+    def _commit(self):
+        """Commit the current transaction; caller holds the lock."""
+        start = time.perf_counter()
+        self.conn.commit()
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+
     def get_recent_readings(self, limit=100):
-        """Get most recent readings from the database."""
+        """Get most recent readings, from the cache when it holds enough rows."""
+        cached = self.reading_cache.newest(limit)
+        DB_CACHE_READS.labels("readings", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return [row[:5] for row in cached]
         with self.lock:
             self.db_executor.execute(
                 """
@@ -84,7 +162,11 @@ class Database:
             return self.db_executor.fetchall()
     
     def get_recent_alarms(self, limit=100):
-        """Get most recent alarms from the database."""
+        """Get most recent alarms, from the cache when it holds enough rows."""
+        cached = self.alarm_cache.newest(limit)
+        DB_CACHE_READS.labels("alarms", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return cached
         with self.lock:
             self.db_executor.execute(
                 """
@@ -97,6 +179,72 @@ class Database:
             )
             return self.db_executor.fetchall()
     
+    def get_readings_between(self, start, end):
+        """Readings with start <= timestamp < end (ISO strings), oldest first."""
+        with self.lock:
+            self.db_executor.execute(
+                """
+                SELECT timestamp, temperature, humidity, setpoint, ac_status
+                FROM readings
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+                """,
+                (start, end)
+            )
+            return self.db_executor.fetchall()
+
+    def get_alarms_between(self, start, end):
+        """Alarms with start <= timestamp < end (ISO strings), oldest first."""
+        with self.lock:
+            self.db_executor.execute(
+                """
+                SELECT timestamp, message, id
+                FROM alarms
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+                """,
+                (start, end)
+            )
+            return self.db_executor.fetchall()
+    
+    def get_readings_since(self, after_id, limit=None):
+        """Readings with id > after_id (id appended to each row), oldest first."""
+        cached = self.reading_cache.since(after_id, limit)
+        DB_CACHE_READS.labels("readings", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return cached
+        with self.lock:
+            self.db_executor.execute(
+                """
+                SELECT timestamp, temperature, humidity, setpoint, ac_status, id
+                FROM readings
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (after_id, -1 if limit is None else limit)
+            )
+            return self.db_executor.fetchall()
+
+    def get_alarms_since(self, after_id, limit=None):
+        """Alarms with id > after_id, oldest first."""
+        cached = self.alarm_cache.since(after_id, limit)
+        DB_CACHE_READS.labels("alarms", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            return cached
+        with self.lock:
+            self.db_executor.execute(
+                """
+                SELECT timestamp, message, id
+                FROM alarms
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (after_id, -1 if limit is None else limit)
+            )
+            return self.db_executor.fetchall()
+
     def close(self):
         """Close the database connection."""
         with self.lock:
@@ -0,0 +1,309 @@
+"""
+Per-device AC runtime, cycle and energy accounting.
+
+EnergyAccounting follows the relay state reports on STATUS_TOPIC and
+keeps running accumulators per device and local day:
+
+    on_seconds    time the AC was reported ON
+    cycles        OFF -> ON transitions
+    short_cycles  runs shorter than short_cycle_seconds (compressor wear)
+    kwh           on-time x rated power of the device
+
+Nothing is derived from the readings table. The accumulators are written
+periodically (flush) as deltas to the energy_usage table, one row per
+device and day:
+
+    energy_usage(device, day, on_seconds, cycles, short_cycles, kwh)
+    PRIMARY KEY (device, day)
+
+A day or a month is therefore a primary key range of at most 31 rows,
+plus whatever has not been flushed yet. An ON run that spans midnight is
+split between the two days.
+
+Usage (report from the manager's database file):
+    python data_manager/energy.py --db ac_control.db --month 2026-10
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_config import CLIENT_ID_PREFIX
+from metrics import REGISTRY
+
+AC_ON_SECONDS = REGISTRY.counter("ac_on_seconds_total", "Time the AC was reported ON", ("device",))
+AC_CYCLES = REGISTRY.counter("ac_cycles_total", "AC runs started", ("device",))
+AC_SHORT_CYCLES = REGISTRY.counter("ac_short_cycles_total", "AC runs shorter than the short-cycle limit",
+                                   ("device",))
+AC_ENERGY_KWH = REGISTRY.counter("ac_energy_kwh_total", "Estimated AC energy use", ("device",))
+
+# Rated electrical power in kW (AC_RATED_KW, e.g. "1.2" or "1.2,relay_livingroom=2.0")
+DEFAULT_RATED_KW = 1.0
+# Runs shorter than this count as short cycles (AC_SHORT_CYCLE_SECONDS)
+SHORT_CYCLE_SECONDS = 300
+
+FIELDS = ("on_seconds", "cycles", "short_cycles", "kwh")
+
+
+def parse_rated_power(text, default=DEFAULT_RATED_KW):
+    """'1.2' or '1.2,relay_a=2.0,relay_b=0.9' -> (default kW, {device: kW})."""
+    per_device = {}
+    for item in (part.strip() for part in text.split(",")):
+        if not item:
+            continue
+        device, sep, value = item.rpartition("=")
+        if sep:
+            per_device[device.strip()] = float(value)
+        else:
+            default = float(value)
+    return default, per_device
+
+
+def device_key(relay_id, role="relay"):
+    """
+    Stable device name for a relay id: the client id without its prefix
+    (make_client_id ids are the same on every start):
+    smart_ac_relay_host -> relay_host
+    """
+    if not relay_id:
+        return role
+    if relay_id.startswith(CLIENT_ID_PREFIX):
+        return relay_id[len(CLIENT_ID_PREFIX):]
+    return relay_id
+
+
+def day_slices(start, end):
+    """Split [start, end) (epoch seconds) at local midnights -> [(ISO day, seconds)]."""
+    slices = []
+    while start < end:
+        day = date.fromtimestamp(start)
+        midnight = datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()
+        stop = min(end, midnight)
+        slices.append((day.isoformat(), stop - start))
+        start = stop
+    return slices
+
+
+def month_range(month):
+    """'YYYY-MM' -> (first day, first day of the next month) as ISO days."""
+    first = date.fromisoformat(month + "-01")
+    following = (first + timedelta(days=32)).replace(day=1)
+    return first.isoformat(), following.isoformat()
+
+
+class EnergyAccounting:
+    """
+    Running per-device accumulators fed by update(), flushed to energy_usage.
+    db is a Database (its connection and lock are shared); with None the
+    totals are only kept in memory.
+    """
+
+    def __init__(self, db=None, rated_kw=DEFAULT_RATED_KW, per_device_kw=None,
+                 short_cycle_seconds=SHORT_CYCLE_SECONDS):
+        self.db = db
+        self.rated_kw = rated_kw
+        self.per_device_kw = per_device_kw or {}
+        self.short_cycle_seconds = short_cycle_seconds
+        self.lock = threading.Lock()
+        # device -> {"on", "since" (accrued up to), "run_start" (None if unknown)}
+        self.states = {}
+        # (device, day) -> [on_seconds, cycles, short_cycles, kwh] not yet flushed
+        self.pending = {}
+        # Flushed totals when there is no database
+        self.totals = {}
+        if db is not None:
+            with db.lock:
+                db.db_executor.execute('''
+                    CREATE TABLE IF NOT EXISTS energy_usage (
+                        device TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        on_seconds REAL NOT NULL DEFAULT 0,
+                        cycles INTEGER NOT NULL DEFAULT 0,
+                        short_cycles INTEGER NOT NULL DEFAULT 0,
+                        kwh REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (device, day)
+                    ) WITHOUT ROWID
+                ''')
+                db.conn.commit()
+
+    def device_kw(self, device):
+        return self.per_device_kw.get(device, self.rated_kw)
+
+    def _add(self, device, day, on_seconds=0.0, cycles=0, short_cycles=0):
+        """Add to the pending accumulator; caller holds the lock."""
+        entry = self.pending.setdefault((device, day), [0.0, 0, 0, 0.0])
+        kwh = on_seconds / 3600 * self.device_kw(device)
+        entry[0] += on_seconds
+        entry[1] += cycles
+        entry[2] += short_cycles
+        entry[3] += kwh
+        if on_seconds:
+            AC_ON_SECONDS.labels(device).inc(on_seconds)
+            AC_ENERGY_KWH.labels(device).inc(kwh)
+
+    def _settle(self, device, now):
+        """Move the open ON interval up to now into the pending accumulators."""
+        state = self.states[device]
+        if state["on"] and now > state["since"]:
+            for day, seconds in day_slices(state["since"], now):
+                self._add(device, day, on_seconds=seconds)
+        state["since"] = max(state["since"], now)
+
+    def update(self, device, on, now=None):
+        """
+        Record a reported state. Returns the length of the run that just
+        ended (ON -> OFF with a known start), otherwise None. Repeated
+        reports of the same state change nothing; the first report of a
+        device only sets its state, since its start time is unknown.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            state = self.states.get(device)
+            if state is None:
+                self.states[device] = {"on": on, "since": now, "run_start": None}
+                return None
+            if state["on"] == on:
+                return None
+            self._settle(device, now)
+            state["on"] = on
+            if on:
+                state["run_start"] = now
+                self._add(device, date.fromtimestamp(now).isoformat(), cycles=1)
+                AC_CYCLES.labels(device).inc()
+                return None
+            run_start, state["run_start"] = state["run_start"], None
+            if run_start is None:
+                return None
+            run = now - run_start
+            if run < self.short_cycle_seconds:
+                self._add(device, date.fromtimestamp(now).isoformat(), short_cycles=1)
+                AC_SHORT_CYCLES.labels(device).inc()
+            return run
+
+    def flush(self, now=None):
+        """Settle running devices and write the pending deltas; returns the rows written."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for device in self.states:
+                self._settle(device, now)
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        if self.db is None:
+            for key, values in pending.items():
+                total = self.totals.setdefault(key, [0.0, 0, 0, 0.0])
+                for i, value in enumerate(values):
+                    total[i] += value
+            return len(pending)
+
+        try:
+            with self.db.lock:
+                self.db.db_executor.executemany(
+                    """
+                    INSERT INTO energy_usage (device, day, on_seconds, cycles, short_cycles, kwh)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (device, day) DO UPDATE SET
+                        on_seconds = on_seconds + excluded.on_seconds,
+                        cycles = cycles + excluded.cycles,
+                        short_cycles = short_cycles + excluded.short_cycles,
+                        kwh = kwh + excluded.kwh
+                    """,
+                    [key + tuple(values) for key, values in pending.items()]
+                )
+                self.db.conn.commit()
+        except Exception:
+            # Keep the deltas for the next flush
+            with self.lock:
+                for key, values in pending.items():
+                    entry = self.pending.setdefault(key, [0.0, 0, 0, 0.0])
+                    for i, value in enumerate(values):
+                        entry[i] += value
+            raise
+        return len(pending)
+
+    def devices(self):
+        with self.lock:
+            names = set(self.states) | {device for device, _ in self.pending} | {device for device, _ in self.totals}
+        if self.db is not None:
+            with self.db.lock:
+                self.db.db_executor.execute("SELECT DISTINCT device FROM energy_usage")
+                names.update(row[0] for row in self.db.db_executor.fetchall())
+        return sorted(names)
+
+    def usage(self, device, start_day, end_day, now=None):
+        """
+        Totals for days start_day <= day < end_day (ISO dates), including
+        unflushed time and the current run. duty_cycle is on-time over the
+        part of the period that has elapsed.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if device in self.states:
+                self._settle(device, now)
+            sums = [0.0, 0, 0, 0.0]
+            for source in (self.pending, self.totals):
+                for (name, day), values in source.items():
+                    if name == device and start_day <= day < end_day:
+                        for i, value in enumerate(values):
+                            sums[i] += value
+        if self.db is not None:
+            with self.db.lock:
+                self.db.db_executor.execute(
+                    """
+                    SELECT TOTAL(on_seconds), TOTAL(cycles), TOTAL(short_cycles), TOTAL(kwh)
+                    FROM energy_usage
+                    WHERE device = ? AND day >= ? AND day < ?
+                    """,
+                    (device, start_day, end_day)
+                )
+                stored = self.db.db_executor.fetchone()
+            for i, value in enumerate(stored):
+                sums[i] += value
+
+        period_start = datetime.fromisoformat(start_day).timestamp()
+        period_end = min(now, datetime.fromisoformat(end_day).timestamp())
+        elapsed = max(period_end - period_start, 0.0)
+        result = dict(zip(FIELDS, sums))
+        result["cycles"] = int(result["cycles"])
+        result["short_cycles"] = int(result["short_cycles"])
+        result["on_hours"] = result["on_seconds"] / 3600
+        result["duty_cycle"] = min(result["on_seconds"] / elapsed, 1.0) if elapsed else 0.0
+        return result
+
+    def day(self, device, day=None, now=None):
+        """Totals of one local day (default today)."""
+        day = date.fromisoformat(day) if day else date.fromtimestamp(time.time() if now is None else now)
+        return self.usage(device, day.isoformat(), (day + timedelta(days=1)).isoformat(), now)
+
+    def month(self, device, month=None, now=None):
+        """Totals of one month, 'YYYY-MM' (default this month)."""
+        month = month or date.fromtimestamp(time.time() if now is None else now).isoformat()[:7]
+        return self.usage(device, *month_range(month), now=now)
+
+
+if __name__ == '__main__':
+    from data_manager.db import Database
+
+    parser = argparse.ArgumentParser(description="AC runtime, cycles and energy per device")
+    parser.add_argument("--db", default=os.environ.get("DB_FILE", "ac_control.db"), help="SQLite database file")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--day", help="ISO day (default: today)")
+    group.add_argument("--month", help="YYYY-MM")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        energy = EnergyAccounting(db)
+        period = args.month or args.day or date.today().isoformat()
+        print(f"{'device':<28}{'on h':>8}{'duty':>7}{'cycles':>8}{'short':>7}{'kWh':>9}   {period}")
+        for device in energy.devices():
+            totals = energy.month(device, args.month) if args.month else energy.day(device, args.day)
+            print(f"{device:<28}{totals['on_hours']:>8.2f}{totals['duty_cycle']:>7.0%}{totals['cycles']:>8}"
+                  f"{totals['short_cycles']:>7}{totals['kwh']:>9.2f}")
+    finally:
+        db.close()
@@ -0,0 +1,218 @@
+"""
+Incremental archive export of the Smart AC SQLite store.
+
+Streams `readings` and `alarms` out of ac_control.db in id-ordered chunks
+and writes them as day-partitioned, compressed columnar files:
+
+    <out>/readings/2026-10-18/part-<first id>-<last id>.parquet
+    <out>/alarms/2026-10-18/part-<first id>-<last id>.parquet
+    <out>/manifest.json
+
+Parquet (zstd) is used when pyarrow is installed, otherwise compressed
+.npz archives with the same columns. Timestamps are stored as epoch
+microseconds.
+
+Only closed days (before today) are exported. manifest.json keeps an id
+watermark per table and the highest exported id per day, so each run
+writes only rows not exported before, and late samples for an already
+exported day land in a new part file. Each chunk is a separate short
+read-only query on its own connection; Database runs the file in WAL
+mode, so the manager's commits are not held up behind the export, and
+Database.lock is not touched.
+
+Only the SQLite file is read. With STORAGE_BACKEND=columnar the readings
+live under columnar/, so just the alarms are exported (with a warning);
+the memory backend has nothing on disk to export.
+
+Usage:
+    python data_manager/export.py --db ac_control.db --out archive
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import date
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.columnar import to_epoch_us
+
+TABLES = {
+    "readings": "id, timestamp, temperature, humidity, setpoint, ac_status",
+    "alarms": "id, timestamp, message",
+}
+# Rows per read-only query; the read lock is held for one chunk at a time
+CHUNK_SIZE = 10000
+MANIFEST = "manifest.json"
+
+
+def iter_chunks(db_file, table, after_id, upto_id, chunk_size=CHUNK_SIZE, pause=0.0):
+    """
+    Yield lists of rows with after_id < id <= upto_id, in id order.
+    Every chunk is its own query (keyset pagination), so no read
+    transaction stays open between chunks and memory stays constant.
+    """
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, timeout=30)
+    try:
+        cursor = conn.cursor()
+        while after_id < upto_id:
+            cursor.execute(f"SELECT {TABLES[table]} FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                           (after_id, upto_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            yield rows
+            if pause:
+                time.sleep(pause)
+    finally:
+        conn.close()
+
+
+def _columns(table, rows):
+    """Rows -> dict of NumPy columns (missing floats as NaN, missing status as -1)."""
+    columns = {
+        "id": np.array([row[0] for row in rows], dtype=np.int64),
+        "ts_us": np.array([to_epoch_us(row[1]) for row in rows], dtype=np.int64),
+    }
+    if table == "readings":
+        for index, name in ((2, "temperature"), (3, "humidity"), (4, "setpoint")):
+            columns[name] = np.array([np.nan if row[index] is None else row[index] for row in rows],
+                                     dtype=np.float32)
+        columns["ac_status"] = np.array([-1 if row[5] is None else row[5] for row in rows], dtype=np.int8)
+    else:
+        columns["message"] = np.array([row[2] for row in rows], dtype=str)
+    return columns
+
+
+def write_part(path, table, rows):
+    """Write one partition part; returns the file path actually written."""
+    columns = _columns(table, rows)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if pa is not None:
+        path += ".parquet"
+        arrays = {name: pa.array(values) for name, values in columns.items()}
+        arrays["ts_us"] = pa.array(columns["ts_us"]).cast(pa.timestamp("us", tz="UTC"))
+        tmp_path = path + ".tmp"
+        pq.write_table(pa.table(arrays), tmp_path, compression="zstd")
+    else:
+        path += ".npz"
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, **columns)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ArchiveExporter:
+    """Incremental day-partitioned export driven by manifest.json in the output directory."""
+
+    def __init__(self, db_file, out_dir, chunk_size=CHUNK_SIZE, pause=0.0, tables=tuple(TABLES)):
+        self.db_file = db_file
+        self.tables = tables
+        self.out_dir = out_dir
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.manifest_path = os.path.join(out_dir, MANIFEST)
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {"format": None, "tables": {}}
+
+    def save_manifest(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def max_id(self, table):
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=30)
+        try:
+            return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def export(self, today=None):
+        """Export new rows of closed days for every table; returns {table: rows written}."""
+        today = (today or date.today()).isoformat()
+        self.manifest["format"] = "parquet" if pa is not None else "npz"
+        return {table: self.export_table(table, today) for table in self.tables}
+
+    def export_table(self, table, today):
+        state = self.manifest["tables"].setdefault(table, {"watermark": 0, "days": {}})
+        days = state["days"]
+        upto_id = self.max_id(table)
+        held_back = None  # lowest id left for a day that is still open
+        written = 0
+        pending_day, pending = None, []
+
+        def flush():
+            nonlocal written
+            if not pending:
+                return
+            name = f"part-{pending[0][0]:010d}-{pending[-1][0]:010d}"
+            path = write_part(os.path.join(self.out_dir, table, pending_day, name), table, pending)
+            entry = days.setdefault(pending_day, {"rows": 0, "max_id": 0, "files": []})
+            entry["rows"] += len(pending)
+            entry["max_id"] = max(entry["max_id"], pending[-1][0])
+            entry["files"].append(os.path.relpath(path, self.out_dir))
+            written += len(pending)
+            pending.clear()
+            # Record progress per part so an interrupted run resumes without duplicates
+            self.save_manifest()
+
+        for chunk in iter_chunks(self.db_file, table, state["watermark"], upto_id, self.chunk_size, self.pause):
+            for row in chunk:
+                day = row[1][:10]
+                if day >= today:
+                    if held_back is None:
+                        held_back = row[0]
+                    continue
+                if row[0] <= days.get(day, {}).get("max_id", 0):
+                    continue  # exported by an earlier run
+                if day != pending_day or len(pending) >= self.chunk_size * 10:
+                    flush()
+                    pending_day = day
+                pending.append(row)
+        flush()
+
+        state["watermark"] = upto_id if held_back is None else max(state["watermark"], held_back - 1)
+        self.save_manifest()
+        return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Incremental day-partitioned export of ac_control.db")
+    parser.add_argument("--db", default=os.environ.get("DB_FILE", "ac_control.db"), help="SQLite database file")
+    parser.add_argument("--out", default="archive", help="output directory")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per read-only query")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    parser.add_argument("--backend", default=os.environ.get("STORAGE_BACKEND", "sqlite"),
+                        choices=("sqlite", "columnar", "memory"), help="storage backend the manager writes with")
+    args = parser.parse_args()
+
+    tables = tuple(TABLES)
+    if args.backend == "memory":
+        sys.exit("The memory storage backend keeps nothing on disk to export")
+    if args.backend == "columnar":
+        print("Warning: the columnar backend keeps readings under columnar/, exporting alarms only")
+        tables = ("alarms",)
+
+    start = time.perf_counter()
+    exporter = ArchiveExporter(args.db, args.out, args.chunk_size, args.pause, tables)
+    counts = exporter.export()
+    print(f"Exported {', '.join(f'{rows} {table}' for table, rows in counts.items())} "
+          f"as {exporter.manifest['format']} in {time.perf_counter() - start:.2f}s -> {args.out}")
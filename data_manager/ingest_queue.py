@@ -0,0 +1,178 @@
+"""
+Priority-aware ingest queue for the Smart AC Data Manager.
+
+Incoming work is split into priority classes, each with its own bounded
+queue and shedding policy:
+
+    control    relay status and setpoint changes, always drained first
+    telemetry  temperature/humidity readings
+    debug      debug log lines for the dashboard
+
+When a class is saturated it sheds load according to its policy instead
+of growing without bound, so a sensor storm can delay telemetry but never
+the relay command path. Shedding counters are kept per class.
+"""
+
+import threading
+from collections import deque, OrderedDict
+
+# Priority classes, lower drains first
+PRIORITY_CONTROL = 0
+PRIORITY_TELEMETRY = 1
+PRIORITY_DEBUG = 2
+PRIORITY_NAMES = {
+    PRIORITY_CONTROL: "control",
+    PRIORITY_TELEMETRY: "telemetry",
+    PRIORITY_DEBUG: "debug",
+}
+
+# Shedding policies
+POLICY_DROP_OLDEST = "drop_oldest"  # Evict the oldest item when full
+POLICY_COALESCE = "coalesce"        # Keep only the latest item per key
+POLICY_SAMPLE = "sample"            # Above the high-water mark keep 1 in N
+
+DEFAULT_POLICIES = {
+    PRIORITY_CONTROL: (POLICY_DROP_OLDEST, 1000),
+    PRIORITY_TELEMETRY: (POLICY_COALESCE, 5000),
+    PRIORITY_DEBUG: (POLICY_DROP_OLDEST, 500),
+}
+
+
+def parse_policies(text):
+    """
+    Parse 'telemetry=sample:2000,debug=drop_oldest:200' into a policies dict.
+    Classes not mentioned keep their defaults.
+    """
+    policies = dict(DEFAULT_POLICIES)
+    priorities = {name: priority for priority, name in PRIORITY_NAMES.items()}
+    for part in filter(None, (part.strip() for part in text.split(","))):
+        name, _, spec = part.partition("=")
+        policy, _, capacity = spec.partition(":")
+        if name not in priorities:
+            raise ValueError(f"Unknown priority class '{name}'")
+        if policy not in (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_SAMPLE):
+            raise ValueError(f"Unknown shedding policy '{policy}'")
+        default_capacity = DEFAULT_POLICIES[priorities[name]][1]
+        policies[priorities[name]] = (policy, int(capacity) if capacity else default_capacity)
+    return policies
+
+
+class ClassQueue:
+    """Bounded queue for one priority class plus its shedding counters."""
+
+    def __init__(self, name, policy, capacity, sample_every=10):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.name = name
+        self.policy = policy
+        self.capacity = capacity
+        self.sample_every = sample_every
+        self.high_water = max(1, capacity // 2)
+        # Coalescing keeps one slot per key, in arrival order of the latest item
+        self.items = OrderedDict() if policy == POLICY_COALESCE else deque()
+        self.sample_count = 0
+        self.sequence = 0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.shed = 0
+        self.coalesced = 0
+        self.peak = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item, key=None):
+        """Add an item; returns False if it was shed on arrival."""
+        self.enqueued += 1
+        if self.policy == POLICY_COALESCE:
+            if key is None:
+                # Unkeyed items never coalesce with each other
+                key = ("_", self.sequence)
+                self.sequence += 1
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.coalesced += 1
+            elif len(self.items) >= self.capacity:
+                self.items.popitem(last=False)
+                self.shed += 1
+            self.items[key] = item
+        else:
+            if self.policy == POLICY_SAMPLE and len(self.items) >= self.high_water:
+                self.sample_count += 1
+                if self.sample_count % self.sample_every:
+                    self.shed += 1
+                    return False
+            if len(self.items) >= self.capacity:
+                self.items.popleft()
+                self.shed += 1
+            self.items.append(item)
+        self.peak = max(self.peak, len(self.items))
+        return True
+
+    def pop_batch(self, limit=None):
+        """Remove and return up to limit items, oldest first."""
+        count = len(self.items) if limit is None else min(limit, len(self.items))
+        if self.policy == POLICY_COALESCE:
+            batch = [self.items.popitem(last=False)[1] for _ in range(count)]
+        else:
+            batch = [self.items.popleft() for _ in range(count)]
+        self.processed += count
+        if not self.items:
+            self.sample_count = 0
+        return batch
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "capacity": self.capacity,
+            "depth": len(self.items),
+            "peak": self.peak,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "shed": self.shed,
+            "coalesced": self.coalesced,
+        }
+
+
+class PriorityIngestQueue:
+    """
+    Thread-safe set of class queues.
+    Producers (the MQTT network thread) call put(); the consumer drains
+    with take(), which always empties the control class first and applies
+    per-class budgets to the rest.
+    """
+
+    def __init__(self, policies=None, sample_every=10):
+        policies = policies or DEFAULT_POLICIES
+        self.lock = threading.Lock()
+        self.queues = {
+            priority: ClassQueue(PRIORITY_NAMES[priority], *policies[priority], sample_every=sample_every)
+            for priority in sorted(PRIORITY_NAMES)
+        }
+
+    def put(self, priority, item, key=None):
+        with self.lock:
+            return self.queues[priority].put(item, key)
+
+    def take(self, budgets=None):
+        """
+        Remove work in priority order.
+        budgets maps priority -> maximum items this round (None = everything).
+        Returns a list of (priority, items) for the classes that had work.
+        """
+        budgets = budgets or {}
+        work = []
+        with self.lock:
+            for priority, queue in self.queues.items():
+                if queue:
+                    work.append((priority, queue.pop_batch(budgets.get(priority))))
+        return work
+
+    def depth(self):
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self):
+        with self.lock:
+            return {queue.name: queue.stats() for queue in self.queues.values()}
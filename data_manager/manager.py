@@ -1,11 +1,11 @@
 import sys
-import json
-import random
+import hmac
+import time
+import threading
 from datetime import datetime
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QVBoxLayout,
                             QLabel, QTableWidget, QTableWidgetItem, QHeaderView)
 from PyQt5.QtCore import Qt, QTimer
-import paho.mqtt.client as mqtt
 
 # Update import path to access mqtt_config from parent directory
 import os
@@ -13,9 +13,63 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
                         TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC,
-                        CONTROL_TOPIC, STATUS_TOPIC, ALARM_TOPIC,
-                        CLIENT_ID_PREFIX)
+                        CONTROL_TOPIC, STATUS_TOPIC, ALARM_TOPIC, DEBUG_PROFILE_TOPIC)
+from mqtt_pool import make_client_id
+from mqtt_failover import FailoverClient
+from mqtt_router import TopicRouter, topic_handler
+from mqtt_codec import (CodecError, decode_message, format_timestamp,
+                        ControlMessage, AlarmMessage, SetpointMessage)
+from metrics import (REGISTRY, MESSAGES_IN, MESSAGES_OUT, DECODE_ERRORS, DECODE_SECONDS,
+                     RECONNECTS, DISCONNECTS, start_metrics_server)
+from profiler import RuntimeProfiler, DEFAULT_DURATION
+from data_manager.storage import open_storage
 from data_manager.db import Database
+from data_manager.backup import BackupScheduler
+from data_manager.energy import EnergyAccounting, parse_rated_power, device_key, SHORT_CYCLE_SECONDS
+from data_manager.scheduler import SetpointScheduler, load_schedules
+from data_manager.analytics import SensorAnalytics, describe_flags
+from data_manager.control import ControlParams, decide_ac_action, ACTION_ON, ACTION_OFF
+from data_manager.commands import CommandTracker
+from data_manager.snapshot import StateSnapshot
+from data_manager.ingest_queue import (PriorityIngestQueue, parse_policies, PRIORITY_CONTROL,
+                                       PRIORITY_TELEMETRY, PRIORITY_DEBUG)
+
+# Restored temperature/humidity older than this are not trusted (seconds)
+RESTORED_MEASUREMENT_MAX_AGE = 900
+# Restored temperature fresh enough to drive control before the first reading
+RESTORED_CONTROL_MAX_AGE = 60
+# Temperature/humidity samples older than this (e.g. retained after a sensor outage) are not acted on
+LIVE_SAMPLE_MAX_AGE = 300
+# Late (buffered) readings are written in batches of this size
+LATE_BATCH_SIZE = 200
+# Items handled per ingest drain; control messages are never budgeted
+TELEMETRY_BUDGET = 200
+DEBUG_BUDGET = 50
+# Topics that take the control priority class; temperature control is evaluated next, before telemetry
+CONTROL_PRIORITY_TOPICS = (STATUS_TOPIC, SETPOINT_TOPIC)
+# Handled on the MQTT thread so they still work while the UI thread is stalled
+NETWORK_THREAD_TOPICS = (DEBUG_PROFILE_TOPIC,)
+# Remote profiling requests must carry this token (DEBUG_PROFILE_TOKEN); unset disables them
+DEBUG_PROFILE_TOKEN = ""
+# Local Prometheus endpoint (override with METRICS_PORT, 0 disables)
+METRICS_PORT = 9108
+# Online SQLite backup period in seconds (override with BACKUP_INTERVAL, 0 disables)
+BACKUP_INTERVAL = 3600
+# Alarms shown on the dashboard
+ALARM_TABLE_ROWS = 10
+# Setpoint schedules (override with SCHEDULE_FILE and SCHEDULE_ZONE)
+SCHEDULE_FILE = "schedules.json"
+SCHEDULE_ZONE = "home"
+# Longest single schedule timer wait, so wall-clock jumps are noticed (seconds)
+SCHEDULE_MAX_WAIT = 3600
+
+CONTROL_SECONDS = REGISTRY.histogram("control_evaluation_seconds", "Temperature control evaluation time")
+INGEST_LATENCY = REGISTRY.histogram("ingest_latency_seconds", "Time from MQTT receipt until handled",
+                                    ("priority",))
+UI_REFRESH_SECONDS = REGISTRY.histogram("ui_refresh_seconds", "Dashboard refresh time")
+INGEST_DEPTH = REGISTRY.gauge("ingest_queue_depth", "Queued ingest items", ("priority",))
+STALE_SAMPLES = REGISTRY.counter("stale_samples_total", "Samples too old to act on", ("topic",))
+INGEST_SHED = REGISTRY.counter("ingest_shed_items_total", "Ingest items shed", ("priority",))
 
 class DataManager(QMainWindow):
     """
@@ -25,7 +79,7 @@ class DataManager(QMainWindow):
     and provides a simple dashboard UI showing current status and alarms.
     """
     
-    def __init__(self):
+    def __init__(self, mqtt_client=None):
         super().__init__()
         self.setWindowTitle("Smart AC Data Manager")
         self.setGeometry(100, 100, 800, 600)
@@ -33,25 +87,102 @@ class DataManager(QMainWindow):
         # Initialize variables
         self.current_temp = None
         self.current_humidity = None
+        # Epoch time each value was measured (restored values keep their original time)
+        self.temp_at = None
+        self.humidity_at = None
         self.setpoint = None
         self.ac_status = False
+        self.control_params = ControlParams()
+        self.confirmed_ac_status = None  # Last state reported by the relay
+
+        # On-demand profiling (MQTT request or SIGUSR1), results under profiles/
+        self.profiler = RuntimeProfiler("manager")
+        self.profiler.install_signal_handler()
+
+        # Commands waiting for relay acknowledgement
+        self.command_tracker = CommandTracker(timeout=3.0, max_retries=2)
+
+        # Control state checkpoint for warm starts
+        self.snapshot = StateSnapshot("manager_state.json")
+        self.temperature_restored = False
+
+        # Late samples replayed from device outboxes, keyed by (sensor, timestamp)
+        self.late_samples = {}
+        self.late_lock = threading.Lock()
+
+        # Streaming anomaly detection per sensor
+        self.temp_analytics = SensorAnalytics(max_jump=10.0)
+        self.humidity_analytics = SensorAnalytics(max_jump=25.0, min_std=2.0)
+        # Readings of the current drain round, analysed as one batch per sensor type
+        self.temp_batch = []
+        self.humidity_batch = []
+
+        # Bounded per-priority queues between the MQTT thread and the UI thread,
+        # e.g. INGEST_POLICIES="telemetry=sample:2000,debug=drop_oldest:200"
+        self.ingest = PriorityIngestQueue(parse_policies(os.environ.get("INGEST_POLICIES", "")))
+        self.shed_reported = 0
+        self.shed_exported = {}  # class -> shed count already added to INGEST_SHED
+
+        # Newest temperature per sensor awaiting control evaluation, taken on every ingest drain
+        self.latest_temperatures = {}
+        self.latest_lock = threading.Lock()
+
+        # Prometheus text endpoint for the instrumentation registry
+        self.metrics_server = start_metrics_server(METRICS_PORT)
+        self.connect_count = 0
         
-        # Initialize database
+        # Initialize storage (STORAGE_BACKEND: sqlite, columnar or memory; DB_FILE)
         try:
-            self.db = Database()
-            self.log_direct("Database initialized")
+            self.db = open_storage()
+            self.log_direct(f"Database initialized ({self.db.name})")
         except Exception as e:
             print(f"Database initialization error: {e}")
             self.db = None
             self.log_direct("Database initialization failed!")
+        # Id of the newest alarm in the alarms table (None until first filled)
+        self.alarm_cursor = None
 
-        # Initialize MQTT Client
-        self.client_id = f"{CLIENT_ID_PREFIX}manager_{random.randint(0, 1000)}"
-        self.mqtt_client = mqtt.Client(client_id=self.client_id)
+        # Per-device AC runtime, cycles and energy (AC_RATED_KW, AC_SHORT_CYCLE_SECONDS)
+        rated_kw, per_device_kw = parse_rated_power(os.environ.get("AC_RATED_KW", ""))
+        self.energy = EnergyAccounting(self.db if isinstance(self.db, Database) else None, rated_kw, per_device_kw,
+                                       float(os.environ.get("AC_SHORT_CYCLE_SECONDS", SHORT_CYCLE_SECONDS)))
+
+        # Weekly setpoint programs and overrides, one heap for all zones
+        self.zone = os.environ.get("SCHEDULE_ZONE", SCHEDULE_ZONE)
+        schedule_file = os.environ.get("SCHEDULE_FILE", SCHEDULE_FILE)
+        self.scheduler = SetpointScheduler()
+        if os.path.exists(schedule_file):
+            try:
+                load_schedules(schedule_file, self.scheduler)
+                self.log_direct(f"Loaded schedules for {len(self.scheduler)} zones from {schedule_file}")
+            except (OSError, ValueError, KeyError) as e:
+                self.log_direct(f"Could not load schedules from {schedule_file}: {e}")
+
+        # Paged online backups under backups/, verified and rotated
+        self.backup = None
+        backup_interval = float(os.environ.get("BACKUP_INTERVAL", BACKUP_INTERVAL))
+        if backup_interval > 0 and self.db is not None:
+            if self.db.name == "sqlite":
+                self.backup = BackupScheduler(self.db, interval=backup_interval, log=self.log_direct).start()
+            else:
+                self.log_direct(f"Backups disabled: the {self.db.name} storage backend keeps readings outside the SQLite file")
+
+        # Initialize MQTT Client (all-in-one mode passes an in-process bus client)
+        self.client_id = make_client_id("manager")
+        if mqtt_client is None:
+            mqtt_client = FailoverClient(client_id=self.client_id)
+        self.mqtt_client = mqtt_client
         self.mqtt_client.username_pw_set(USERNAME, PASSWORD)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
+
+        # Topic dispatch table built from the @topic_handler methods
+        self.router = TopicRouter.from_object(self)
+        self.profile_token = os.environ.get("DEBUG_PROFILE_TOKEN", DEBUG_PROFILE_TOKEN)
+        if not self.profile_token:
+            # Anyone can publish on a public broker: no token, no remote profiling
+            self.router.remove(DEBUG_PROFILE_TOPIC, self.on_profile_request)
         
         # Create main widget and layout
         main_widget = QWidget()
@@ -80,9 +211,16 @@ class DataManager(QMainWindow):
         self.setpoint_label.setStyleSheet(status_font_style)
         self.ac_status_label = QLabel("AC Status: Unknown")
         self.ac_status_label.setStyleSheet(f"{status_font_style}; background-color: #9E9E9E; padding: 5px; border-radius: 5px; color: white;")
+        self.latency_label = QLabel("Command latency: --")
+        self.latency_label.setStyleSheet("font-size: 14px;")
+        self.ingest_label = QLabel("Ingest: idle")
+        self.ingest_label.setStyleSheet("font-size: 14px;")
+        self.energy_label = QLabel("AC today: --")
+        self.energy_label.setStyleSheet("font-size: 14px;")
         
         for label in [self.temp_label, self.humidity_label, 
-                     self.setpoint_label, self.ac_status_label]:
+                     self.setpoint_label, self.ac_status_label, self.latency_label,
+                     self.ingest_label, self.energy_label]:
             status_layout.addWidget(label)
         
         layout.addWidget(status_frame)
@@ -115,6 +253,10 @@ class DataManager(QMainWindow):
         self.debug_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         layout.addWidget(self.debug_table)
 
+        # Warm start from the last checkpoint before any message arrives
+        self.restore_state()
+        self.update_ui()
+
         # Connect to broker
         try:
             self.mqtt_client.connect(BROKER_IP, BROKER_PORT)
@@ -130,80 +272,367 @@ class DataManager(QMainWindow):
         self.update_timer.timeout.connect(self.update_ui)
         self.update_timer.start(5000)  # Update every 5 seconds
 
+        # Timer for command acknowledgement timeouts
+        self.command_timer = QTimer()
+        self.command_timer.timeout.connect(self.check_pending_commands)
+        self.command_timer.start(1000)
+
+        # Timer for control state checkpoints
+        self.checkpoint_timer = QTimer()
+        self.checkpoint_timer.timeout.connect(self.checkpoint_state)
+        self.checkpoint_timer.timeout.connect(self.persist_energy)
+        self.checkpoint_timer.start(10000)
+
+        # Single-shot timer armed for the next schedule transition of any zone
+        self.schedule_timer = QTimer()
+        self.schedule_timer.setSingleShot(True)
+        self.schedule_timer.setTimerType(Qt.PreciseTimer)
+        self.schedule_timer.timeout.connect(self.run_schedules)
+        self.arm_schedule_timer()
+
+        # Timer flushing late readings to the database
+        self.late_timer = QTimer()
+        self.late_timer.timeout.connect(self.flush_late_readings)
+        self.late_timer.start(1000)
+
+        # Timer draining the ingest queue in priority order
+        self.ingest_timer = QTimer()
+        self.ingest_timer.timeout.connect(self.drain_ingest)
+        self.ingest_timer.start(20)
+
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            # Subscribe to all relevant topics
-            topics = [
-                (TEMP_TOPIC, 1),
-                (HUMIDITY_TOPIC, 1),
-                (SETPOINT_TOPIC, 1),
-                (STATUS_TOPIC, 1)
-            ]
-            self.mqtt_client.subscribe(topics)
+            self.connect_count += 1
+            if self.connect_count > 1:
+                RECONNECTS.inc()
+            # Subscribe to every topic with a registered handler
+            self.mqtt_client.subscribe(self.router.subscriptions(1))
             self.connection_label.setText("Connected to broker")
             self.connection_label.setStyleSheet("color: green; font-weight: bold;")
             self.log_alarm("Data Manager connected to broker")
+
+            # A fresh restored reading lets control act before the sensor reports;
+            # like live samples it is evaluated on the UI thread by drain_ingest
+            if (self.temperature_restored and self.temp_at is not None
+                    and time.time() - self.temp_at <= RESTORED_CONTROL_MAX_AGE):
+                with self.latest_lock:
+                    self.latest_temperatures.setdefault(None, (None, time.perf_counter()))
+            self.temperature_restored = False
         else:
             self.connection_label.setText(f"Connection failed with code {rc}")
             self.connection_label.setStyleSheet("color: red; font-weight: bold;")
             self.log_direct(f"MQTT connection failed with code: {rc}")
 
     def on_disconnect(self, client, userdata, rc):
+        DISCONNECTS.inc()
         self.connection_label.setText("Disconnected from broker")
         self.connection_label.setStyleSheet("color: red; font-weight: bold;")
         self.log_alarm("Data Manager disconnected from broker")
 
     def on_message(self, client, userdata, msg):
+        MESSAGES_IN.labels(msg.topic).inc()
+        with self.profiler.stage("on_message"):
+            self.handle_message(msg)
+
+    def handle_message(self, msg):
         try:
-            payload = json.loads(msg.payload.decode())
-            self.log_direct(f"Received on {msg.topic}: {payload}")
-            
+            start = time.perf_counter()
+            try:
+                message = decode_message(msg.topic, msg.payload)
+            except CodecError as e:
+                # Malformed payloads never reach the control logic
+                DECODE_ERRORS.labels(msg.topic).inc()
+                self.log_direct(f"Rejected payload on {msg.topic}: {e}")
+                return
+            DECODE_SECONDS.observe(time.perf_counter() - start)
+            self.log_direct(f"Received on {msg.topic}: {message}")
+
+            # Samples from a device's offline buffer are stored, never acted on
+            if getattr(message, "buffered", False):
+                self.handle_late_message(msg.topic, message)
+                return
+
+            # A retained sample may be hours old if its sensor went offline
+            if msg.topic in (TEMP_TOPIC, HUMIDITY_TOPIC) and self.is_stale_sample(message, msg.retain):
+                STALE_SAMPLES.labels(msg.topic).inc()
+                self.log_direct(f"Ignoring stale {'retained ' if msg.retain else ''}sample on {msg.topic} "
+                                f"from {message.timestamp or 'unknown time'}")
+                return
+
+            if msg.topic in NETWORK_THREAD_TOPICS:
+                # A retained request would start a session on every reconnect
+                if msg.retain:
+                    self.log_direct(f"Ignored retained message on {msg.topic}")
+                    return
+                self.router.dispatch(msg.topic, message)
+                return
+
+            # Hand off to the UI thread; telemetry keeps only the latest reading per sensor
+            received = time.perf_counter()
             if msg.topic == TEMP_TOPIC:
-                self.current_temp = payload.get("value")
-                self.log_direct(f"Updated temperature: {self.current_temp}°C")
-                self.handle_temperature_update(self.current_temp)
-                
-            elif msg.topic == HUMIDITY_TOPIC:
-                self.current_humidity = payload.get("value")
-                self.log_direct(f"Updated humidity: {self.current_humidity}%")
-                
-            elif msg.topic == SETPOINT_TOPIC:
-                self.setpoint = payload.get("value")
-                self.log_direct(f"Updated setpoint: {self.setpoint}°C")
-                # Check if we need to update AC state based on new setpoint
-                self.handle_temperature_update(self.current_temp)
-                
-            elif msg.topic == STATUS_TOPIC:
-                old_status = self.ac_status
-                state = payload.get("state", "")
-                self.ac_status = (state.lower() == "on")
-                self.log_direct(f"Updated AC status: {self.ac_status}")
-                
-                if old_status != self.ac_status:
-                    status_text = "ON" if self.ac_status else "OFF"
-                    self.log_alarm(f"AC status changed to: {status_text}")
+                # Control acts on the temperature ahead of the telemetry backlog
+                self.queue_temperature_control(message, received)
+            if msg.topic in CONTROL_PRIORITY_TOPICS:
+                self.ingest.put(PRIORITY_CONTROL, (msg.topic, message, received))
+            else:
+                key = (msg.topic, getattr(message, "sensor_id", None))
+                self.ingest.put(PRIORITY_TELEMETRY, (msg.topic, message, received), key)
             
-            # Store reading in database
-            if self.db is not None and self.current_temp is not None:
+        except Exception as e:
+            self.log_alarm(f"Error processing message: {str(e)}")
+            self.log_direct(f"Message processing error: {str(e)}")
+
+    def queue_temperature_control(self, message, received):
+        """Keep the newest temperature of a sensor for the next control evaluation"""
+        with self.latest_lock:
+            self.latest_temperatures[message.sensor_id] = (message, received)
+
+    def evaluate_temperatures(self, temperatures):
+        """
+        Run control on the newest temperature of each sensor; never budgeted or shed.
+        A None message (queued on connect) re-evaluates the restored current_temp.
+        """
+        if not temperatures:
+            return
+        latency = INGEST_LATENCY.labels("control")
+        for message, received in temperatures.values():
+            try:
+                if message is not None:
+                    self.current_temp = message.value
+                    self.temp_at = self.measured_at(message)
+                    self.temperature_restored = False
+                self.handle_temperature_update(self.current_temp)
+            except Exception as e:
+                self.log_alarm(f"Error processing message: {str(e)}")
+                self.log_direct(f"Message processing error: {str(e)}")
+                continue
+            latency.observe(time.perf_counter() - received)
+
+    @staticmethod
+    def measured_at(message):
+        """Epoch time a sample was taken; its arrival time if it carries no usable timestamp"""
+        if message.timestamp:
+            try:
+                return datetime.fromisoformat(message.timestamp).timestamp()
+            except ValueError:
+                pass
+        return time.time()
+
+    @staticmethod
+    def is_stale_sample(message, retained):
+        """Whether a sample is too old to act on; a retained one without a timestamp counts as stale"""
+        if not message.timestamp:
+            return retained
+        try:
+            age = time.time() - datetime.fromisoformat(message.timestamp).timestamp()
+        except ValueError:
+            return retained
+        return age > LIVE_SAMPLE_MAX_AGE
+
+    def drain_ingest(self):
+        """Process queued messages: control first, then budgeted telemetry and debug lines"""
+        work = self.ingest.take({PRIORITY_TELEMETRY: TELEMETRY_BUDGET, PRIORITY_DEBUG: DEBUG_BUDGET})
+        with self.latest_lock:
+            temperatures, self.latest_temperatures = self.latest_temperatures, {}
+        if not work and not temperatures:
+            return
+
+        rows = []
+        evaluated = bool(temperatures)
+        for priority, items in work:
+            if priority != PRIORITY_CONTROL:
+                # Temperature control runs after control messages, ahead of the telemetry backlog
+                self.evaluate_temperatures(temperatures)
+                temperatures = None
+            if priority == PRIORITY_DEBUG:
+                self.append_debug_rows(items)
+                continue
+            latency = INGEST_LATENCY.labels("control" if priority == PRIORITY_CONTROL else "telemetry")
+            for topic, message, received in items:
                 try:
-                    self.db.insert_reading(
-                        temperature=self.current_temp,
-                        humidity=self.current_humidity,
-                        setpoint=self.setpoint,
-                        ac_status=1 if self.ac_status else 0
-                    )
+                    with self.profiler.stage("dispatch"):
+                        handled = self.router.dispatch(topic, message)
+                    if not handled:
+                        self.log_direct(f"No handler for topic {topic}")
+                        continue
                 except Exception as e:
-                    print(f"Database insert error: {e}")
-                    self.log_direct(f"Database insert error: {e}")
-            
-            # Update UI
+                    self.log_alarm(f"Error processing message: {str(e)}")
+                    self.log_direct(f"Message processing error: {str(e)}")
+                    continue
+                latency.observe(time.perf_counter() - received)
+                # Control already moved current_temp on; a temperature row keeps its own value
+                temperature = message.value if topic == TEMP_TOPIC else self.current_temp
+                if temperature is not None:
+                    rows.append((format_timestamp(), temperature, self.current_humidity,
+                                 self.setpoint, 1 if self.ac_status else 0))
+
+        self.evaluate_temperatures(temperatures)
+        self.check_sensor_anomalies(self.temp_analytics, self.temp_batch, "Temperature", "°C")
+        self.check_sensor_anomalies(self.humidity_analytics, self.humidity_batch, "Humidity", "%")
+
+        # Store the readings of this round in one transaction
+        if rows and self.db is not None:
+            try:
+                with self.profiler.stage("insert_readings"):
+                    self.db.insert_readings(rows)
+            except Exception as e:
+                print(f"Database insert error: {e}")
+                self.log_direct(f"Database insert error: {e}")
+
+        if evaluated or any(priority != PRIORITY_DEBUG for priority, _ in work):
             self.update_ui()
-            
+
+    @topic_handler(TEMP_TOPIC)
+    def on_temperature(self, message):
+        """Telemetry side of a temperature: logging and analytics (control runs in the control class)"""
+        self.log_direct(f"Updated temperature: {message.value}°C")
+        self.temp_batch.append(message)
+
+    @topic_handler(HUMIDITY_TOPIC)
+    def on_humidity(self, message):
+        self.current_humidity = message.value
+        self.humidity_at = self.measured_at(message)
+        self.log_direct(f"Updated humidity: {self.current_humidity}%")
+        self.humidity_batch.append(message)
+
+    @topic_handler(SETPOINT_TOPIC)
+    def on_setpoint(self, message):
+        self.setpoint = message.value
+        self.log_direct(f"Updated setpoint: {self.setpoint}°C")
+        # Check if we need to update AC state based on new setpoint
+        self.handle_temperature_update(self.current_temp)
+
+    @topic_handler(STATUS_TOPIC)
+    def on_status(self, message):
+        old_status = self.ac_status
+        self.ac_status = (message.state == "on")
+        self.confirmed_ac_status = self.ac_status
+        self.log_direct(f"Updated AC status: {self.ac_status}")
+        self.handle_command_ack(message)
+
+        device = device_key(message.relay_id)
+        run = self.energy.update(device, self.ac_status)
+        if run is not None:
+            short = " (short cycle)" if run < self.energy.short_cycle_seconds else ""
+            self.log_direct(f"AC run on {device} ended after {run / 60:.1f} min{short}")
+
+        if old_status != self.ac_status:
+            status_text = "ON" if self.ac_status else "OFF"
+            self.log_alarm(f"AC status changed to: {status_text}")
+
+    @topic_handler(DEBUG_PROFILE_TOPIC)
+    def on_profile_request(self, message):
+        """Start a bounded profiling session; runs on the MQTT thread"""
+        if message.target not in (None, "manager", self.client_id):
+            return
+        if not hmac.compare_digest((message.token or "").encode(), self.profile_token.encode()):
+            self.log_direct("Profiling request rejected - wrong token")
+            return
+        out_dir = self.profiler.start(duration=message.duration or DEFAULT_DURATION,
+                                      mode=message.mode or "sample",
+                                      memory=message.memory is not False)
+        if out_dir is None:
+            self.log_direct("Profiling request ignored - a session is running or started less than "
+                            f"{self.profiler.min_interval:.0f}s ago")
+        else:
+            self.log_direct(f"Profiling started, results in {out_dir}")
+
+    def run_schedules(self):
+        """Apply due schedule transitions and sleep until the next one"""
+        for zone, setpoint in self.scheduler.run_due():
+            if zone == self.zone:
+                self.apply_scheduled_setpoint(setpoint)
+        self.arm_schedule_timer()
+
+    def arm_schedule_timer(self):
+        due = self.scheduler.next_due()
+        if due is None:
+            self.schedule_timer.stop()
+            return
+        wait = min(max(due - time.time(), 0.0), SCHEDULE_MAX_WAIT)
+        self.schedule_timer.start(int(wait * 1000) + 1)
+
+    def apply_scheduled_setpoint(self, setpoint):
+        """Feed a scheduled setpoint into the control path and publish it like the knob does"""
+        if setpoint == self.setpoint:
+            return
+        self.setpoint = setpoint
+        self.log_alarm(f"Schedule: setpoint {setpoint}°C for zone {self.zone}")
+        try:
+            payload = SetpointMessage(value=setpoint, unit="celsius", controller_id=self.client_id,
+                                      timestamp=format_timestamp()).encode()
+            # Retained, so a reconnecting manager does not fall back to an older knob setpoint
+            self.mqtt_client.publish(SETPOINT_TOPIC, payload, qos=1, retain=True)
+            MESSAGES_OUT.labels(SETPOINT_TOPIC).inc()
         except Exception as e:
-            self.log_alarm(f"Error processing message: {str(e)}")
-            self.log_direct(f"Message processing error: {str(e)}")
+            self.log_direct(f"Error publishing scheduled setpoint: {e}")
+        self.handle_temperature_update(self.current_temp)
+        self.update_ui()
+
+    def handle_late_message(self, topic, message):
+        """Collect a late, out-of-order sample for batched persistence"""
+        timestamp = message.timestamp
+        if timestamp is None:
+            return
+
+        if topic in (TEMP_TOPIC, HUMIDITY_TOPIC):
+            key = (message.sensor_id or "unknown", timestamp)
+            field = "temperature" if topic == TEMP_TOPIC else "humidity"
+            with self.late_lock:
+                self.late_samples.setdefault(key, {})[field] = message.value
+                pending = len(self.late_samples)
+            if pending >= LATE_BATCH_SIZE:
+                self.flush_late_readings()
+        elif topic == STATUS_TOPIC:
+            self.log_direct(f"Delayed AC status '{message.state}' from "
+                            f"{message.relay_id or 'unknown'} at {timestamp}")
+
+    def flush_late_readings(self):
+        """Write collected late samples with their original timestamps in one transaction"""
+        with self.late_lock:
+            if not self.late_samples:
+                return
+            samples, self.late_samples = self.late_samples, {}
+
+        if self.db is None:
+            return
+        try:
+            # Sort by timestamp only: sensors can share one, and a partial sample has None fields
+            rows = sorted(
+                ((timestamp, values.get("temperature"), values.get("humidity"), None, None)
+                 for (_, timestamp), values in samples.items()),
+                key=lambda row: row[0]
+            )
+            self.db.insert_readings(rows)
+            self.log_direct(f"Persisted {len(rows)} late readings ({rows[0][0]} .. {rows[-1][0]})")
+        except Exception as e:
+            print(f"Database insert error: {e}")
+            self.log_direct(f"Error persisting late readings: {e}")
+
+    def check_sensor_anomalies(self, analytics, batch, quantity, unit):
+        """Run the streaming analytics over a round of readings and raise alarms for anomalies"""
+        if not batch:
+            return
+        messages = batch[:]
+        batch.clear()
+        sensor_ids = [message.sensor_id or "unknown" for message in messages]
+        masks = analytics.update_batch(sensor_ids, [message.value for message in messages],
+                                       [self.measured_at(message) for message in messages])
+        for message, sensor_id, flags in zip(messages, sensor_ids, masks):
+            value = message.value
+            for flag in describe_flags(flags):
+                if flag == "stuck":
+                    self.log_alarm(f"{quantity} sensor {sensor_id} appears stuck at {value}{unit}")
+                elif flag == "spike":
+                    self.log_alarm(f"{quantity} spike from sensor {sensor_id}: {value}{unit}")
+                elif flag == "jump":
+                    self.log_alarm(f"Implausible {quantity.lower()} jump from sensor {sensor_id}: {value}{unit}")
 
     def handle_temperature_update(self, temperature):
+        with CONTROL_SECONDS.time():
+            self.evaluate_control(temperature)
+
+    def evaluate_control(self, temperature):
         if temperature is None or self.setpoint is None:
             self.log_direct(f"Skipping temp control - temp: {temperature}, setpoint: {self.setpoint}")
             return
@@ -214,8 +643,11 @@ class DataManager(QMainWindow):
         self.log_direct(f"Setpoint: {self.setpoint}°C")
         self.log_direct(f"AC Status: {'ON' if self.ac_status else 'OFF'}")
 
+        action, emergency, alert = decide_ac_action(
+            float(temperature), float(self.setpoint), self.ac_status, self.control_params)
+
         # Check for high temperature alert
-        if temperature >= 30:
+        if alert:
             alert_msg = f"High temperature alert: {temperature}°C"
             self.log_direct(alert_msg)
             self.log_alarm(alert_msg)
@@ -225,8 +657,8 @@ class DataManager(QMainWindow):
         self.log_direct(f"Temperature difference: {temp_difference:.1f}°C")
 
         # Control logic with hysteresis
-        if temp_difference >= 5 and not self.ac_status:
-            # Turn AC ON if temp is 5 degrees or more above setpoint
+        if action == ACTION_ON:
+            # Turn AC ON if temp is far enough above setpoint
             message = f"Auto-activating AC: Temperature ({temperature}°C) is {temp_difference:.1f}°C above setpoint ({self.setpoint}°C)"
             self.log_direct(f"DECISION: {message}")
             self.log_alarm(message)
@@ -235,8 +667,8 @@ class DataManager(QMainWindow):
             # Update UI immediately
             self.ac_status_label.setText("AC Status: ON")
             self.log_direct("AC TURNED ON")
-        elif temp_difference <= -1 and self.ac_status:
-            # Turn AC OFF if temp is 1 degree below setpoint (hysteresis)
+        elif action == ACTION_OFF:
+            # Turn AC OFF once temp drops below setpoint (hysteresis)
             message = f"Auto-deactivating AC: Temperature ({temperature}°C) is below setpoint ({self.setpoint}°C)"
             self.log_direct(f"DECISION: {message}")
             self.log_alarm(message)
@@ -249,7 +681,7 @@ class DataManager(QMainWindow):
             self.log_direct(f"DECISION: No action needed - conditions not met for state change")
 
         # Force the AC on for very high temperatures regardless of other conditions
-        if temperature >= 35 and not self.ac_status:
+        if emergency:
             message = f"EMERGENCY: Force turning AC ON due to very high temperature: {temperature}°C"
             self.log_direct(message)
             self.log_alarm(message)
@@ -261,16 +693,17 @@ class DataManager(QMainWindow):
 
         self.log_direct("=================================")
 
-    def publish_ac_command(self, command):
+    def publish_ac_command(self, command, command_id=None):
         try:
-            self.log_direct(f"***** PUBLISHING AC COMMAND: {command} *****")
+            if command_id is None:
+                command_id = self.command_tracker.register(command)
+            self.log_direct(f"***** PUBLISHING AC COMMAND: {command} ({command_id}) *****")
             
-            payload = json.dumps({
-                "command": command,
-                "timestamp": datetime.now().isoformat()
-            })
+            payload = ControlMessage(command=command, command_id=command_id,
+                                     timestamp=format_timestamp()).encode()
             
             result = self.mqtt_client.publish(CONTROL_TOPIC, payload, qos=1)
+            MESSAGES_OUT.labels(CONTROL_TOPIC).inc()
             self.log_direct(f"Command published. Result: {result}")
             self.log_alarm(f"Sent AC command: {command}")
         except Exception as e:
@@ -278,9 +711,41 @@ class DataManager(QMainWindow):
             self.log_direct(error_msg)
             self.log_alarm(error_msg)
 
+    def handle_command_ack(self, message):
+        """Match a relay status message with the command it confirms"""
+        command_id = message.command_id
+        relay_id = message.relay_id or "unknown"
+        if not command_id:
+            self.log_direct(f"Unsolicited AC state change from {relay_id}")
+            return
+
+        ack = self.command_tracker.acknowledge(command_id, relay_id)
+        if ack is None:
+            self.log_direct(f"Ignoring stale acknowledgement {command_id} from {relay_id}")
+            return
+
+        command, latency = ack
+        self.log_direct(f"Command '{command}' acknowledged by {relay_id} in {latency * 1000:.0f} ms")
+        summary = self.command_tracker.latency_summary(relay_id)
+        self.latency_label.setText(
+            f"Command latency: p50 {summary['p50']} ms, p95 {summary['p95']} ms ({summary['count']} acks)")
+
+    def check_pending_commands(self):
+        """Retry unacknowledged AC commands and give up after the retry limit"""
+        retries, failures = self.command_tracker.check_timeouts()
+        for entry in retries:
+            self.log_direct(f"No ack for '{entry.command}' ({entry.command_id}), retry {entry.attempts - 1}")
+            self.publish_ac_command(entry.command, entry.command_id)
+        for entry in failures:
+            self.log_alarm(f"AC command '{entry.command}' not acknowledged after {entry.attempts} attempts")
+            # Fall back to the last state the relay actually reported
+            if self.confirmed_ac_status is not None:
+                self.ac_status = self.confirmed_ac_status
+                self.update_ui()
+
     def log_alarm(self, message):
         """Log important system alerts to database and MQTT"""
-        timestamp = datetime.now().isoformat()
+        timestamp = format_timestamp()
         
         # Store in database
         if self.db is not None:
@@ -291,11 +756,9 @@ class DataManager(QMainWindow):
         
         # Publish to MQTT
         try:
-            payload = json.dumps({
-                "message": message,
-                "timestamp": timestamp
-            })
+            payload = AlarmMessage(message=message, timestamp=timestamp).encode()
             self.mqtt_client.publish(ALARM_TOPIC, payload, qos=1)
+            MESSAGES_OUT.labels(ALARM_TOPIC).inc()
         except Exception as e:
             print(f"Error publishing alarm: {e}")
         
@@ -307,25 +770,41 @@ class DataManager(QMainWindow):
 
     def log_direct(self, message):
         """Add a message to the debug log (not stored in database)"""
-        # Print to console
-        print(message)
-        
+        with self.profiler.stage("log_direct"):
+            # Print to console
+            print(message)
+
+            # The debug table is filled from the lowest priority ingest class
+            self.ingest.put(PRIORITY_DEBUG, message)
+
+    def append_debug_rows(self, messages):
+        """Append queued debug messages to the debug table"""
         # Only add to debug table if it exists
-        if hasattr(self, 'debug_table') and self.debug_table is not None:
-            # Add to debug table
+        if not hasattr(self, 'debug_table') or self.debug_table is None:
+            return
+        with self.profiler.stage("debug_table"):
+            self.insert_debug_rows(messages)
+
+    def insert_debug_rows(self, messages):
+        # Keep only the last 100 messages
+        messages = messages[-100:]
+        for message in messages:
             row_position = self.debug_table.rowCount()
             self.debug_table.insertRow(row_position)
             self.debug_table.setItem(row_position, 0, QTableWidgetItem(message))
-            
-            # Scroll to bottom
-            self.debug_table.scrollToBottom()
-            
-            # Keep only the last 100 messages
-            if self.debug_table.rowCount() > 100:
-                self.debug_table.removeRow(0)
+        excess = self.debug_table.rowCount() - 100
+        for _ in range(max(0, excess)):
+            self.debug_table.removeRow(0)
+
+        # Scroll to bottom
+        self.debug_table.scrollToBottom()
 
     def update_ui(self):
         """Update the UI with current system status"""
+        with UI_REFRESH_SECONDS.time(), self.profiler.stage("update_ui"):
+            self.refresh_ui()
+
+    def refresh_ui(self):
         # Update status labels
         status_font_style = "font-size: 18px; font-weight: bold;"
         
@@ -346,33 +825,150 @@ class DataManager(QMainWindow):
         else:
             self.ac_status_label.setStyleSheet(f"{status_font_style}; background-color: #F44336; padding: 5px; border-radius: 5px; color: white;")
         
+        self.update_ingest_stats()
+
         # Update alarms table
         self.update_alarms_table()
 
+    def update_ingest_stats(self):
+        """Show queue depth and load shedding counters"""
+        stats = self.ingest.stats()
+        for name, entry in stats.items():
+            INGEST_DEPTH.labels(name).set(entry["depth"])
+            exported = self.shed_exported.get(name, 0)
+            if entry["shed"] > exported:
+                INGEST_SHED.labels(name).inc(entry["shed"] - exported)
+                self.shed_exported[name] = entry["shed"]
+        queued = sum(entry["depth"] for entry in stats.values())
+        shed = sum(entry["shed"] for entry in stats.values())
+        coalesced = stats["telemetry"]["coalesced"]
+        self.ingest_label.setText(f"Ingest: {queued} queued, {shed} shed, {coalesced} coalesced")
+        if shed > self.shed_reported:
+            details = ", ".join(f"{name} {entry['shed']}" for name, entry in stats.items() if entry["shed"])
+            self.log_direct(f"Load shedding active: {shed - self.shed_reported} items dropped ({details} total)")
+            self.shed_reported = shed
+
     def update_alarms_table(self):
-        """Update the alarms table with recent alarms from database"""
+        """Add alarms stored since the last update to the alarms table"""
+        with self.profiler.stage("update_alarms_table"):
+            self.refresh_alarms_table()
+
+    def refresh_alarms_table(self):
         if self.db is not None:
             try:
-                alarms = self.db.get_recent_alarms(10)  # Get last 10 alarms
-                
-                # Clear existing rows
-                self.alarm_table.setRowCount(0)
-                
-                # Add new rows
-                for i, (timestamp, message, _) in enumerate(alarms):
-                    self.alarm_table.insertRow(i)
-                    self.alarm_table.setItem(i, 0, QTableWidgetItem(timestamp))
-                    self.alarm_table.setItem(i, 1, QTableWidgetItem(message))
+                if self.alarm_cursor is None:
+                    alarms = self.db.get_recent_alarms(ALARM_TABLE_ROWS)[::-1]
+                    self.alarm_cursor = 0
+                else:
+                    # Only alarms added since the last refresh (served from the hot cache)
+                    alarms = self.db.get_alarms_since(self.alarm_cursor)
+                if not alarms:
+                    return
+                self.alarm_cursor = alarms[-1][2]
+
+                # Newest on top; rows pushed past the limit drop off the bottom
+                for timestamp, message, _ in alarms[-ALARM_TABLE_ROWS:]:
+                    self.alarm_table.insertRow(0)
+                    self.alarm_table.setItem(0, 0, QTableWidgetItem(timestamp))
+                    self.alarm_table.setItem(0, 1, QTableWidgetItem(message))
+                self.alarm_table.setRowCount(min(self.alarm_table.rowCount(), ALARM_TABLE_ROWS))
             except Exception as e:
                 print(f"Error updating alarms table: {e}")
                 self.log_direct(f"Error updating alarms table: {e}")
 
+    def restore_state(self):
+        """Restore the last known control state from the snapshot file or the database"""
+        state, age = self.snapshot.load()
+        source = "snapshot"
+        if state is None and self.db is not None:
+            try:
+                # Late readings are stored without control state, skip them
+                rows = [row for row in self.db.get_recent_readings(1000) if row[3] is not None]
+                if rows:
+                    timestamp, temperature, humidity, setpoint, ac_status = rows[0]
+                    measured = datetime.fromisoformat(timestamp).timestamp()
+                    age = max(0.0, time.time() - measured)
+                    state = {
+                        "current_temp": temperature,
+                        "current_humidity": humidity,
+                        "temp_at": measured,
+                        "humidity_at": measured,
+                        "setpoint": setpoint,
+                        "ac_status": bool(ac_status)
+                    }
+                    source = "database"
+            except Exception as e:
+                self.log_direct(f"Could not restore state from database: {e}")
+
+        if state is None:
+            self.log_direct("No previous control state found - cold start")
+            return
+
+        self.setpoint = state.get("setpoint")
+        self.ac_status = bool(state.get("ac_status", False))
+        # Measurements are judged by when they were taken, not when the state was saved;
+        # without a measurement time they are not trusted
+        now = time.time()
+        temp_at, humidity_at = state.get("temp_at"), state.get("humidity_at")
+        if temp_at is not None and now - temp_at <= RESTORED_MEASUREMENT_MAX_AGE:
+            self.current_temp, self.temp_at = state.get("current_temp"), temp_at
+            self.temperature_restored = self.current_temp is not None
+        if humidity_at is not None and now - humidity_at <= RESTORED_MEASUREMENT_MAX_AGE:
+            self.current_humidity, self.humidity_at = state.get("current_humidity"), humidity_at
+        measured = f"{now - temp_at:.0f}s old" if temp_at is not None else "no time"
+        self.log_direct(f"Restored control state from {source} ({age:.0f}s old): "
+                        f"setpoint {self.setpoint}, temperature {self.current_temp} ({measured}), "
+                        f"AC {'ON' if self.ac_status else 'OFF'}")
+
+    def checkpoint_state(self):
+        """Persist the current control state for the next warm start"""
+        state = {
+            "current_temp": self.current_temp,
+            "current_humidity": self.current_humidity,
+            "temp_at": self.temp_at,
+            "humidity_at": self.humidity_at,
+            "setpoint": self.setpoint,
+            "ac_status": self.ac_status
+        }
+        try:
+            self.snapshot.save(state)
+        except Exception as e:
+            print(f"Error saving state snapshot: {e}")
+
+    def persist_energy(self):
+        """Flush the energy accumulators and show today's totals"""
+        try:
+            self.energy.flush()
+            totals = [self.energy.day(device) for device in self.energy.devices()]
+        except Exception as e:
+            print(f"Error saving energy usage: {e}")
+            return
+        on_hours = sum(entry["on_hours"] for entry in totals)
+        cycles = sum(entry["cycles"] for entry in totals)
+        short_cycles = sum(entry["short_cycles"] for entry in totals)
+        kwh = sum(entry["kwh"] for entry in totals)
+        self.energy_label.setText(f"AC today: {on_hours:.2f} h on, {cycles} cycles "
+                                  f"({short_cycles} short), {kwh:.2f} kWh")
+
     def closeEvent(self, event):
         """Clean up resources when closing the application"""
         self.log_direct("Shutting down Data Manager")
         self.update_timer.stop()
+        self.command_timer.stop()
+        self.checkpoint_timer.stop()
+        self.schedule_timer.stop()
+        self.late_timer.stop()
+        self.ingest_timer.stop()
+        self.profiler.stop()
+        self.flush_late_readings()
+        self.checkpoint_state()
+        self.persist_energy()
         self.mqtt_client.loop_stop()
         self.mqtt_client.disconnect()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.backup is not None:
+            self.backup.stop()
         if self.db is not None:
             self.db.close()
         event.accept()
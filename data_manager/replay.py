@@ -0,0 +1,231 @@
+"""
+Historical replay / backtesting for the Smart AC control logic.
+
+Streams recorded readings out of ac_control.db and pushes them through
+decide_ac_action at full speed (no MQTT, no Qt), so several parameter
+sets can be compared side by side against real history.
+
+Usage:
+    python data_manager/replay.py --db ac_control.db \\
+        --params 5,-1,30,35 --params 3,-0.5,30,35 --band 2
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.control import ControlParams, decide_ac_action, ACTION_NONE
+
+
+def iter_readings(db_file, chunk_size=50000):
+    """
+    Yield chunks of (epoch_seconds, temperature, setpoint, ac_status) rows
+    in insertion order. Uses fetchmany so memory stays constant.
+
+    Late readings replayed from device outboxes are skipped: they are
+    inserted after newer rows with their original timestamps and carry no
+    setpoint or AC status. Rows with a malformed timestamp are skipped too.
+    """
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    skipped = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT timestamp, temperature, setpoint, ac_status
+            FROM readings
+            WHERE temperature IS NOT NULL AND ac_status IS NOT NULL
+            ORDER BY id
+            """
+        )
+        parse = datetime.fromisoformat
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = []
+            for ts, temp, setpoint, status in rows:
+                try:
+                    when = parse(ts).timestamp()
+                except (TypeError, ValueError):
+                    skipped += 1
+                    continue
+                chunk.append((when, temp, setpoint, status))
+            yield chunk
+    finally:
+        conn.close()
+        if skipped:
+            print(f"Skipped {skipped} readings with malformed timestamps")
+
+
+class ReplayResult:
+    """Accumulated outcome of replaying history through one parameter set."""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.actuations = 0
+        self.emergencies = 0
+        self.alerts = 0
+        self.violations = 0           # Samples outside the comfort band
+        self.violation_seconds = 0.0
+        self.on_seconds = 0.0
+        self.total_seconds = 0.0
+
+    @property
+    def duty_cycle(self):
+        if self.total_seconds <= 0:
+            return 0.0
+        return self.on_seconds / self.total_seconds
+
+    def as_row(self):
+        return (self.name, self.samples, self.actuations, self.emergencies,
+                self.alerts, self.violations, self.violation_seconds / 3600.0,
+                self.duty_cycle * 100.0)
+
+
+class ControlReplay:
+    """Simulated controller state for one parameter set."""
+
+    def __init__(self, params, comfort_band=2.0, max_gap=300.0, name=None):
+        self.params = params
+        self.comfort_band = comfort_band
+        self.max_gap = max_gap  # Gaps longer than this (outages) are not counted
+        self.result = ReplayResult(name or repr(params))
+        self.ac_status = False
+        self.last_time = None
+
+    def feed(self, rows):
+        """Push one chunk of readings through the control logic."""
+        params = self.params
+        band = self.comfort_band
+        max_gap = self.max_gap
+        result = self.result
+        ac_status = self.ac_status
+        last_time = self.last_time
+
+        samples = actuations = emergencies = alerts = violations = 0
+        violation_seconds = on_seconds = total_seconds = 0.0
+
+        for when, temperature, setpoint, _ in rows:
+            # Time-weight the state held since the previous reading
+            dt = 0.0
+            if last_time is not None:
+                dt = when - last_time
+                if 0 < dt <= max_gap:
+                    total_seconds += dt
+                    if ac_status:
+                        on_seconds += dt
+                else:
+                    dt = 0.0
+            last_time = when
+
+            if setpoint is None:
+                continue
+            samples += 1
+
+            if abs(temperature - setpoint) > band:
+                violations += 1
+                violation_seconds += dt
+
+            action, emergency, alert = decide_ac_action(temperature, setpoint, ac_status, params)
+            if action != ACTION_NONE:
+                ac_status = not ac_status
+                actuations += 1
+            if emergency:
+                ac_status = True
+                actuations += 1
+                emergencies += 1
+            if alert:
+                alerts += 1
+
+        self.ac_status = ac_status
+        self.last_time = last_time
+        result.samples += samples
+        result.actuations += actuations
+        result.emergencies += emergencies
+        result.alerts += alerts
+        result.violations += violations
+        result.violation_seconds += violation_seconds
+        result.on_seconds += on_seconds
+        result.total_seconds += total_seconds
+
+
+class RecordedBaseline(ControlReplay):
+    """Replays the AC status actually recorded in the database."""
+
+    def __init__(self, comfort_band=2.0, max_gap=300.0):
+        super().__init__(ControlParams(), comfort_band, max_gap, name="recorded")
+
+    def feed(self, rows):
+        result = self.result
+        band = self.comfort_band
+        for when, temperature, setpoint, status in rows:
+            dt = 0.0
+            if self.last_time is not None:
+                dt = when - self.last_time
+                if 0 < dt <= self.max_gap:
+                    result.total_seconds += dt
+                    if self.ac_status:
+                        result.on_seconds += dt
+                else:
+                    dt = 0.0
+            self.last_time = when
+
+            new_status = bool(status)
+            if new_status != self.ac_status:
+                result.actuations += 1
+            self.ac_status = new_status
+
+            if setpoint is None:
+                continue
+            result.samples += 1
+            if temperature >= self.params.alert_temp:
+                result.alerts += 1
+            if abs(temperature - setpoint) > band:
+                result.violations += 1
+                result.violation_seconds += dt
+
+
+def run_replay(db_file, param_sets, comfort_band=2.0, chunk_size=50000, include_recorded=True):
+    """Replay the database once through every parameter set and return the results."""
+    replays = [ControlReplay(params, comfort_band) for params in param_sets]
+    if include_recorded:
+        replays.insert(0, RecordedBaseline(comfort_band))
+
+    for rows in iter_readings(db_file, chunk_size):
+        for replay in replays:
+            replay.feed(rows)
+    return [replay.result for replay in replays]
+
+
+def print_results(results, elapsed):
+    header = ("parameters", "samples", "actuations", "emergency", "alerts",
+              "violations", "viol. hours", "duty %")
+    print(f"{header[0]:<58}" + "".join(f"{h:>12}" for h in header[1:]))
+    for row in (result.as_row() for result in results):
+        print(f"{row[0]:<58}{row[1]:>12}{row[2]:>12}{row[3]:>12}{row[4]:>12}"
+              f"{row[5]:>12}{row[6]:>12.2f}{row[7]:>12.1f}")
+    if results:
+        rows = results[0].samples
+        rate = rows / elapsed * 60 if elapsed > 0 else float("inf")
+        print(f"\nReplayed {rows} readings in {elapsed:.2f}s ({rate:,.0f} rows/min)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded readings through the AC control logic")
+    parser.add_argument("--db", default="ac_control.db", help="SQLite database file")
+    parser.add_argument("--params", action="append", type=ControlParams.parse,
+                        help="on_delta,off_delta,alert_temp,emergency_temp (repeatable)")
+    parser.add_argument("--band", type=float, default=2.0, help="Comfort band around setpoint (°C)")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows fetched per database round trip")
+    args = parser.parse_args()
+
+    param_sets = args.params or [ControlParams()]
+    start = time.perf_counter()
+    results = run_replay(args.db, param_sets, args.band, args.chunk_size)
+    print_results(results, time.perf_counter() - start)
@@ -0,0 +1,326 @@
+"""
+Setpoint schedules for the Smart AC Data Manager.
+
+A zone follows a weekly program (setpoint changes at given times on given
+weekdays) and may have one-off overrides (a setpoint for [start, end),
+e.g. pre-cooling or a holiday setback). SetpointScheduler keeps one heap
+entry per zone holding the time of that zone's next transition, so the
+owner needs a single timer: sleep until next_due(), call run_due(), and
+re-arm. Each transition costs O(log zones); nothing is polled.
+
+Schedules are read from a JSON file (SCHEDULE_FILE, default
+schedules.json); programs can be shared between zones by name:
+
+    {
+      "programs": {
+        "workday": [
+          {"days": "mon-fri", "at": "06:30", "setpoint": 22},
+          {"days": "mon-fri", "at": "23:00", "setpoint": 26},
+          {"days": "sat,sun", "at": "08:00", "setpoint": 23},
+          {"days": "sat,sun", "at": "23:30", "setpoint": 26}
+        ]
+      },
+      "zones": {
+        "home": {
+          "program": "workday",
+          "overrides": [{"start": "2026-10-24T14:00", "end": "2026-10-24T18:00", "setpoint": 21}]
+        }
+      }
+    }
+
+Times are local wall-clock times. Only transitions change a setpoint, so
+a manual change from the knob holds until the zone's next transition.
+
+Usage (scheduler cost with many zones):
+    python data_manager/scheduler.py --zones 50000 --days 7
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import bisect
+import argparse
+import itertools
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import REGISTRY
+
+SCHEDULE_CHANGES = REGISTRY.counter("schedule_setpoint_changes_total", "Setpoint changes made by schedules")
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+WEEK_SECONDS = 7 * 86400
+# Largest clock shift around a DST change (seconds)
+DST_SHIFT = 7200
+# Rebuild the heap once stale entries outnumber live zones by this factor
+COMPACT_FACTOR = 2
+
+
+def parse_days(text):
+    """'mon-fri', 'sat,sun', 'daily' -> sorted weekday numbers (Monday = 0)."""
+    text = text.strip().lower()
+    if text in ("daily", "all", "*"):
+        return list(range(7))
+    days = set()
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        start = DAY_NAMES.index(first[:3])
+        end = DAY_NAMES.index(last[:3]) if last else start
+        days.update((start + i) % 7 for i in range((end - start) % 7 + 1))
+    return sorted(days)
+
+
+def _week_start(dt):
+    """Local midnight of the Monday of dt's week."""
+    return datetime.combine((dt - timedelta(days=dt.weekday())).date(), datetime.min.time())
+
+
+class WeeklyProgram:
+    """Setpoint changes at fixed offsets into the week; the last one wraps into the next week."""
+
+    def __init__(self, entries):
+        """entries: iterable of (weekday, 'HH:MM', setpoint)."""
+        changes = {}
+        for weekday, at, setpoint in entries:
+            hours, _, minutes = at.partition(":")
+            changes[weekday * 86400 + int(hours) * 3600 + int(minutes or 0) * 60] = float(setpoint)
+        if not changes:
+            raise ValueError("A weekly program needs at least one setpoint change")
+        self.offsets = sorted(changes)
+        self.setpoints = [changes[offset] for offset in self.offsets]
+
+    @classmethod
+    def from_config(cls, items):
+        return cls((day, item["at"], item["setpoint"]) for item in items for day in parse_days(item["days"]))
+
+    def _locate(self, ts):
+        dt = datetime.fromtimestamp(ts)
+        week = _week_start(dt)
+        return week, (dt - week).total_seconds()
+
+    def _offset(self, index):
+        """Seconds from the start of the week to change index (may run into the previous or next week)."""
+        weeks, index = divmod(index, len(self.offsets))
+        return weeks * WEEK_SECONDS + self.offsets[index]
+
+    def _instant(self, week, index):
+        return (week + timedelta(seconds=self._offset(index))).timestamp()
+
+    def lookup(self, ts):
+        """(setpoint in effect at ts, epoch time of the first change after ts)."""
+        week, offset = self._locate(ts)
+        index = bisect.bisect_right(self.offsets, offset)
+        due = self._instant(week, index)
+        # Wall-clock offsets repeat or skip an hour around DST changes: settle on real instants
+        while due <= ts:
+            index += 1
+            due = self._instant(week, index)
+        while offset - self._offset(index - 1) < DST_SHIFT:
+            previous = self._instant(week, index - 1)
+            if previous <= ts:
+                break
+            index, due = index - 1, previous
+        # Before the first change of the week the previous week's last one applies (index -1)
+        return self.setpoints[(index - 1) % len(self.offsets)], due
+
+    def setpoint_at(self, ts):
+        return self.lookup(ts)[0]
+
+    def next_change(self, ts):
+        return self.lookup(ts)[1]
+
+
+class _Zone:
+    __slots__ = ("program", "overrides", "setpoint", "version")
+
+    def __init__(self):
+        self.program = None
+        self.overrides = []  # (start, end, setpoint), sorted by start
+        self.setpoint = None
+        self.version = None
+
+
+class SetpointScheduler:
+    """Per-zone programs and overrides behind one min-heap of next transitions."""
+
+    def __init__(self):
+        self.zones = {}
+        self.heap = []  # (due, version, zone); entries with an old version are stale
+        self.versions = itertools.count()
+
+    def __len__(self):
+        return len(self.zones)
+
+    def _zone(self, zone):
+        state = self.zones.get(zone)
+        if state is None:
+            state = self.zones[zone] = _Zone()
+        return state
+
+    def set_program(self, zone, program, now=None):
+        """Give a zone a WeeklyProgram (or None); returns the zone's setpoint now."""
+        now = time.time() if now is None else now
+        state = self._zone(zone)
+        state.program = program
+        return self._reschedule(zone, state, now)
+
+    def add_override(self, zone, setpoint, start, end, now=None):
+        """One-off setpoint for [start, end) epoch seconds; the latest-starting active override wins."""
+        if end <= start:
+            raise ValueError("Override must end after it starts")
+        now = time.time() if now is None else now
+        state = self._zone(zone)
+        bisect.insort(state.overrides, (start, end, float(setpoint)))
+        return self._reschedule(zone, state, now)
+
+    def clear_overrides(self, zone, now=None):
+        now = time.time() if now is None else now
+        state = self._zone(zone)
+        state.overrides = []
+        return self._reschedule(zone, state, now)
+
+    def remove_zone(self, zone):
+        self.zones.pop(zone, None)
+
+    def setpoint(self, zone, now=None):
+        """The scheduled setpoint of a zone at now (None without program or active override)."""
+        state = self.zones.get(zone)
+        if state is None:
+            return None
+        return self._evaluate(state, time.time() if now is None else now)[0]
+
+    def _evaluate(self, state, now):
+        """(setpoint at now, time of the next transition or None); drops finished overrides."""
+        if state.overrides:
+            state.overrides = [entry for entry in state.overrides if entry[1] > now]
+        setpoint, due = state.program.lookup(now) if state.program is not None else (None, None)
+        for start, end, value in state.overrides:
+            if start <= now:
+                setpoint = value
+                edge = end
+            else:
+                edge = start
+            if due is None or edge < due:
+                due = edge
+        if due is not None and due <= now:
+            due = now + 1  # wall-clock edge cases (DST): never spin
+        return setpoint, due
+
+    def _reschedule(self, zone, state, now):
+        state.setpoint, due = self._evaluate(state, now)
+        state.version = next(self.versions)
+        if due is not None:
+            heapq.heappush(self.heap, (due, state.version, zone))
+        if len(self.heap) > COMPACT_FACTOR * len(self.zones) + 64:
+            self._compact()
+        return state.setpoint
+
+    def _compact(self):
+        zones = self.zones
+        self.heap = [entry for entry in self.heap
+                     if entry[2] in zones and zones[entry[2]].version == entry[1]]
+        heapq.heapify(self.heap)
+
+    def _stale(self, entry):
+        state = self.zones.get(entry[2])
+        return state is None or state.version != entry[1]
+
+    def next_due(self):
+        """Epoch time of the earliest pending transition, or None."""
+        heap = self.heap
+        while heap and self._stale(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def run_due(self, now=None):
+        """Apply every transition due by now; returns [(zone, new setpoint)] for zones that changed."""
+        now = time.time() if now is None else now
+        heap = self.heap
+        changes = []
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if self._stale(entry):
+                continue
+            zone = entry[2]
+            state = self.zones[zone]
+            previous = state.setpoint
+            if self._reschedule(zone, state, now) != previous and state.setpoint is not None:
+                changes.append((zone, state.setpoint))
+        if changes:
+            SCHEDULE_CHANGES.inc(len(changes))
+        return changes
+
+
+def _parse_time(text):
+    return datetime.fromisoformat(text).timestamp()
+
+
+def load_schedules(path, scheduler=None, now=None):
+    """Read a schedule file into a (new) SetpointScheduler."""
+    if scheduler is None:
+        scheduler = SetpointScheduler()
+    with open(path) as f:
+        config = json.load(f)
+    programs = {name: WeeklyProgram.from_config(items) for name, items in config.get("programs", {}).items()}
+    for zone, entry in config.get("zones", {}).items():
+        program = entry.get("program")
+        if isinstance(program, str):
+            if program not in programs:
+                raise ValueError(f"Zone '{zone}' uses unknown program '{program}'")
+            program = programs[program]
+        elif program is not None:
+            program = WeeklyProgram.from_config(program)
+        scheduler.set_program(zone, program, now)
+        for override in entry.get("overrides", []):
+            scheduler.add_override(zone, override["setpoint"], _parse_time(override["start"]),
+                                   _parse_time(override["end"]), now)
+    return scheduler
+
+
+def benchmark(zones, days, seed=1):
+    """Load random programs into many zones and replay days of transitions on a simulated clock."""
+    rng = random.Random(seed)
+    programs = []
+    for _ in range(64):
+        wake, sleep = rng.randrange(5 * 60, 9 * 60), rng.randrange(21 * 60, 24 * 60)
+        programs.append(WeeklyProgram.from_config([
+            {"days": "mon-fri", "at": f"{wake // 60}:{wake % 60:02d}", "setpoint": rng.choice((21, 22, 23))},
+            {"days": "mon-fri", "at": f"{sleep // 60}:{sleep % 60:02d}", "setpoint": 26},
+            {"days": "sat,sun", "at": "08:00", "setpoint": 23},
+            {"days": "sat,sun", "at": "23:30", "setpoint": 26},
+        ]))
+    now = time.time()
+    scheduler = SetpointScheduler()
+    start = time.perf_counter()
+    for index in range(zones):
+        scheduler.set_program(f"zone{index}", rng.choice(programs), now)
+        if index % 10 == 0:
+            begin = now + rng.uniform(0, days * 86400)
+            scheduler.add_override(f"zone{index}", 20, begin, begin + 3600 * 4, now)
+    load = time.perf_counter() - start
+
+    end = now + days * 86400
+    wakeups = changes = 0
+    busy = 0.0
+    while True:
+        due = scheduler.next_due()
+        if due is None or due > end:
+            break
+        start = time.perf_counter()
+        changes += len(scheduler.run_due(due))
+        busy += time.perf_counter() - start
+        wakeups += 1
+    print(f"{zones} zones loaded in {load:.2f}s; {days} days: {wakeups} wakeups, {changes} setpoint changes, "
+          f"{busy:.2f}s busy ({busy / max(changes, 1) * 1e6:.1f} us per change), heap {len(scheduler.heap)}")
+    return {"load": load, "wakeups": wakeups, "changes": changes, "busy": busy}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Setpoint scheduler cost with many zones")
+    parser.add_argument("--zones", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+    benchmark(args.zones, args.days)
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import tempfile
+
+
+class StateSnapshot:
+    """
+    Checkpoint file for the manager's control state.
+    Written atomically (temp file + rename) so a crash mid-write never
+    leaves a corrupt snapshot behind.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path="manager_state.json"):
+        self.path = path
+        self.last_saved = None
+
+    def save(self, state):
+        """
+        Write the state dict if it changed since the last checkpoint.
+        saved_at is the time of that change; callers that need the age of
+        a value store its own timestamp in the state.
+        """
+        if state == self.last_saved:
+            return False
+
+        data = {"version": self.VERSION, "saved_at": time.time(), "state": state}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".state_", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.last_saved = dict(state)
+        return True
+
+    def load(self):
+        """Return (state, age in seconds) or (None, None) if there is no usable snapshot."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+
+        if data.get("version") != self.VERSION or not isinstance(data.get("state"), dict):
+            return None, None
+        self.last_saved = dict(data["state"])
+        return data["state"], max(0.0, time.time() - data.get("saved_at", 0))
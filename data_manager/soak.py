@@ -0,0 +1,363 @@
+"""
+Soak test for the Smart AC Data Manager.
+
+Runs the real manager against the local broker stand-in (mqtt_local.py)
+and drives it with synthetic sensors in accelerated time: every room
+reports every --interval simulated seconds, --speed times faster than
+real time, and a simulated relay acknowledges every AC command. The
+harness periodically samples process RSS, tracemalloc usage and top
+allocations, database file size, p99 ingest latency and the backlog of
+published but not yet received messages, writes them to
+soak_samples.csv, and fails (exit code 1) when any of them drifts beyond
+the configured limits between the start and the end of the run.
+
+Usage:
+    python data_manager/soak.py --duration 3600 --rooms 20 --speed 60
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import tracemalloc
+import contextlib
+
+import numpy as np
+import paho.mqtt.client as mqtt
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_local import LocalBroker
+from metrics import bucket_quantile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# mqtt_config, and everything importing it, is only imported once run_soak()
+# has pointed MQTT_BROKER/MQTT_PORT at the local broker
+
+# Samples at each end of the run compared for drift
+EDGE_SAMPLES = 3
+
+
+class SoakLimits:
+    """Allowed drift between the start (after warmup) and the end of a soak run."""
+
+    def __init__(self, max_rss_growth_mb=50.0, max_traced_growth_mb=20.0,
+                 max_db_bytes_per_row=256.0, max_latency_ratio=3.0, latency_floor_ms=50.0,
+                 max_backlog_growth=1000):
+        self.max_rss_growth_mb = float(max_rss_growth_mb)
+        self.max_traced_growth_mb = float(max_traced_growth_mb)
+        self.max_db_bytes_per_row = float(max_db_bytes_per_row)
+        self.max_latency_ratio = float(max_latency_ratio)  # End p99 / start p99
+        self.latency_floor_ms = float(latency_floor_ms)    # p99 below this always passes
+        self.max_backlog_growth = int(max_backlog_growth)  # Messages the manager falls behind by
+
+
+def read_rss_mb():
+    """Resident set size of this process in MB."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        import resource
+        # Peak rather than current RSS; still catches steady growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+class LoadGenerator:
+    """Simulated sensors and relay publishing through the broker in accelerated time."""
+
+    def __init__(self, host, port, rooms, interval=5.0, speed=60.0, setpoint=21.0):
+        from emulators.thermal_model import RoomThermalModel
+        from mqtt_config import TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC, CONTROL_TOPIC, STATUS_TOPIC
+
+        self.topics = (TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC, CONTROL_TOPIC, STATUS_TOPIC)
+        self.rooms = rooms
+        self.interval = interval
+        self.speed = speed
+        self.setpoint = setpoint
+        self.model = RoomThermalModel(rooms)
+        self.sensor_ids = [f"soak{i:04d}" for i in range(rooms)]
+        self.ac_on = False
+        self.published = 0
+        self.commands = 0
+        self.running = False
+        self.thread = None
+
+        self.client = mqtt.Client(client_id="smart_ac_soak_load")
+        self.client.on_message = self.on_message
+        self.client.connect(host, port)
+
+    def on_message(self, client, userdata, msg):
+        from mqtt_codec import CodecError, ControlMessage, StatusMessage, format_timestamp
+
+        # Behave like the relay: switch and acknowledge with the command id
+        try:
+            command = ControlMessage.decode(msg.payload)
+        except CodecError:
+            return
+        self.ac_on = command.command == "on"
+        self.commands += 1
+        status = StatusMessage(state=command.command, relay_id="soak_relay",
+                               command_id=command.command_id, timestamp=format_timestamp())
+        client.publish(self.topics[4], status.encode(), qos=1, retain=True)
+
+    def start(self):
+        from mqtt_codec import SetpointMessage, format_timestamp
+
+        self.client.subscribe(self.topics[3], 1)
+        self.client.loop_start()
+        setpoint = SetpointMessage(value=self.setpoint, unit="celsius", controller_id="soak_knob",
+                                   timestamp=format_timestamp())
+        self.client.publish(self.topics[2], setpoint.encode(), qos=1, retain=True)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="soak-load", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        from mqtt_codec import TemperatureMessage, HumidityMessage, format_timestamp
+
+        # One simulated reporting round per tick, spread over the real time it takes
+        tick = self.interval / self.speed
+        next_tick = time.monotonic()
+        while self.running:
+            ac_on = np.full(self.rooms, self.ac_on)
+            temps, humidities = self.model.step(self.interval, ac_on)
+            timestamp = format_timestamp()
+            for sensor_id, temp, humidity in zip(self.sensor_ids, temps.tolist(), humidities.tolist()):
+                self.client.publish(self.topics[0], TemperatureMessage(
+                    value=temp, unit="celsius", sensor_id=sensor_id, timestamp=timestamp).encode(), qos=1)
+                self.client.publish(self.topics[1], HumidityMessage(
+                    value=humidity, unit="percent", sensor_id=sensor_id, timestamp=timestamp).encode(), qos=1)
+            self.published += 2 * self.rooms
+            next_tick += tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Falling behind: keep going without trying to catch up
+                next_tick = time.monotonic()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class SoakSampler:
+    """Periodic resource and latency samples of the running manager, plus the drift verdict."""
+
+    FIELDS = ("elapsed_s", "rss_mb", "traced_mb", "db_mb", "db_rows", "control_p99_ms",
+              "telemetry_p99_ms", "handled", "published", "received", "backlog", "queue_depth",
+              "debug_rows", "commands")
+
+    def __init__(self, manager, load, db_file, warmup, log, csv_path, trace_memory=True):
+        from data_manager.manager import INGEST_LATENCY
+        from data_manager.db import DB_ROWS_WRITTEN
+        from metrics import MESSAGES_IN
+        from mqtt_config import TEMP_TOPIC, HUMIDITY_TOPIC
+
+        self.manager = manager
+        self.load = load
+        self.db_file = db_file
+        self.warmup = warmup
+        self.log = log
+        self.trace_memory = trace_memory
+        self.latency = {name: INGEST_LATENCY.labels(name) for name in ("control", "telemetry")}
+        self.last_counts = {name: child.snapshot() for name, child in self.latency.items()}
+        self.rows_written = DB_ROWS_WRITTEN.labels("readings")
+        self.received = [MESSAGES_IN.labels(topic) for topic in (TEMP_TOPIC, HUMIDITY_TOPIC)]
+        self.start = time.monotonic()
+        self.samples = []
+        self.baseline_snapshot = None
+        self.csv_file = open(csv_path, "w", newline="")
+        self.writer = csv.DictWriter(self.csv_file, fieldnames=self.FIELDS)
+        self.writer.writeheader()
+
+    def window_p99_ms(self, name):
+        """p99 of the latencies observed since the previous sample."""
+        child = self.latency[name]
+        counts = child.snapshot()
+        window = [now - before for now, before in zip(counts, self.last_counts[name])]
+        self.last_counts[name] = counts
+        value = bucket_quantile(child.buckets, window, 0.99)
+        return None if value is None else value * 1000
+
+    def sample(self):
+        elapsed = time.monotonic() - self.start
+        traced = tracemalloc.get_traced_memory()[0] / 1e6 if tracemalloc.is_tracing() else 0.0
+        handled = sum(sum(child.snapshot()) for child in self.latency.values())
+        published = self.load.published
+        received = int(sum(counter.value for counter in self.received))
+        row = {
+            "elapsed_s": round(elapsed, 1),
+            "rss_mb": round(read_rss_mb(), 2),
+            "traced_mb": round(traced, 2),
+            "db_mb": (round(os.path.getsize(self.db_file) / 1e6, 3)
+                      if self.db_file and os.path.exists(self.db_file) else 0.0),
+            "db_rows": int(self.rows_written.value),
+            "control_p99_ms": self.window_p99_ms("control"),
+            "telemetry_p99_ms": self.window_p99_ms("telemetry"),
+            "handled": handled,
+            "published": published,
+            "received": received,
+            "backlog": published - received,
+            "queue_depth": self.manager.ingest.depth(),
+            "debug_rows": self.manager.debug_table.rowCount(),
+            "commands": self.load.commands,
+        }
+        self.samples.append(row)
+        self.writer.writerow(row)
+        self.csv_file.flush()
+        print("  ".join(f"{key}={value}" for key, value in row.items()), file=sys.__stdout__, flush=True)
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            if self.baseline_snapshot is None and elapsed >= self.warmup:
+                self.baseline_snapshot = snapshot
+            self.log.write(f"--- top allocations at {elapsed:.0f}s ---\n")
+            for stat in snapshot.statistics("lineno")[:5]:
+                self.log.write(f"  {stat}\n")
+
+    def evaluate(self, limits):
+        """Return a list of failure descriptions (empty when the run passed)."""
+        steady = [row for row in self.samples if row["elapsed_s"] >= self.warmup]
+        if len(steady) < 2 * EDGE_SAMPLES:
+            return [f"only {len(steady)} samples after warmup, need {2 * EDGE_SAMPLES} "
+                    f"(run longer or sample more often)"]
+        head, tail = steady[:EDGE_SAMPLES], steady[-EDGE_SAMPLES:]
+
+        def median(rows, key):
+            values = [row[key] for row in rows if row[key] is not None]
+            return statistics.median(values) if values else None
+
+        failures = []
+        for key, limit, label in (("rss_mb", limits.max_rss_growth_mb, "RSS"),
+                                  ("traced_mb", limits.max_traced_growth_mb, "traced memory")):
+            growth = median(tail, key) - median(head, key)
+            hours = (tail[-1]["elapsed_s"] - head[0]["elapsed_s"]) / 3600
+            slope = np.polyfit([row["elapsed_s"] / 3600 for row in steady],
+                               [row[key] for row in steady], 1)[0]
+            print(f"{label}: {growth:+.1f} MB over {hours:.2f} h ({slope:+.1f} MB/h)", file=sys.__stdout__)
+            if growth > limit:
+                failures.append(f"{label} grew {growth:.1f} MB (limit {limit:g} MB)")
+
+        last = steady[-1]
+        if last["db_rows"] > 1000:
+            bytes_per_row = last["db_mb"] * 1e6 / last["db_rows"]
+            print(f"Database: {last['db_mb']:.1f} MB for {last['db_rows']} rows "
+                  f"({bytes_per_row:.0f} bytes/row)", file=sys.__stdout__)
+            if bytes_per_row > limits.max_db_bytes_per_row:
+                failures.append(f"database uses {bytes_per_row:.0f} bytes/row "
+                                f"(limit {limits.max_db_bytes_per_row:g})")
+
+        backlog_growth = median(tail, "backlog") - median(head, "backlog")
+        print(f"Backlog: {median(head, 'backlog'):g} -> {median(tail, 'backlog'):g} messages", file=sys.__stdout__)
+        if backlog_growth > limits.max_backlog_growth:
+            failures.append(f"manager fell {backlog_growth:g} messages further behind the load "
+                            f"(limit {limits.max_backlog_growth})")
+
+        for key in ("control_p99_ms", "telemetry_p99_ms"):
+            start, end = median(head, key), median(tail, key)
+            if start is None or end is None:
+                continue
+            print(f"{key}: {start:g} -> {end:g} ms", file=sys.__stdout__)
+            if end > max(start * limits.max_latency_ratio, limits.latency_floor_ms):
+                failures.append(f"{key} rose from {start:g} to {end:g} ms")
+
+        if self.baseline_snapshot is not None:
+            growth = tracemalloc.take_snapshot().compare_to(self.baseline_snapshot, "lineno")
+            print("Top allocation growth since warmup:", file=sys.__stdout__)
+            for stat in growth[:10]:
+                print(f"  {stat}", file=sys.__stdout__)
+        return failures
+
+    def close(self):
+        self.csv_file.close()
+
+
+def run_soak(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="smart_ac_soak_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    # The manager reads the broker address when mqtt_config is first imported
+    broker = LocalBroker().start()
+    os.environ["MQTT_BROKER"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    os.environ.setdefault("METRICS_PORT", "0")
+    if args.trace_memory:
+        # One frame is enough for per-line statistics and keeps the overhead down
+        tracemalloc.start(1)
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from data_manager.manager import DataManager
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    print(f"Soak run in {workdir}: {args.rooms} rooms every {args.interval:g}s simulated, "
+          f"x{args.speed:g} speed, {args.duration:g}s", file=sys.__stdout__)
+
+    with open("manager.log", "w") as log, contextlib.redirect_stdout(log):
+        manager = DataManager()
+        load = LoadGenerator(broker.host, broker.port, args.rooms, args.interval, args.speed, args.setpoint)
+        load.start()
+        sampler = SoakSampler(manager, load, manager.db.db_file, args.warmup, log,
+                              "soak_samples.csv", args.trace_memory)
+
+        sample_timer = QTimer()
+        sample_timer.timeout.connect(sampler.sample)
+        sample_timer.start(int(args.sample_interval * 1000))
+        QTimer.singleShot(int(args.duration * 1000), app.quit)
+        app.exec_()
+
+        sample_timer.stop()
+        load.stop()
+        manager.close()
+        app.processEvents()
+
+    failures = sampler.evaluate(SoakLimits(args.max_rss_growth, args.max_traced_growth,
+                                           args.max_db_bytes_per_row, args.max_latency_ratio,
+                                           args.latency_floor, args.max_backlog_growth))
+    sampler.close()
+    broker.stop()
+
+    if failures:
+        print("SOAK FAILED:", file=sys.__stdout__)
+        for failure in failures:
+            print(f"  - {failure}", file=sys.__stdout__)
+        return 1
+    print("Soak passed", file=sys.__stdout__)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Soak test the data manager with accelerated synthetic load")
+    parser.add_argument("--duration", type=float, default=3600, help="Real run time in seconds")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=5.0, help="Simulated seconds between readings")
+    parser.add_argument("--speed", type=float, default=60.0, help="Simulated seconds per real second")
+    parser.add_argument("--setpoint", type=float, default=21.0,
+                        help="Low enough that the AC keeps cycling")
+    parser.add_argument("--sample-interval", type=float, default=30.0, help="Seconds between samples")
+    parser.add_argument("--warmup", type=float, default=60.0, help="Seconds excluded from the baseline")
+    parser.add_argument("--workdir", default=None, help="Directory for the database and reports")
+    parser.add_argument("--no-tracemalloc", dest="trace_memory", action="store_false")
+    parser.add_argument("--max-rss-growth", type=float, default=50.0, help="MB")
+    parser.add_argument("--max-traced-growth", type=float, default=20.0, help="MB")
+    parser.add_argument("--max-db-bytes-per-row", type=float, default=256.0)
+    parser.add_argument("--max-latency-ratio", type=float, default=3.0)
+    parser.add_argument("--latency-floor", type=float, default=50.0, help="ms")
+    parser.add_argument("--max-backlog-growth", type=int, default=1000, help="Messages")
+    args = parser.parse_args()
+    sys.exit(run_soak(args))
@@ -0,0 +1,244 @@
+"""
+Storage backends for the Smart AC Data Manager.
+
+Storage is the interface the manager and the pipelines write through:
+single and bulk reading inserts, alarms, most-recent, time-range and
+incremental ("everything after id X") queries. Backends:
+
+    sqlite    Database (db.py), the ac_control.db file
+    columnar  ColumnarDatabase (columnar.py), memory-mapped reading columns
+    memory    MemoryStorage, nothing touches the disk
+
+open_storage() picks one from STORAGE_BACKEND (default sqlite) and
+DB_FILE (default ac_control.db); register_backend() adds others.
+
+Rows use the SQLite shapes throughout:
+    reading  (timestamp, temperature, humidity, setpoint, ac_status)
+    alarm    (timestamp, message, id)
+with ISO timestamps; ranges are half-open, [start, end). Incremental
+reads return reading rows with their id appended, so a caller keeps the
+last id it has seen as a cursor.
+
+Usage (ingest throughput per backend):
+    python data_manager/storage.py --rows 200000 --batch 200
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import tempfile
+import importlib
+from collections import deque
+from datetime import datetime
+
+DEFAULT_BACKEND = "sqlite"
+DEFAULT_DB_FILE = "ac_control.db"
+
+
+class Storage:
+    """Interface shared by every storage backend."""
+
+    name = None
+    db_file = None
+
+    def insert_reading(self, temperature=None, humidity=None, setpoint=None, ac_status=None):
+        """Insert a reading stamped with the current time."""
+        raise NotImplementedError
+
+    def insert_readings(self, rows):
+        """Bulk insert reading rows that carry their own timestamps."""
+        raise NotImplementedError
+
+    def insert_alarm(self, message):
+        raise NotImplementedError
+
+    def get_recent_readings(self, limit=100):
+        """Newest readings first."""
+        raise NotImplementedError
+
+    def get_recent_alarms(self, limit=100):
+        """Newest alarms first."""
+        raise NotImplementedError
+
+    def get_readings_between(self, start, end):
+        """Readings with start <= timestamp < end, oldest first."""
+        raise NotImplementedError
+
+    def get_alarms_between(self, start, end):
+        """Alarms with start <= timestamp < end, oldest first."""
+        raise NotImplementedError
+
+    def get_readings_since(self, after_id, limit=None):
+        """
+        Readings with id > after_id, oldest first, as
+        (timestamp, temperature, humidity, setpoint, ac_status, id).
+        At most limit rows; page on with the id of the last row.
+        """
+        raise NotImplementedError
+
+    def get_alarms_since(self, after_id, limit=None):
+        """Alarms with id > after_id, oldest first; at most limit rows."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _since(rows, after_id, limit):
+    """Rows (id last, ascending) with id > after_id, oldest first, at most limit."""
+    found = []
+    for row in reversed(rows):
+        if row[-1] <= after_id:
+            break
+        found.append(row)
+    found.reverse()
+    return found if limit is None else found[:max(limit, 0)]
+
+
+class HotCache:
+    """
+    The newest max_rows rows of one table, in id order (id is the last field).
+    The owner appends under its write lock after each commit; readers take
+    a snapshot without locking. newest() and since() return None when the
+    answer may include rows that were already evicted.
+    """
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.rows = deque(maxlen=max_rows)
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+
+    def newest(self, limit):
+        if limit > self.max_rows:
+            return None
+        return list(itertools.islice(reversed(self.rows), max(limit, 0)))
+
+    def since(self, after_id, limit=None):
+        if self.rows and self.rows[-1][-1] <= after_id:
+            return []  # the usual dashboard poll: nothing new
+        snapshot = list(self.rows)
+        if len(snapshot) == self.max_rows and (not snapshot or snapshot[0][-1] > after_id + 1):
+            return None
+        return _since(snapshot, after_id, limit)
+
+
+class MemoryStorage(Storage):
+    """
+    Process-local storage for benchmarks and simulations.
+    No lock: appends to a deque are atomic under the GIL, and readers work
+    on a snapshot. max_rows bounds each table (oldest rows are dropped).
+    """
+
+    name = "memory"
+
+    def __init__(self, max_rows=None):
+        self.readings = deque(maxlen=max_rows)
+        self.alarms = deque(maxlen=max_rows)
+        self.reading_ids = itertools.count(1)
+        self.alarm_ids = itertools.count(1)
+
+    def insert_reading(self, temperature=None, humidity=None, setpoint=None, ac_status=None):
+        self.readings.append((datetime.now().isoformat(), temperature, humidity, setpoint, ac_status,
+                              next(self.reading_ids)))
+
+    def insert_readings(self, rows):
+        self.readings.extend(tuple(row) + (next(self.reading_ids),) for row in rows)
+
+    def insert_alarm(self, message):
+        self.alarms.append((datetime.now().isoformat(), message, next(self.alarm_ids)))
+
+    @staticmethod
+    def _newest(table, limit):
+        snapshot = list(table)
+        return snapshot[:-limit - 1:-1] if limit > 0 else []
+
+    @staticmethod
+    def _between(table, start, end):
+        return sorted((row for row in list(table) if start <= row[0] < end), key=lambda row: row[0])
+
+    def get_recent_readings(self, limit=100):
+        return [row[:5] for row in self._newest(self.readings, limit)]
+
+    def get_recent_alarms(self, limit=100):
+        return self._newest(self.alarms, limit)
+
+    def get_readings_between(self, start, end):
+        return [row[:5] for row in self._between(self.readings, start, end)]
+
+    def get_alarms_between(self, start, end):
+        return self._between(self.alarms, start, end)
+
+    def get_readings_since(self, after_id, limit=None):
+        return _since(list(self.readings), after_id, limit)
+
+    def get_alarms_since(self, after_id, limit=None):
+        return _since(list(self.alarms), after_id, limit)
+
+
+# Backend name -> "module:factory"; factories take keyword options
+BACKENDS = {
+    "sqlite": "data_manager.db:Database",
+    "columnar": "data_manager.columnar:ColumnarDatabase",
+    "memory": "data_manager.storage:MemoryStorage",
+}
+
+
+def register_backend(name, factory):
+    """Make a backend available to open_storage (factory: callable or 'module:attribute')."""
+    BACKENDS[name] = factory
+
+
+def open_storage(backend=None, **options):
+    """
+    Create the configured backend.
+    backend defaults to STORAGE_BACKEND; file-based backends get db_file from DB_FILE.
+    """
+    backend = backend or os.environ.get("STORAGE_BACKEND", DEFAULT_BACKEND)
+    factory = BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown storage backend '{backend}' (known: {', '.join(sorted(BACKENDS))})")
+    if isinstance(factory, str):
+        module_name, _, attribute = factory.partition(":")
+        factory = getattr(importlib.import_module(module_name), attribute)
+    if backend != "memory":
+        options.setdefault("db_file", os.environ.get("DB_FILE", DEFAULT_DB_FILE))
+    return factory(**options)
+
+
+def benchmark(backends, rows, batch):
+    """Bulk-insert rows through each backend in batches; returns rows per second per backend."""
+    now = time.time()
+    data = [(datetime.fromtimestamp(now - (rows - i) * 0.1).isoformat(), 22.0 + (i % 50) / 10,
+             45.0, 22.0, i % 2) for i in range(rows)]
+    results = {}
+    for backend in backends:
+        with tempfile.TemporaryDirectory(prefix="storage_bench_") as workdir:
+            options = {}
+            if backend == "columnar":
+                options["columnar_dir"] = os.path.join(workdir, "columnar")
+            if backend != "memory":
+                options["db_file"] = os.path.join(workdir, "bench.db")
+            storage = open_storage(backend, **options)
+            start = time.perf_counter()
+            for offset in range(0, rows, batch):
+                storage.insert_readings(data[offset:offset + batch])
+            elapsed = time.perf_counter() - start
+            newest = storage.get_recent_readings(1)
+            storage.close()
+        results[backend] = rows / elapsed
+        print(f"{backend:<10}{rows / elapsed:>14,.0f} rows/s  ({elapsed:.2f}s, last {newest[0][0] if newest else '-'})")
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="Storage backend ingest throughput")
+    parser.add_argument("--backends", default="memory,sqlite,columnar")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=200, help="rows per insert_readings call")
+    args = parser.parse_args()
+    benchmark([name for name in args.backends.split(",") if name], args.rows, args.batch)
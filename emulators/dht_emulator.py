@@ -1,9 +1,8 @@
 import sys
 import random
-import json
-from datetime import datetime
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QVBoxLayout,
-                            QFormLayout, QLineEdit, QLabel, QPushButton, QSpinBox)
+                            QFormLayout, QLineEdit, QLabel, QPushButton, QSpinBox,
+                            QCheckBox)
 from PyQt5.QtCore import QTimer, Qt
 import paho.mqtt.client as mqtt
 
@@ -12,31 +11,46 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
-                        TEMP_TOPIC, HUMIDITY_TOPIC, CLIENT_ID_PREFIX)
+                        TEMP_TOPIC, HUMIDITY_TOPIC, STATUS_TOPIC)
+from mqtt_pool import make_client_id, device_name
+from mqtt_failover import FailoverClient
+from emulators.outbox import Outbox
+from mqtt_router import TopicRouter, topic_handler
+from metrics import MESSAGES_IN, MESSAGES_OUT, DECODE_ERRORS, RECONNECTS, DISCONNECTS, start_metrics_server
+from mqtt_codec import (CodecError, decode_message, format_timestamp,
+                        TemperatureMessage, HumidityMessage)
 
 class DHTEmulator(QMainWindow):
     """Temperature and Humidity Sensor Emulator"""
     
-    def __init__(self):
+    def __init__(self, mqtt_client=None):
         super().__init__()
         self.setWindowTitle("DHT Sensor Emulator")
         self.setGeometry(100, 100, 400, 300)
 
-        # Initialize MQTT Client
-        self.client_id = f"{CLIENT_ID_PREFIX}dht_{random.randint(0, 1000)}"
-        self.mqtt_client = mqtt.Client(client_id=self.client_id)
+        # Initialize MQTT Client (all-in-one mode passes an in-process bus client)
+        self.client_id = make_client_id("dht")
+        if mqtt_client is None:
+            mqtt_client = FailoverClient(client_id=self.client_id)
+        self.mqtt_client = mqtt_client
         
-        # Define MQTT callbacks
-        def on_message(client, userdata, message):
-            print(f"Received message on topic {message.topic}: {message.payload.decode()}")
-        
-        self.on_message = on_message
+        # Room physics simulation (driven by the relay status)
+        self.room_model = None
+        self.ac_on = False
+
+        # Readings taken while offline, sent on reconnect
+        self.outbox = Outbox(f"{device_name('dht')}_outbox.jsonl", max_messages=10000)
         
         self.mqtt_client.username_pw_set(USERNAME, PASSWORD)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
         self.connected = False
+        self.connect_count = 0
+        self.router = TopicRouter.from_object(self)
+
+        # Prometheus text endpoint (override with METRICS_PORT, 0 disables)
+        self.metrics_server = start_metrics_server(9109)
 
         # Create main widget and layout
         main_widget = QWidget()
@@ -67,6 +81,18 @@ class DHTEmulator(QMainWindow):
         self.interval_input.setSuffix(" seconds")
         form_layout.addRow("Update Interval:", self.interval_input)
 
+        # Room physics simulation mode
+        self.simulate_checkbox = QCheckBox("Simulate room physics")
+        self.simulate_checkbox.toggled.connect(self.toggle_simulation)
+        form_layout.addRow("Mode:", self.simulate_checkbox)
+
+        # Simulation speed-up factor
+        self.speed_input = QSpinBox()
+        self.speed_input.setRange(1, 600)
+        self.speed_input.setValue(1)
+        self.speed_input.setSuffix("x")
+        form_layout.addRow("Simulation Speed:", self.speed_input)
+
         # Status label
         self.status_label = QLabel("Disconnected")
         self.status_label.setStyleSheet("color: red;")
@@ -98,12 +124,22 @@ class DHTEmulator(QMainWindow):
         self.timer.start(5000)  # Start with 5 second interval
         self.interval_input.valueChanged.connect(self.update_timer_interval)
 
+        # Timer draining the offline buffer in rate-limited batches
+        self.drain_timer = QTimer(self)
+        self.drain_timer.timeout.connect(self.drain_outbox)
+        self.drain_timer.start(500)
+
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self.connect_count += 1
+            if self.connect_count > 1:
+                RECONNECTS.inc()
             self.status_label.setText("Connected to broker")
             self.status_label.setStyleSheet("color: green; font-weight: bold;")
             self.send_button.setEnabled(True)
+            # Follow the relay so the simulated room reacts to the AC
+            self.mqtt_client.subscribe(self.router.subscriptions(1))
             print("DHT Emulator connected to broker")
         else:
             self.status_label.setText(f"Connection failed with code {rc}")
@@ -112,11 +148,43 @@ class DHTEmulator(QMainWindow):
 
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
+        DISCONNECTS.inc()
         self.status_label.setText("Disconnected from broker")
         self.status_label.setStyleSheet("color: red;")
         self.send_button.setEnabled(False)
         print("DHT Emulator disconnected from broker")
 
+    def on_message(self, client, userdata, msg):
+        MESSAGES_IN.labels(msg.topic).inc()
+        try:
+            if not self.router.resolve(msg.topic):
+                print(f"Received message on topic {msg.topic}: {msg.payload.decode()}")
+                return
+            self.router.dispatch(msg.topic, decode_message(msg.topic, msg.payload))
+        except CodecError as e:
+            DECODE_ERRORS.labels(msg.topic).inc()
+            print(f"Rejected payload on {msg.topic}: {e}")
+        except Exception as e:
+            print(f"Error processing message: {str(e)}")
+
+    @topic_handler(STATUS_TOPIC)
+    def on_relay_status(self, message):
+        self.ac_on = message.state == "on"
+
+    def toggle_simulation(self, enabled):
+        """Switch between the random walk and the thermal room model"""
+        if enabled:
+            # Loaded on demand: the model (and numpy) is not needed for the random walk
+            from emulators.thermal_model import RoomThermalModel
+            temp, humidity = self.get_sensor_data()
+            self.room_model = RoomThermalModel(initial_temp=temp, initial_humidity=humidity)
+            self.temp_input.setReadOnly(True)
+            self.humidity_input.setReadOnly(True)
+        else:
+            self.room_model = None
+            self.temp_input.setReadOnly(False)
+            self.humidity_input.setReadOnly(False)
+
     def update_timer_interval(self, value):
         self.timer.setInterval(value * 1000)
 
@@ -131,41 +199,67 @@ class DHTEmulator(QMainWindow):
         return round(temp, 1), round(humidity, 1)
 
     def publish_data(self, temp, humidity):
+        # Get current timestamp
+        timestamp = format_timestamp()
+
+        temp_message = TemperatureMessage(value=temp, unit="celsius",
+                                          sensor_id=self.client_id, timestamp=timestamp)
+        humidity_message = HumidityMessage(value=humidity, unit="percent",
+                                           sensor_id=self.client_id, timestamp=timestamp)
+
         if not self.connected:
-            self.status_label.setText("Not connected to broker")
+            # Keep the sample with its original timestamp until we reconnect
+            temp_message.buffered = True
+            humidity_message.buffered = True
+            self.outbox.put(TEMP_TOPIC, temp_message.encode())
+            self.outbox.put(HUMIDITY_TOPIC, humidity_message.encode())
+            self.status_label.setText(f"Offline - {len(self.outbox) // 2} readings buffered")
+            self.status_label.setStyleSheet("color: orange; font-weight: bold;")
             return
 
-        # Get current timestamp
-        timestamp = datetime.now().isoformat()
-
         # Publish temperature
-        temp_payload = json.dumps({
-            "value": temp,
-            "unit": "celsius",
-            "sensor_id": self.client_id,
-            "timestamp": timestamp
-        })
         print(f"Publishing temperature: {temp}°C")
-        self.mqtt_client.publish(TEMP_TOPIC, temp_payload, qos=1)
+        self.mqtt_client.publish(TEMP_TOPIC, temp_message.encode(), qos=1, retain=True)
+        MESSAGES_OUT.labels(TEMP_TOPIC).inc()
 
         # Publish humidity
-        humidity_payload = json.dumps({
-            "value": humidity,
-            "unit": "percent",
-            "sensor_id": self.client_id,
-            "timestamp": timestamp
-        })
         print(f"Publishing humidity: {humidity}%")
-        self.mqtt_client.publish(HUMIDITY_TOPIC, humidity_payload, qos=1)
+        self.mqtt_client.publish(HUMIDITY_TOPIC, humidity_message.encode(), qos=1, retain=True)
+        MESSAGES_OUT.labels(HUMIDITY_TOPIC).inc()
 
         self.status_label.setText(f"Published: {temp}°C, {humidity}%")
         self.status_label.setStyleSheet("color: green; font-weight: bold;")
 
+    def publish_buffered(self, topic, payload, qos):
+        result = self.mqtt_client.publish(topic, payload, qos=qos)
+        MESSAGES_OUT.labels(topic).inc()
+        return result.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def drain_outbox(self):
+        """Send buffered readings after a reconnect, at most 20 messages per tick"""
+        # Wait until the client is ready: a publish it would buffer itself is also
+        # kept in the outbox and would be sent twice
+        if not self.mqtt_client.is_connected() or not len(self.outbox):
+            return
+        sent = self.outbox.drain(self.publish_buffered, max_batch=20)
+        if sent:
+            print(f"Sent {sent} buffered messages, {len(self.outbox)} remaining")
+
     def manual_send(self):
         temp, humidity = self.get_sensor_data()
         self.publish_data(temp, humidity)
 
     def auto_send(self):
+        if self.room_model is not None:
+            # Step the room model by the (accelerated) interval
+            dt = self.interval_input.value() * self.speed_input.value()
+            temps, humidities = self.room_model.step(dt, self.ac_on)
+            temp, humidity = float(temps[0]), float(humidities[0])
+            self.temp_input.setText(str(temp))
+            self.humidity_input.setText(str(humidity))
+            self.publish_data(temp, humidity)
+            return
+
         # Get current values or generate random ones
         try:
             current_temp = float(self.temp_input.text() or 24.0)
@@ -188,9 +282,12 @@ class DHTEmulator(QMainWindow):
     def closeEvent(self, event):
         print("Shutting down DHT Emulator")
         self.timer.stop()
+        self.drain_timer.stop()
         self.mqtt_client.loop_stop()
         if self.connected:
             self.mqtt_client.disconnect()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         event.accept()
 
 if __name__ == '__main__':
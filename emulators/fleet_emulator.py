@@ -0,0 +1,98 @@
+"""
+Headless fleet of simulated DHT sensors.
+
+All rooms share a few pooled MQTT connections and one network thread,
+and their temperatures come from the vectorized thermal model. A room
+reacts to STATUS_TOPIC messages whose relay_id equals its device id.
+
+Usage:
+    python emulators/fleet_emulator.py --rooms 2000 --connections 4 --interval 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
+                        TEMP_TOPIC, HUMIDITY_TOPIC, STATUS_TOPIC)
+from mqtt_pool import ConnectionPool
+from mqtt_codec import (CodecError, format_timestamp, StatusMessage,
+                        TemperatureMessage, HumidityMessage)
+from emulators.thermal_model import RoomThermalModel
+
+
+class FleetEmulator:
+    """Many simulated sensors multiplexed over a connection pool."""
+
+    def __init__(self, rooms, connections=2, interval=5.0, speed=1.0):
+        self.interval = interval
+        self.speed = speed
+        self.pool = ConnectionPool(BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
+                                   size=connections, role="fleet")
+        self.device_ids = [f"room{i:05d}" for i in range(rooms)]
+        self.devices = [self.pool.device(device_id) for device_id in self.device_ids]
+        self.index = {device_id: i for i, device_id in enumerate(self.device_ids)}
+        self.model = RoomThermalModel(rooms)
+        self.ac_on = np.zeros(rooms, dtype=bool)
+        self.lock = threading.Lock()
+        self.published = 0
+
+        # One subscription for the whole fleet
+        self.devices[0].subscribe(STATUS_TOPIC, self.on_status)
+
+    def on_status(self, device_id, msg):
+        try:
+            message = StatusMessage.decode(msg.payload)
+        except CodecError:
+            return
+        i = self.index.get(message.relay_id)
+        if i is not None:
+            with self.lock:
+                self.ac_on[i] = message.state == "on"
+
+    def tick(self):
+        with self.lock:
+            ac_on = self.ac_on.copy()
+        temps, humidities = self.model.step(self.interval * self.speed, ac_on)
+        timestamp = format_timestamp()
+        for device, temp, humidity in zip(self.devices, temps.tolist(), humidities.tolist()):
+            device.publish(TEMP_TOPIC, TemperatureMessage(
+                value=temp, unit="celsius",
+                sensor_id=device.device_id, timestamp=timestamp).encode())
+            device.publish(HUMIDITY_TOPIC, HumidityMessage(
+                value=humidity, unit="percent",
+                sensor_id=device.device_id, timestamp=timestamp).encode())
+        self.published += 2 * len(self.devices)
+
+    def run(self, duration=None):
+        self.pool.start()
+        start = time.monotonic()
+        next_tick = start
+        try:
+            while duration is None or time.monotonic() - start < duration:
+                self.tick()
+                print(f"Published {self.published} messages from {len(self.devices)} rooms "
+                      f"over {len(self.pool.connections)} connections "
+                      f"({threading.active_count()} threads)")
+                next_tick += self.interval
+                time.sleep(max(0.0, next_tick - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pool.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulated sensor fleet over pooled MQTT connections")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=2)
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between readings")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated seconds per real second")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    args = parser.parse_args()
+
+    FleetEmulator(args.rooms, args.connections, args.interval, args.speed).run(args.duration)
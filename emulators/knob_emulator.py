@@ -1,33 +1,81 @@
 import sys
-import random
-import json
-from datetime import datetime
+import time
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QVBoxLayout,
                             QLabel, QPushButton, QDial)
-from PyQt5.QtCore import Qt
-import paho.mqtt.client as mqtt
+from PyQt5.QtCore import Qt, QTimer
 
 # Update import path to access mqtt_config from parent directory
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
-                        SETPOINT_TOPIC, CLIENT_ID_PREFIX)
+                        SETPOINT_TOPIC)
+from mqtt_pool import make_client_id
+from mqtt_failover import FailoverClient
+from mqtt_codec import SetpointMessage, format_timestamp
+from metrics import MESSAGES_IN, MESSAGES_OUT, RECONNECTS, DISCONNECTS, start_metrics_server
+
+class Debouncer:
+    """
+    Leading/trailing edge debouncer driven by a single-shot QTimer.
+    The first value of a burst is delivered immediately, the last one once
+    the input has been quiet for wait_ms, and at most every max_wait_ms
+    in between while the burst continues.
+    """
+
+    def __init__(self, callback, wait_ms=300, max_wait_ms=1000, parent=None):
+        self.callback = callback
+        self.wait_ms = wait_ms
+        self.max_wait = max_wait_ms / 1000.0
+        self.pending = None
+        self.has_pending = False
+        self.last_emit = 0.0
+        self.timer = QTimer(parent)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def submit(self, value):
+        now = time.monotonic()
+        if not self.timer.isActive():
+            # Leading edge: nothing in flight, deliver right away
+            self.emit(value, now)
+        else:
+            self.pending = value
+            self.has_pending = True
+            # Throttle: long drags still produce periodic updates
+            if now - self.last_emit >= self.max_wait:
+                self.emit(value, now)
+        self.timer.start(self.wait_ms)
+
+    def emit(self, value, now):
+        self.has_pending = False
+        self.last_emit = now
+        self.callback(value)
+
+    def flush(self):
+        """Deliver the trailing value now (called by the timer or on release)"""
+        self.timer.stop()
+        if self.has_pending:
+            self.emit(self.pending, time.monotonic())
+
 
 class KnobEmulator(QMainWindow):
     """Temperature Setpoint Knob Emulator"""
     
-    def __init__(self):
+    def __init__(self, mqtt_client=None):
         super().__init__()
         self.setWindowTitle("Temperature Setpoint Knob")
         self.setGeometry(100, 100, 400, 300)
 
-        # Initialize MQTT Client
-        self.client_id = f"{CLIENT_ID_PREFIX}knob_{random.randint(0, 1000)}"
-        self.mqtt_client = mqtt.Client(client_id=self.client_id)
+        # Initialize MQTT Client (all-in-one mode passes an in-process bus client)
+        self.client_id = make_client_id("knob")
+        if mqtt_client is None:
+            mqtt_client = FailoverClient(client_id=self.client_id)
+        self.mqtt_client = mqtt_client
         
         # Define MQTT callbacks
         def on_message(client, userdata, message):
+            MESSAGES_IN.labels(message.topic).inc()
             print(f"Received message on topic {message.topic}: {message.payload.decode()}")
         
         self.on_message = on_message
@@ -37,6 +85,10 @@ class KnobEmulator(QMainWindow):
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
         self.connected = False
+        self.connect_count = 0
+
+        # Prometheus text endpoint (override with METRICS_PORT, 0 disables)
+        self.metrics_server = start_metrics_server(9110)
 
         # Create main widget and layout
         main_widget = QWidget()
@@ -51,6 +103,13 @@ class KnobEmulator(QMainWindow):
         self.temp_dial.setNotchesVisible(True)
         self.temp_dial.setWrapping(False)
         self.temp_dial.valueChanged.connect(self.on_temp_changed)
+        self.temp_dial.sliderReleased.connect(self.on_dial_released)
+
+        # Coalesce dial movements into one or two setpoint publishes per gesture
+        self.last_published = None
+        self.unsent_setpoint = None  # Dial value set while disconnected
+        self.setpoint_debouncer = Debouncer(self.publish_setpoint, wait_ms=300,
+                                            max_wait_ms=1000, parent=self)
         
         # Add some styling
         self.temp_dial.setStyleSheet("""
@@ -87,50 +146,67 @@ class KnobEmulator(QMainWindow):
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self.connect_count += 1
+            if self.connect_count > 1:
+                RECONNECTS.inc()
             self.status_label.setText("Connected to broker")
             self.status_label.setStyleSheet("color: green; font-weight: bold;")
             print("Knob Emulator connected to broker")
-            # Publish initial setpoint
-            self.publish_setpoint(self.temp_dial.value())
+            if self.unsent_setpoint is not None:
+                # The dial was turned while offline: publish it like any user change
+                self.publish_setpoint(self.unsent_setpoint)
+            elif self.last_published is None:
+                # Initial value, not retained so it never replaces a retained
+                # (e.g. scheduled) setpoint; reconnects publish nothing
+                self.publish_setpoint(self.temp_dial.value(), retain=False)
         else:
             self.status_label.setText(f"Connection failed with code {rc}")
             self.status_label.setStyleSheet("color: red; font-weight: bold;")
 
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
+        DISCONNECTS.inc()
         self.status_label.setText("Disconnected from broker")
         self.status_label.setStyleSheet("color: red;")
         print("Knob Emulator disconnected from broker")
 
     def on_temp_changed(self, value):
         self.temp_label.setText(f"{value}°C")
-        self.publish_setpoint(value)
+        self.setpoint_debouncer.submit(value)
 
-    def publish_setpoint(self, temperature):
+    def on_dial_released(self):
+        # End of the gesture: send the final value without waiting
+        self.setpoint_debouncer.flush()
+
+    def publish_setpoint(self, temperature, retain=True):
         if not self.connected:
+            self.unsent_setpoint = temperature
             self.status_label.setText("Not connected to broker")
             return
+        if temperature == self.last_published and self.unsent_setpoint is None:
+            return
 
-        # Get current timestamp
-        timestamp = datetime.now().isoformat()
-
-        payload = json.dumps({
-            "value": temperature,
-            "unit": "celsius",
-            "controller_id": self.client_id,
-            "timestamp": timestamp
-        })
+        payload = SetpointMessage(value=temperature, unit="celsius",
+                                  controller_id=self.client_id,
+                                  timestamp=format_timestamp()).encode()
         
         print(f"Publishing setpoint: {temperature}°C")
-        self.mqtt_client.publish(SETPOINT_TOPIC, payload, qos=1)
+        # Retained so late subscribers get the current setpoint immediately
+        self.mqtt_client.publish(SETPOINT_TOPIC, payload, qos=1, retain=retain)
+        MESSAGES_OUT.labels(SETPOINT_TOPIC).inc()
+        self.last_published = temperature
+        self.unsent_setpoint = None
         self.status_label.setText(f"Published: {temperature}°C")
         self.status_label.setStyleSheet("color: green;")
 
     def closeEvent(self, event):
         print("Shutting down Knob Emulator")
+        self.setpoint_debouncer.flush()
         self.mqtt_client.loop_stop()
         if self.connected:
             self.mqtt_client.disconnect()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         event.accept()
 
 if __name__ == '__main__':
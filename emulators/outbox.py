@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+from collections import deque
+
+# Compact the backing file once the sent prefix is this large (bytes) and
+# at least half of the file
+COMPACT_BYTES = 1 << 20
+
+
+class Outbox:
+    """
+    Bounded store-and-forward buffer for messages produced while offline.
+    Messages are kept in memory and appended to a JSON-lines file so
+    buffered samples also survive an emulator restart. When full, the
+    oldest messages are dropped first.
+
+    The file is append-only: sent or dropped messages only advance a read
+    offset kept in <path>.offset, and the file is compacted once the
+    consumed prefix passes COMPACT_BYTES, so each message is written about
+    once however long the outage lasts.
+    """
+
+    def __init__(self, path=None, max_messages=10000, compact_bytes=COMPACT_BYTES):
+        self.path = path
+        self.offset_path = path + ".offset" if path else None
+        self.queue = deque()  # (item, size of its line in bytes)
+        self.max_messages = max_messages
+        self.compact_bytes = compact_bytes
+        self.offset = 0  # file position of the first queued message
+        self.size = 0  # bytes in the backing file
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            if os.path.exists(self.offset_path):
+                with open(self.offset_path) as f:
+                    self.offset = int(f.read().strip() or 0)
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if self.offset > len(data):
+                self.offset = 0
+            # Cut a line torn by a crash while appending, so the next append starts clean
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+            self.size = end
+            for line in data[self.offset:end].splitlines(keepends=True):
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    # Count unreadable lines with their neighbour so offsets stay on line boundaries
+                    if self.queue:
+                        last, size = self.queue.pop()
+                        self.queue.append((last, size + len(line)))
+                    else:
+                        self.offset += len(line)
+                    continue
+                self.queue.append((item, len(line)))
+                if len(self.queue) > self.max_messages:
+                    self.offset += self.queue.popleft()[1]
+        except (OSError, ValueError) as e:
+            print(f"Could not load outbox {self.path}: {e}")
+
+    def _save_offset(self):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(self.offset))
+        os.replace(tmp_path, self.offset_path)
+
+    def _consumed(self, save=True):
+        """Account for messages that left the front of the queue (sent or dropped)."""
+        if not self.path:
+            return
+        if not self.queue:
+            # Everything sent: start a fresh file
+            for path in (self.path, self.offset_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.offset = self.size = 0
+        elif self.offset >= self.compact_bytes and self.offset * 2 >= self.size:
+            self._compact()
+        elif save:
+            self._save_offset()
+
+    def _compact(self):
+        """Rewrite the backing file to the messages still queued."""
+        tmp_path = self.path + ".tmp"
+        queue = deque()
+        with open(tmp_path, "wb") as f:
+            for item, _ in self.queue:
+                line = json.dumps(item).encode() + b"\n"
+                f.write(line)
+                queue.append((item, len(line)))
+            size = f.tell()
+        # Offset first: a crash in between re-sends messages instead of losing them
+        self.offset = 0
+        self._save_offset()
+        os.replace(tmp_path, self.path)
+        self.queue, self.size = queue, size
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, topic, payload, qos=1):
+        """Buffer one message; payload is the already-encoded JSON string or bytes."""
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        item = {"topic": topic, "payload": payload, "qos": qos}
+        line = json.dumps(item).encode() + b"\n"
+        with self.lock:
+            if self.path:
+                with open(self.path, "ab") as f:
+                    f.write(line)
+                self.size += len(line)
+            self.queue.append((item, len(line)))
+            if len(self.queue) > self.max_messages:
+                # Dropping the oldest only moves the offset; it is saved with the next drain
+                self.offset += self.queue.popleft()[1]
+                self.dropped += 1
+                self._consumed(save=False)
+
+    def drain(self, publish, max_batch=20):
+        """
+        Publish up to max_batch buffered messages in their original order.
+        publish(topic, payload, qos) must return True on success; draining
+        stops at the first failure and the message stays queued.
+        Returns the number of messages sent.
+        """
+        sent = 0
+        with self.lock:
+            while self.queue and sent < max_batch:
+                item, size = self.queue[0]
+                if not publish(item["topic"], item["payload"], item["qos"]):
+                    break
+                self.queue.popleft()
+                self.offset += size
+                sent += 1
+            if sent:
+                self._consumed()
+        return sent
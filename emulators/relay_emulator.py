@@ -1,10 +1,7 @@
 import sys
-import random
-import json
-from datetime import datetime
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QVBoxLayout,
                             QLabel, QGraphicsDropShadowEffect, QPushButton)
-from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QSize
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QColor
 import paho.mqtt.client as mqtt
 
@@ -13,12 +10,19 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from mqtt_config import (BROKER_IP, BROKER_PORT, USERNAME, PASSWORD,
-                        CONTROL_TOPIC, STATUS_TOPIC, CLIENT_ID_PREFIX)
+                        CONTROL_TOPIC, STATUS_TOPIC)
+from mqtt_pool import make_client_id, device_name
+from mqtt_failover import FailoverClient
+from emulators.outbox import Outbox
+from mqtt_router import TopicRouter, topic_handler
+from metrics import MESSAGES_IN, MESSAGES_OUT, DECODE_ERRORS, RECONNECTS, DISCONNECTS, start_metrics_server
+from mqtt_codec import (CodecError, decode_message, format_timestamp,
+                        ControlMessage, StatusMessage)
 
 class RelayEmulator(QMainWindow):
     """AC Relay Emulator that simulates turning the AC on and off"""
     
-    def __init__(self):
+    def __init__(self, mqtt_client=None):
         super().__init__()
         self.setWindowTitle("AC Relay Status")
         self.setGeometry(100, 100, 350, 450)
@@ -27,15 +31,25 @@ class RelayEmulator(QMainWindow):
         # Initialize state
         self.state = False  # False = OFF, True = ON
         self.animation_running = False  # Track if animation is running
+
+        # State changes made while offline, sent on reconnect
+        self.outbox = Outbox(f"{device_name('relay')}_outbox.jsonl", max_messages=1000)
         
-        # Initialize MQTT Client
-        self.client_id = f"{CLIENT_ID_PREFIX}relay_{random.randint(0, 1000)}"
-        self.mqtt_client = mqtt.Client(client_id=self.client_id)
+        # Initialize MQTT Client (all-in-one mode passes an in-process bus client)
+        self.client_id = make_client_id("relay")
+        if mqtt_client is None:
+            mqtt_client = FailoverClient(client_id=self.client_id)
+        self.mqtt_client = mqtt_client
         self.mqtt_client.username_pw_set(USERNAME, PASSWORD)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
         self.mqtt_client.on_disconnect = self.on_disconnect
         self.connected = False
+        self.connect_count = 0
+        self.router = TopicRouter.from_object(self)
+
+        # Prometheus text endpoint (override with METRICS_PORT, 0 disables)
+        self.metrics_server = start_metrics_server(9111)
 
         # Create main widget and layout
         main_widget = QWidget()
@@ -149,6 +163,11 @@ class RelayEmulator(QMainWindow):
         except Exception as e:
             self.connection_label.setText(f"Connection Error: {str(e)}")
             print(f"Connection Error: {str(e)}")
+
+        # Timer draining the offline buffer in rate-limited batches
+        self.drain_timer = QTimer(self)
+        self.drain_timer.timeout.connect(self.drain_outbox)
+        self.drain_timer.start(500)
             
     def toggle_relay(self):
         """Toggle the relay state when button is clicked"""
@@ -159,18 +178,19 @@ class RelayEmulator(QMainWindow):
             
         # Publish the command
         command = "on" if self.state else "off"
-        payload = json.dumps({
-            "command": command,
-            "timestamp": datetime.now().isoformat()
-        })
+        payload = ControlMessage(command=command, timestamp=format_timestamp()).encode()
         self.mqtt_client.publish(CONTROL_TOPIC, payload, qos=1)
+        MESSAGES_OUT.labels(CONTROL_TOPIC).inc()
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.connected = True
+            self.connect_count += 1
+            if self.connect_count > 1:
+                RECONNECTS.inc()
             self.connection_label.setText("Connected to broker")
             self.connection_label.setStyleSheet("color: #388E3C; font-size: 16px; font-weight: bold;")
-            self.mqtt_client.subscribe([(CONTROL_TOPIC, 1)])
+            self.mqtt_client.subscribe(self.router.subscriptions(1))
             self.toggle_button.setEnabled(True)  # Enable toggle button when connected
             print("Relay Emulator connected to broker")
             # Publish initial state
@@ -181,33 +201,39 @@ class RelayEmulator(QMainWindow):
 
     def on_disconnect(self, client, userdata, rc):
         self.connected = False
+        DISCONNECTS.inc()
         self.connection_label.setText("Disconnected from broker")
         self.connection_label.setStyleSheet("color: #D32F2F; font-size: 16px; font-weight: bold;")
         self.toggle_button.setEnabled(False)  # Disable toggle button when disconnected
         print("Relay Emulator disconnected from broker")
 
     def on_message(self, client, userdata, msg):
+        MESSAGES_IN.labels(msg.topic).inc()
         try:
             print(f"Relay received message on topic {msg.topic}: {msg.payload.decode()}")
-            payload = json.loads(msg.payload.decode())
-            
-            if msg.topic == CONTROL_TOPIC:
-                command = payload.get("command", "").lower()
-                print(f"Relay command received: {command}")
-                
-                if command == "on":
-                    self.set_state(True)
-                    print("Relay turning ON")
-                elif command == "off":
-                    self.set_state(False)
-                    print("Relay turning OFF")
-                else:
-                    print(f"Unknown command: {command}")
-                
+            self.router.dispatch(msg.topic, decode_message(msg.topic, msg.payload))
+        except CodecError as e:
+            DECODE_ERRORS.labels(msg.topic).inc()
+            print(f"Rejected payload on {msg.topic}: {e}")
         except Exception as e:
             print(f"Error processing message: {str(e)}")
 
-    def set_state(self, new_state):
+    @topic_handler(CONTROL_TOPIC)
+    def on_control(self, message):
+        command = message.command
+        command_id = message.command_id
+        print(f"Relay command received: {command}")
+
+        if command == "on":
+            self.set_state(True, command_id)
+            print("Relay turning ON")
+        elif command == "off":
+            self.set_state(False, command_id)
+            print("Relay turning OFF")
+        else:
+            print(f"Unknown command: {command}")
+
+    def set_state(self, new_state, command_id=None):
         """Set relay state and update UI immediately"""
         # Only update if state has changed or no animation is running
         if new_state != self.state or not self.animation_running:
@@ -228,7 +254,10 @@ class RelayEmulator(QMainWindow):
                 self.animate_status_change()
             
             # Publish new state
-            self.publish_state()
+            self.publish_state(command_id)
+        elif command_id:
+            # State unchanged, but the sender still expects an acknowledgement
+            self.publish_state(command_id)
         
     def animate_status_change(self):
         """Animate the status change for visual feedback"""
@@ -237,7 +266,9 @@ class RelayEmulator(QMainWindow):
             return
             
         self.animation_running = True
-            
+        # Animation classes are only needed once the relay switches
+        from PyQt5.QtCore import QPropertyAnimation, QEasingCurve, QSize
+
         # Create animation for smooth transition
         self.animation = QPropertyAnimation(self.status_circle, b"size")
         self.animation.setDuration(150)
@@ -251,6 +282,7 @@ class RelayEmulator(QMainWindow):
         
     def animation_step2(self):
         """Second step of the animation"""
+        from PyQt5.QtCore import QPropertyAnimation, QEasingCurve, QSize
         # Animate back to original size
         self.animation2 = QPropertyAnimation(self.status_circle, b"size")
         self.animation2.setDuration(300)
@@ -264,25 +296,48 @@ class RelayEmulator(QMainWindow):
         """Called when animation sequence is completed"""
         self.animation_running = False
 
-    def publish_state(self):
+    def publish_state(self, command_id=None):
+        status = "on" if self.state else "off"
+        
+        # Echo the correlation id of the command being confirmed
+        state = StatusMessage(state=status, relay_id=self.client_id,
+                              command_id=command_id or None, timestamp=format_timestamp())
+
         if not self.connected:
+            # Keep the transition with its original timestamp until we reconnect
+            state.buffered = True
+            self.outbox.put(STATUS_TOPIC, state.encode())
             return
-            
-        status = "on" if self.state else "off"
+
         print(f"Publishing relay state: {status}")
-        
-        payload = json.dumps({
-            "state": status,
-            "relay_id": self.client_id,
-            "timestamp": datetime.now().isoformat()
-        })
-        self.mqtt_client.publish(STATUS_TOPIC, payload, qos=1)
+        payload = state.encode()
+        # Retained so a restarted manager learns the relay state immediately
+        self.mqtt_client.publish(STATUS_TOPIC, payload, qos=1, retain=True)
+        MESSAGES_OUT.labels(STATUS_TOPIC).inc()
+
+    def publish_buffered(self, topic, payload, qos):
+        result = self.mqtt_client.publish(topic, payload, qos=qos)
+        MESSAGES_OUT.labels(topic).inc()
+        return result.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def drain_outbox(self):
+        """Send buffered state changes after a reconnect, at most 20 messages per tick"""
+        # Wait until the client is ready: a publish it would buffer itself is also
+        # kept in the outbox and would be sent twice
+        if not self.mqtt_client.is_connected() or not len(self.outbox):
+            return
+        sent = self.outbox.drain(self.publish_buffered, max_batch=20)
+        if sent:
+            print(f"Sent {sent} buffered state changes, {len(self.outbox)} remaining")
 
     def closeEvent(self, event):
         print("Shutting down Relay Emulator")
+        self.drain_timer.stop()
         self.mqtt_client.loop_stop()
         if self.connected:
             self.mqtt_client.disconnect()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
         event.accept()
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+"""
+Room thermal simulation for the Smart AC emulators.
+
+First-order model per room: the room relaxes towards the ambient
+temperature with time constant tau, and the AC removes heat at a fixed
+rate while the relay is ON. All rooms are stepped together with NumPy so
+thousands of rooms can be simulated on one machine.
+
+Run as a script for a headless closed-loop benchmark:
+    python emulators/thermal_model.py --rooms 5000 --hours 24
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.control import ControlParams, step_ac_status
+
+SECONDS_PER_DAY = 86400.0
+
+
+class RoomThermalModel:
+    """Vectorized first-order thermal model for one or many rooms."""
+
+    def __init__(self, n_rooms=1, initial_temp=26.0, ambient_mean=30.0, ambient_swing=4.0,
+                 tau=1800.0, cooling_rate=20.0, drift=0.05, noise=0.05,
+                 initial_humidity=55.0, spread=0.2, start_time=0.0, seed=None):
+        """
+        tau          - room time constant in seconds
+        cooling_rate - AC cooling in °C per hour at full power
+        drift        - ambient random-walk step in °C per sqrt(hour)
+        spread       - relative per-room variation of tau and cooling power
+        """
+        self.rng = np.random.default_rng(seed)
+        self.n_rooms = n_rooms
+        self.ambient_mean = ambient_mean
+        self.ambient_swing = ambient_swing
+        self.drift = drift
+        self.noise = noise
+        self.time = start_time
+
+        vary = lambda: 1.0 + spread * self.rng.uniform(-1.0, 1.0, n_rooms)
+        self.tau = tau * vary()
+        self.cooling = (cooling_rate / 3600.0) * vary()  # °C per second
+
+        self.temperature = np.full(n_rooms, float(initial_temp))
+        self.humidity = np.full(n_rooms, float(initial_humidity))
+        self.ambient_offset = np.zeros(n_rooms)
+
+    def ambient(self):
+        """Ambient temperature per room: daily cycle plus a slow random drift."""
+        phase = 2.0 * np.pi * ((self.time % SECONDS_PER_DAY) / SECONDS_PER_DAY - 0.375)
+        return self.ambient_mean + self.ambient_swing * np.sin(phase) + self.ambient_offset
+
+    def step(self, dt, ac_on):
+        """
+        Advance every room by dt seconds with the given relay states.
+        Uses the exact solution of the linear ODE so large steps stay stable.
+        Returns the measured (noisy) temperature and humidity arrays.
+        """
+        ac_on = np.broadcast_to(np.asarray(ac_on, dtype=bool), (self.n_rooms,))
+
+        self.ambient_offset += self.drift * np.sqrt(dt / 3600.0) * self.rng.standard_normal(self.n_rooms)
+        self.ambient_offset *= np.exp(-dt / SECONDS_PER_DAY)
+
+        # Steady state is ambient minus the temperature drop the AC can sustain
+        steady = self.ambient() - np.where(ac_on, self.cooling * self.tau, 0.0)
+        decay = np.exp(-dt / self.tau)
+        self.temperature = steady + (self.temperature - steady) * decay
+
+        # AC dries the air, otherwise humidity drifts back up
+        target_rh = np.where(ac_on, 45.0, 60.0)
+        self.humidity = target_rh + (self.humidity - target_rh) * decay
+
+        self.time += dt
+        return self.measure()
+
+    def measure(self):
+        """Sensor readings with measurement noise, rounded like a DHT sensor."""
+        temp = self.temperature + self.noise * self.rng.standard_normal(self.n_rooms)
+        humidity = self.humidity + 10 * self.noise * self.rng.standard_normal(self.n_rooms)
+        return np.round(temp, 1), np.round(np.clip(humidity, 0.0, 100.0), 1)
+
+
+def simulate_closed_loop(n_rooms=1000, hours=24.0, dt=5.0, setpoint=24.0, params=None, seed=0):
+    """
+    Run the control rules against n_rooms simulated rooms without MQTT.
+    Returns per-fleet stability statistics.
+    """
+    params = params or ControlParams()
+    model = RoomThermalModel(n_rooms, seed=seed)
+    ac_on = np.zeros(n_rooms, dtype=bool)
+    switches = np.zeros(n_rooms, dtype=np.int64)
+    on_steps = np.zeros(n_rooms, dtype=np.int64)
+    error_sq = np.zeros(n_rooms)
+
+    steps = int(hours * 3600.0 / dt)
+    start = time.perf_counter()
+    for _ in range(steps):
+        temp, _ = model.step(dt, ac_on)
+        new_state = step_ac_status(temp, setpoint, ac_on, params)
+        switches += new_state != ac_on
+        ac_on = new_state
+        on_steps += ac_on
+        error_sq += (temp - setpoint) ** 2
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rooms": n_rooms,
+        "steps": steps,
+        "room_steps_per_sec": n_rooms * steps / elapsed if elapsed > 0 else float("inf"),
+        "switches_per_room_hour": float(switches.mean() / hours),
+        "max_switches_per_room_hour": float(switches.max() / hours),
+        "duty_cycle": float(on_steps.mean() / steps),
+        "rms_error": float(np.sqrt(error_sq.mean() / steps)),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Closed-loop thermal simulation benchmark")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--dt", type=float, default=5.0, help="Simulation step in seconds")
+    parser.add_argument("--setpoint", type=float, default=24.0)
+    parser.add_argument("--params", type=ControlParams.parse, default=None,
+                        help="on_delta,off_delta,alert_temp,emergency_temp")
+    args = parser.parse_args()
+
+    stats = simulate_closed_loop(args.rooms, args.hours, args.dt, args.setpoint, args.params)
+    for key, value in stats.items():
+        print(f"{key:>28}: {value:,.3f}" if isinstance(value, float) else f"{key:>28}: {value}")
@@ -0,0 +1,141 @@
+# All-in-one runtime
+"""
+Runs the Data Manager and any of the emulators as windows of one
+QApplication, instead of one Python process per component.
+
+Bus modes:
+    local     in-process message bus (mqtt_bus.py), no broker needed
+    embedded  in-process MQTT broker (mqtt_local.py) that outside
+              devices can also connect to
+    broker    every window keeps its own connection to the configured
+              broker, as in the multi-process setup
+
+Usage:
+    python gui/all_in_one.py
+    python gui/all_in_one.py --components manager,relay --bus embedded --port 1883
+"""
+
+import os
+import sys
+import argparse
+import importlib
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mqtt_bus import LocalBus
+from metrics import start_metrics_server
+
+# Component key -> (module, window class); imported only when started
+COMPONENTS = {
+    "manager": ("data_manager.manager", "DataManager"),
+    "dht": ("emulators.dht_emulator", "DHTEmulator"),
+    "knob": ("emulators.knob_emulator", "KnobEmulator"),
+    "relay": ("emulators.relay_emulator", "RelayEmulator"),
+}
+BUS_MODES = ("local", "embedded", "broker")
+# One endpoint serves the shared registry of every hosted window
+METRICS_PORT = 9108
+
+
+@contextmanager
+def _env(**values):
+    """Temporarily set environment variables."""
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class ComponentHost:
+    """Creates component windows in the running QApplication and owns their shared bus."""
+
+    def __init__(self, bus_mode="local", broker_port=0):
+        if bus_mode not in BUS_MODES:
+            raise ValueError(f"Unknown bus mode '{bus_mode}'")
+        self.bus_mode = bus_mode
+        self.bus = LocalBus().start() if bus_mode == "local" else None
+        self.broker = None
+        self.windows = {}
+
+        if bus_mode == "embedded":
+            # mqtt_config reads the broker address once, on first import
+            if "mqtt_config" in sys.modules:
+                raise RuntimeError("The embedded broker must start before any component is imported")
+            from mqtt_local import LocalBroker
+            self.broker = LocalBroker("127.0.0.1", broker_port).start()
+            os.environ["MQTT_BROKER"] = self.broker.host
+            os.environ["MQTT_PORT"] = str(self.broker.port)
+            print(f"Embedded MQTT broker listening on {self.broker.host}:{self.broker.port}")
+
+        self.metrics_server = start_metrics_server(METRICS_PORT)
+
+    def start(self, key):
+        """Create and show one component window; returns it."""
+        if key in self.windows:
+            return self.windows[key]
+        module_name, class_name = COMPONENTS[key]
+        window_class = getattr(importlib.import_module(module_name), class_name)
+
+        mqtt_client = None
+        if self.bus is not None:
+            from mqtt_pool import make_client_id
+            mqtt_client = self.bus.client(make_client_id(key))
+        # The host already serves the metrics endpoint for every window
+        with _env(METRICS_PORT="0"):
+            window = window_class(mqtt_client=mqtt_client)
+        window.show()
+        self.windows[key] = window
+        return window
+
+    def running(self):
+        return [key for key, window in self.windows.items() if window.isVisible()]
+
+    def stop(self):
+        """Close every window, then the shared bus, broker and metrics endpoint."""
+        for window in self.windows.values():
+            if window.isVisible():
+                window.close()
+        self.windows = {}
+        if self.bus is not None:
+            self.bus.stop()
+        if self.broker is not None:
+            self.broker.stop()
+            self.broker = None
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Smart AC components in one process")
+    parser.add_argument("--components", default=",".join(COMPONENTS),
+                        help="comma-separated subset of: " + ", ".join(COMPONENTS))
+    parser.add_argument("--bus", choices=BUS_MODES, default="local")
+    parser.add_argument("--port", type=int, default=0, help="embedded broker port (0 = any free port)")
+    args, qt_args = parser.parse_known_args(argv)
+
+    keys = [key.strip() for key in args.components.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in COMPONENTS]
+    if unknown or not keys:
+        parser.error(f"unknown components: {', '.join(unknown) or '(none)'}")
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1] + qt_args)
+    app.setStyle('Fusion')
+
+    host = ComponentHost(args.bus, args.port)
+    app.aboutToQuit.connect(host.stop)
+    # Manager first so it is subscribed before the devices publish
+    for key in sorted(keys, key=list(COMPONENTS).index):
+        host.start(key)
+    return app.exec_()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,10 +3,12 @@ import os
 import subprocess
 import time
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QVBoxLayout,
-                             QHBoxLayout, QLabel, QPushButton, QGroupBox)
+                             QHBoxLayout, QLabel, QPushButton, QGroupBox, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QIcon, QFont, QPixmap
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 class ComponentThread(QThread):
     signal = pyqtSignal(str)
     
@@ -51,6 +53,8 @@ class SmartACLauncher(QMainWindow):
         
         # Initialize components
         self.components = []
+        # Hosts in-process components when all-in-one mode is ticked
+        self.host = None
         
         # Setup UI
         self.setup_ui()
@@ -94,10 +98,10 @@ class SmartACLauncher(QMainWindow):
         
         # Add component controls with updated script paths
         components = [
-            {"name": "Data Manager", "script": "data_manager/manager.py", "description": "Central control and data storage"},
-            {"name": "DHT Emulator", "script": "emulators/dht_emulator.py", "description": "Temperature and humidity sensor"},
-            {"name": "Knob Emulator", "script": "emulators/knob_emulator.py", "description": "Temperature setpoint control"},
-            {"name": "Relay Emulator", "script": "emulators/relay_emulator.py", "description": "AC power control relay"}
+            {"name": "Data Manager", "key": "manager", "script": "data_manager/manager.py", "description": "Central control and data storage"},
+            {"name": "DHT Emulator", "key": "dht", "script": "emulators/dht_emulator.py", "description": "Temperature and humidity sensor"},
+            {"name": "Knob Emulator", "key": "knob", "script": "emulators/knob_emulator.py", "description": "Temperature setpoint control"},
+            {"name": "Relay Emulator", "key": "relay", "script": "emulators/relay_emulator.py", "description": "AC power control relay"}
         ]
         
         for component in components:
@@ -105,6 +109,10 @@ class SmartACLauncher(QMainWindow):
             components_layout.addWidget(component_widget)
         
         main_layout.addWidget(components_group)
+
+        # All-in-one: run components as windows of this process on an in-process bus
+        self.all_in_one_check = QCheckBox("All-in-one: run components in this process (no broker needed)")
+        main_layout.addWidget(self.all_in_one_check)
         
         # Action buttons
         action_layout = QHBoxLayout()
@@ -217,11 +225,19 @@ class SmartACLauncher(QMainWindow):
         self.status_log.setText("\n".join(lines))
         
     def start_component(self, component):
-        thread = ComponentThread(component["name"], component["script"])
-        thread.signal.connect(self.log_status)
-        thread.start()
-        
-        component["thread"] = thread
+        if self.all_in_one_check.isChecked():
+            if self.host is None:
+                # Imported on demand: the bus and components are not needed to show the launcher
+                from gui.all_in_one import ComponentHost
+                self.host = ComponentHost("local")
+            self.host.start(component["key"])
+            component["in_process"] = True
+        else:
+            thread = ComponentThread(component["name"], component["script"])
+            thread.signal.connect(self.log_status)
+            thread.start()
+            component["thread"] = thread
+        self.all_in_one_check.setEnabled(False)
         self.components.append(component)
         
         self.log_status(f"Started {component['name']}")
@@ -232,24 +248,27 @@ class SmartACLauncher(QMainWindow):
     def start_all_components(self):
         # Start in correct order with delays
         components = [
-            {"name": "Data Manager", "script": "data_manager/manager.py", "description": "Central control and data storage"},
-            {"name": "DHT Emulator", "script": "emulators/dht_emulator.py", "description": "Temperature and humidity sensor"},
-            {"name": "Knob Emulator", "script": "emulators/knob_emulator.py", "description": "Temperature setpoint control"},
-            {"name": "Relay Emulator", "script": "emulators/relay_emulator.py", "description": "AC power control relay"}
+            {"name": "Data Manager", "key": "manager", "script": "data_manager/manager.py", "description": "Central control and data storage"},
+            {"name": "DHT Emulator", "key": "dht", "script": "emulators/dht_emulator.py", "description": "Temperature and humidity sensor"},
+            {"name": "Knob Emulator", "key": "knob", "script": "emulators/knob_emulator.py", "description": "Temperature setpoint control"},
+            {"name": "Relay Emulator", "key": "relay", "script": "emulators/relay_emulator.py", "description": "AC power control relay"}
         ]
         
         # Disable start button during startup
         self.start_all_btn.setEnabled(False)
         self.start_all_btn.setText("Starting...")
         
+        # In-process windows are ready as soon as they are constructed
+        delays = (0, 0) if self.all_in_one_check.isChecked() else (3, 1)
+
         # Start Data Manager first
         self.start_component(components[0])
-        time.sleep(3)  # Give manager time to initialize
+        time.sleep(delays[0])  # Give manager time to initialize
         
         # Start the rest
         for component in components[1:]:
             self.start_component(component)
-            time.sleep(1)
+            time.sleep(delays[1])
         
         self.log_status("All components started successfully")
         self.start_all_btn.setText("Components Running")
@@ -258,10 +277,15 @@ class SmartACLauncher(QMainWindow):
         for component in self.components:
             if "thread" in component:
                 component["thread"].stop()
+            if "button" in component:
                 component["button"].setText("Start")
                 component["button"].setEnabled(True)
+        if self.host is not None:
+            self.host.stop()
+            self.host = None
         
         self.components = []
+        self.all_in_one_check.setEnabled(True)
         self.log_status("All components stopped")
         
         # Reset buttons
@@ -0,0 +1,345 @@
+# Runtime metrics
+"""
+Lightweight instrumentation for Smart AC Control System.
+
+A Registry holds counters, gauges and histograms (optionally labelled,
+e.g. per topic) and renders them in the Prometheus text format. Each
+process serves its registry from a small local HTTP endpoint:
+
+    curl http://127.0.0.1:9108/metrics
+
+Updating a metric is a dict lookup plus a locked add, cheap enough to
+leave on all the time. Set METRICS_PORT=0 to disable the endpoint.
+"""
+
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def bucket_quantile(buckets, counts, q):
+    """
+    Approximate quantile (0-1) from per-bucket counts, as the upper bound
+    of the bucket holding it; +Inf when it falls in the overflow bucket.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank, seen = q * total, 0
+    for i, n in enumerate(counts):
+        seen += n
+        if seen >= rank and n:
+            return buckets[i] if i < len(buckets) else float("inf")
+    return float("inf")
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+
+class _GaugeValue(_CounterValue):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = float(value)
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "count", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        """Copy of the per-bucket counts, for windowed quantiles."""
+        with self.lock:
+            return list(self.counts)
+
+    def quantile(self, q):
+        """Approximate quantile (0-1) over everything observed so far."""
+        return bucket_quantile(self.buckets, self.snapshot(), q)
+
+
+class _Timer:
+    """Context manager observing the elapsed time into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Metric:
+    """A named metric family; label values select a child holding the value."""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for exposition."""
+        for values, child in list(self.children.items()):
+            yield "", values, (), child.value
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1.0):
+        self.default.inc(amount)
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self.default.set(value)
+
+    def inc(self, amount=1.0):
+        self.default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self.default.dec(amount)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.default.observe(value)
+
+    def time(self):
+        return self.default.time()
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            with child.lock:
+                counts, count, total = list(child.counts), child.count, child.sum
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield "_bucket", values, (("le", _format_value(float(bound))),), cumulative
+            yield "_count", values, (), count
+            yield "_sum", values, (), total
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self, prefix="smart_ac_"):
+        self.prefix = prefix
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        name = self.prefix + name
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type or labels")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for suffix, values, extra, value in metric.samples():
+                labels = _format_labels(metric.labelnames, values, extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by everything in the process
+REGISTRY = Registry()
+
+
+class InstrumentedLock:
+    """threading.Lock that records how long callers waited to acquire it."""
+
+    def __init__(self, wait_histogram):
+        self._lock = threading.Lock()
+        self.wait_histogram = wait_histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        self.wait_histogram.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the console
+        pass
+
+
+class MetricsServer:
+    """Serves a registry at /metrics from a daemon thread."""
+
+    def __init__(self, port, host="127.0.0.1", registry=REGISTRY):
+        handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(default_port, registry=REGISTRY):
+    """
+    Start the endpoint on METRICS_PORT (or default_port).
+    Returns the server, or None when disabled or the port is taken.
+    """
+    port = int(os.environ.get("METRICS_PORT", default_port))
+    if port <= 0:
+        return None
+    try:
+        server = MetricsServer(port, registry=registry)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    print(f"Metrics available at http://127.0.0.1:{server.port}/metrics")
+    return server
+
+
+# Metrics shared by the manager and the emulators
+MESSAGES_IN = REGISTRY.counter("mqtt_messages_received_total", "MQTT messages received", ("topic",))
+MESSAGES_OUT = REGISTRY.counter("mqtt_messages_published_total", "MQTT messages published", ("topic",))
+DECODE_ERRORS = REGISTRY.counter("mqtt_decode_errors_total", "Payloads rejected by the codec", ("topic",))
+DECODE_SECONDS = REGISTRY.histogram("mqtt_decode_seconds", "Time to decode and validate a payload")
+RECONNECTS = REGISTRY.counter("mqtt_reconnects_total", "Connections to the broker after the first one")
+DISCONNECTS = REGISTRY.counter("mqtt_disconnects_total", "Connections to the broker lost")
@@ -0,0 +1,183 @@
+# asyncio MQTT transport
+"""
+asyncio-native MQTT transport for Smart AC Control System.
+
+Drives a paho client from the asyncio event loop through paho's
+external-loop socket callbacks (no loop_start thread). Publish and
+subscribe are awaitable and complete on the broker acknowledgement,
+incoming messages are consumed with `async for`, and leaving the
+`async with` block cancels every background task.
+"""
+
+import asyncio
+import paho.mqtt.client as mqtt
+
+from mqtt_config import KEEP_ALIVE
+
+
+class AsyncMqttClient:
+    """Awaitable publish/subscribe over a paho client driven by asyncio."""
+
+    def __init__(self, client_id, username="", password="", queue_size=10000,
+                 reconnect_delay=1.0, max_reconnect_delay=60.0):
+        self.client = mqtt.Client(client_id=client_id)
+        if username:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self.loop = None
+        self.connected = None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped_messages = 0
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._pending = {}       # mid -> future for PUBACK / SUBACK
+        self._subscriptions = {}  # topic -> qos, replayed after reconnect
+        self._tasks = set()
+        self._closing = False
+
+    # ----- socket callbacks: hook paho into the event loop -----
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    # ----- protocol callbacks (always run on the event loop) -----
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if self.connected is not None and not self.connected.done():
+            if rc == 0:
+                self.connected.set_result(True)
+            else:
+                self.connected.set_exception(ConnectionError(mqtt.connack_string(rc)))
+        if rc == 0 and self._subscriptions:
+            client.subscribe(list(self._subscriptions.items()))
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = self.loop.create_future()
+        if not self._closing:
+            self._spawn(self._reconnect())
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped_messages += 1
+
+    def _resolve(self, mid, result):
+        future = self._pending.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _on_publish(self, client, userdata, mid):
+        self._resolve(mid, mid)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        self._resolve(mid, granted_qos)
+
+    # ----- background tasks -----
+
+    def _spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _misc_loop(self):
+        """Keepalive pings and retry housekeeping."""
+        while True:
+            self.client.loop_misc()
+            await asyncio.sleep(1)
+
+    async def _reconnect(self):
+        delay = self.reconnect_delay
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                self.client.reconnect()
+                return
+            except OSError as e:
+                print(f"MQTT reconnect failed: {e}")
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    # ----- public API -----
+
+    async def connect(self, host, port, keepalive=KEEP_ALIVE, timeout=10.0):
+        """Connect and wait for the CONNACK."""
+        self.loop = asyncio.get_running_loop()
+        self.connected = self.loop.create_future()
+        self._closing = False
+        self.client.connect(host, int(port), keepalive)
+        self._spawn(self._misc_loop())
+        await asyncio.wait_for(asyncio.shield(self.connected), timeout)
+
+    async def publish(self, topic, payload, qos=1, retain=False, timeout=10.0):
+        """Publish and wait until the broker acknowledged it (PUBACK for QoS 1)."""
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and info.rc != mqtt.MQTT_ERR_NO_CONN:
+            raise ConnectionError(mqtt.error_string(info.rc))
+        if info.is_published():
+            return info.mid
+        future = self.loop.create_future()
+        self._pending[info.mid] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(info.mid, None)
+
+    async def subscribe(self, topic, qos=1, timeout=10.0):
+        """Subscribe and wait for the SUBACK; the subscription survives reconnects."""
+        self._subscriptions[topic] = qos
+        rc, mid = self.client.subscribe(topic, qos)
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            # Not connected yet: _on_connect subscribes once the link is up
+            return None
+        future = self.loop.create_future()
+        self._pending[mid] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(mid, None)
+
+    async def messages(self):
+        """Async iterator over incoming messages."""
+        while True:
+            yield await self.queue.get()
+
+    async def disconnect(self):
+        """Disconnect and cancel every background task."""
+        self._closing = True
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
@@ -0,0 +1,227 @@
+# In-process message bus
+"""
+Broker-free message bus for components sharing one process.
+
+In all-in-one mode the manager and the emulators run as windows of a
+single QApplication. Their traffic never needs to leave the process, so
+instead of four broker connections they each get a BusClient: a stand-in
+for the subset of paho.mqtt.client.Client the apps use (connect,
+subscribe, publish, loop_start/loop_stop, disconnect and the v1
+callbacks). Messages are delivered as real paho MQTTMessage objects from
+one dispatcher thread, so callbacks keep running off the UI thread just
+as they do with paho's network thread.
+
+Retained messages and '+'/'#' wildcards behave as on a broker; QoS is
+accepted but every delivery is in-order and lossless.
+"""
+
+import queue
+import threading
+import paho.mqtt.client as mqtt
+
+from mqtt_router import TopicRouter
+
+
+class _PublishInfo:
+    """Mirrors paho's MQTTMessageInfo for callers checking rc or waiting."""
+
+    __slots__ = ("mid", "rc")
+
+    def __init__(self, mid, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.mid = mid
+        self.rc = rc
+
+    def is_published(self):
+        return self.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+    def __str__(self):
+        return str((self.rc, self.mid))
+
+
+class LocalBus:
+    """Routes publishes between BusClients; one dispatcher thread runs every callback."""
+
+    def __init__(self):
+        self.router = TopicRouter()
+        self.retained = {}
+        self.lock = threading.Lock()
+        self.events = queue.Queue()
+        self.thread = None
+        self.delivered = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="mqtt-local-bus", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.events.put(None)
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def client(self, client_id=""):
+        """New paho-compatible client attached to this bus."""
+        return BusClient(self, client_id)
+
+    def run(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            callback, args = event
+            try:
+                callback(*args)
+            except Exception as e:
+                # A failing handler must not stop delivery to the other windows
+                print(f"Bus callback error in {getattr(callback, '__name__', callback)}: {e}")
+
+    def call(self, callback, *args):
+        """Run callback(*args) on the dispatcher thread."""
+        self.events.put((callback, args))
+
+    def subscribe(self, client, topic_filter):
+        with self.lock:
+            self.router.add(topic_filter, client)
+            retained = [(topic, payload) for topic, payload in self.retained.items()
+                        if any(match is client for match, _ in self.router.resolve(topic))]
+        for topic, payload in retained:
+            self.call(client.deliver, topic, payload, True)
+
+    def unsubscribe(self, client, topic_filter):
+        with self.lock:
+            self.router.remove(topic_filter, client)
+
+    def detach(self, client):
+        with self.lock:
+            for topic_filter in list(client.subscriptions):
+                self.router.remove(topic_filter, client)
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            # A client subscribed through overlapping filters gets one copy
+            clients = list({id(client): client for client, _ in self.router.resolve(topic)}.values())
+        for client in clients:
+            self.call(client.deliver, topic, payload, False)
+
+
+class BusClient:
+    """paho Client look-alike bound to a LocalBus; host and port are ignored."""
+
+    def __init__(self, bus, client_id=""):
+        self.bus = bus
+        self._client_id = client_id
+        self.userdata = None
+        self.subscriptions = set()
+        self.connected = False
+        self.looping = False
+        self.next_mid = 0
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+
+    def _mid(self):
+        self.next_mid = self.next_mid % 65535 + 1
+        return self.next_mid
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def connect(self, host=None, port=None, keepalive=60):
+        self.connected = True
+        self.bus.start()
+        if self.looping:
+            self.bus.call(self._connected)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def _connected(self):
+        if self.connected and self.on_connect is not None:
+            self.on_connect(self, self.userdata, {"session present": 0}, 0)
+
+    def reconnect(self):
+        return self.connect()
+
+    def is_connected(self):
+        return self.connected
+
+    def loop_start(self):
+        # Like paho, on_connect fires from the loop once it runs
+        self.looping = True
+        if self.connected:
+            self.bus.call(self._connected)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False):
+        self.looping = False
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        if not self.connected:
+            return mqtt.MQTT_ERR_NO_CONN
+        self.connected = False
+        self.bus.detach(self)
+        self.subscriptions.clear()
+        # paho only reports the disconnect while its loop is running
+        if self.looping and self.on_disconnect is not None:
+            self.bus.call(self.on_disconnect, self, self.userdata, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic, qos=0):
+        """Accepts a filter, a (filter, qos) tuple or a list of them, as paho does."""
+        if isinstance(topic, str):
+            filters = [topic]
+        elif isinstance(topic, tuple):
+            filters = [topic[0]]
+        else:
+            filters = [item[0] for item in topic]
+        if not self.connected:
+            return mqtt.MQTT_ERR_NO_CONN, None
+        for topic_filter in filters:
+            if topic_filter not in self.subscriptions:
+                self.subscriptions.add(topic_filter)
+                self.bus.subscribe(self, topic_filter)
+        return mqtt.MQTT_ERR_SUCCESS, self._mid()
+
+    def unsubscribe(self, topic):
+        for topic_filter in [topic] if isinstance(topic, str) else topic:
+            if topic_filter in self.subscriptions:
+                self.subscriptions.discard(topic_filter)
+                self.bus.unsubscribe(self, topic_filter)
+        return mqtt.MQTT_ERR_SUCCESS, self._mid()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self.connected:
+            return _PublishInfo(self._mid(), mqtt.MQTT_ERR_NO_CONN)
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode("ascii")
+        self.bus.publish(topic, bytes(payload), retain)
+        return _PublishInfo(self._mid())
+
+    def deliver(self, topic, payload, retained):
+        """Dispatcher thread: hand one message to on_message."""
+        if not (self.connected and self.looping) or self.on_message is None:
+            return
+        message = mqtt.MQTTMessage(topic=topic.encode("utf-8"))
+        message.payload = payload
+        message.retain = retained
+        self.bus.delivered += 1
+        self.on_message(self, self.userdata, message)
@@ -0,0 +1,293 @@
+# MQTT payload codec
+"""
+Typed, validated payload codec for Smart AC Control System.
+
+Every topic has a message class describing its fields. Decoding goes
+straight from the raw MQTT bytes to a validated message object and raises
+CodecError for anything malformed, so bad payloads never reach the
+control logic. orjson is used as JSON backend when installed (falling
+back to ujson, then the standard library), and timestamps are formatted
+from a per-second cache instead of a full datetime.isoformat() call.
+
+Microbenchmark against the plain json/dict path:
+    python mqtt_codec.py --count 200000
+"""
+
+import math
+import time
+import json
+import argparse
+from datetime import datetime
+
+from mqtt_config import (TEMP_TOPIC, HUMIDITY_TOPIC, SETPOINT_TOPIC,
+                        CONTROL_TOPIC, STATUS_TOPIC, ALARM_TOPIC, DEBUG_PROFILE_TOPIC)
+
+try:
+    import orjson
+
+    JSON_BACKEND = "orjson"
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    try:
+        import ujson
+
+        JSON_BACKEND = "ujson"
+        _loads = ujson.loads
+
+        def _dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False).encode()
+    except ImportError:
+        JSON_BACKEND = "json"
+        _loads = json.loads
+        _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+        def _dumps(obj):
+            return _encoder.encode(obj).encode()
+
+
+class CodecError(ValueError):
+    """Raised when a payload cannot be decoded or fails validation."""
+
+
+# Per-second cache of the formatted date/time prefix
+_timestamp_cache = (None, "")
+
+
+def format_timestamp(now=None):
+    """ISO-8601 local timestamp with microseconds, same format as datetime.isoformat()."""
+    global _timestamp_cache
+    if now is None:
+        now = time.time()
+    second = int(now)
+    cached_second, prefix = _timestamp_cache
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S")
+        _timestamp_cache = (second, prefix)
+    return f"{prefix}.{int((now - second) * 1e6):06d}"
+
+
+# Field kinds
+NUMBER = "number"
+TEXT = "text"
+FLAG = "flag"
+
+
+class Message:
+    """
+    Base class for typed payloads.
+    FIELDS lists (name, kind, required, allowed) where allowed is a
+    (min, max) range for numbers or a tuple of values for text.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+    TOPIC = None
+
+    def __init__(self, **values):
+        for name, _, _, _ in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name, _, _, _ in self.FIELDS
+                           if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise CodecError(f"{cls.__name__}: payload must be a JSON object")
+        message = cls.__new__(cls)
+        for name, kind, required, allowed in cls.FIELDS:
+            value = data.get(name)
+            if value is None:
+                if required:
+                    raise CodecError(f"{cls.__name__}: missing field '{name}'")
+            elif kind == NUMBER:
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                    raise CodecError(f"{cls.__name__}: '{name}' must be a number, got {value!r}")
+                if allowed and not allowed[0] <= value <= allowed[1]:
+                    raise CodecError(f"{cls.__name__}: '{name}' out of range {allowed}: {value}")
+            elif kind == TEXT:
+                if not isinstance(value, str):
+                    raise CodecError(f"{cls.__name__}: '{name}' must be a string, got {value!r}")
+                if allowed:
+                    value = value.lower()
+                    if value not in allowed:
+                        raise CodecError(f"{cls.__name__}: '{name}' must be one of {allowed}, got {value!r}")
+            elif kind == FLAG:
+                value = bool(value)
+            setattr(message, name, value)
+        return message
+
+    @classmethod
+    def decode(cls, raw):
+        """Decode raw MQTT payload bytes into a validated message."""
+        try:
+            data = _loads(raw)
+        except (ValueError, TypeError) as e:
+            raise CodecError(f"{cls.__name__}: invalid JSON ({e})") from None
+        return cls.from_dict(data)
+
+    def to_dict(self):
+        data = {}
+        for name, _, _, _ in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def encode(self):
+        """Encode to JSON bytes ready for publish()."""
+        return _dumps(self.to_dict())
+
+
+class TemperatureMessage(Message):
+    __slots__ = ("value", "unit", "sensor_id", "timestamp", "buffered")
+    TOPIC = TEMP_TOPIC
+    FIELDS = (
+        ("value", NUMBER, True, (-50.0, 100.0)),
+        ("unit", TEXT, False, None),
+        ("sensor_id", TEXT, False, None),
+        ("timestamp", TEXT, False, None),
+        ("buffered", FLAG, False, None),
+    )
+
+
+class HumidityMessage(Message):
+    __slots__ = ("value", "unit", "sensor_id", "timestamp", "buffered")
+    TOPIC = HUMIDITY_TOPIC
+    FIELDS = (
+        ("value", NUMBER, True, (0.0, 100.0)),
+        ("unit", TEXT, False, None),
+        ("sensor_id", TEXT, False, None),
+        ("timestamp", TEXT, False, None),
+        ("buffered", FLAG, False, None),
+    )
+
+
+class SetpointMessage(Message):
+    __slots__ = ("value", "unit", "controller_id", "timestamp", "buffered")
+    TOPIC = SETPOINT_TOPIC
+    FIELDS = (
+        ("value", NUMBER, True, (5.0, 40.0)),
+        ("unit", TEXT, False, None),
+        ("controller_id", TEXT, False, None),
+        ("timestamp", TEXT, False, None),
+        ("buffered", FLAG, False, None),
+    )
+
+
+class ControlMessage(Message):
+    __slots__ = ("command", "command_id", "timestamp")
+    TOPIC = CONTROL_TOPIC
+    FIELDS = (
+        ("command", TEXT, True, ("on", "off")),
+        ("command_id", TEXT, False, None),
+        ("timestamp", TEXT, False, None),
+    )
+
+
+class StatusMessage(Message):
+    __slots__ = ("state", "relay_id", "command_id", "timestamp", "buffered")
+    TOPIC = STATUS_TOPIC
+    FIELDS = (
+        ("state", TEXT, True, ("on", "off")),
+        ("relay_id", TEXT, False, None),
+        ("command_id", TEXT, False, None),
+        ("timestamp", TEXT, False, None),
+        ("buffered", FLAG, False, None),
+    )
+
+
+class AlarmMessage(Message):
+    __slots__ = ("message", "timestamp")
+    TOPIC = ALARM_TOPIC
+    FIELDS = (
+        ("message", TEXT, True, None),
+        ("timestamp", TEXT, False, None),
+    )
+
+
+class ProfileRequestMessage(Message):
+    __slots__ = ("duration", "mode", "memory", "target", "token")
+    TOPIC = DEBUG_PROFILE_TOPIC
+    FIELDS = (
+        ("duration", NUMBER, False, (0.1, 3600.0)),
+        ("mode", TEXT, False, ("sample", "yappi")),
+        ("memory", FLAG, False, None),
+        ("target", TEXT, False, None),
+        ("token", TEXT, False, None),
+    )
+
+    def __repr__(self):
+        # Requests are logged; never the shared token
+        text = super().__repr__()
+        return text.replace(repr(self.token), "'***'") if self.token else text
+
+
+MESSAGE_TYPES = {cls.TOPIC: cls for cls in (TemperatureMessage, HumidityMessage, SetpointMessage,
+                                            ControlMessage, StatusMessage, AlarmMessage,
+                                            ProfileRequestMessage)}
+
+
+def decode_message(topic, raw):
+    """Decode a payload using the message class registered for its topic."""
+    cls = MESSAGE_TYPES.get(topic)
+    if cls is None:
+        raise CodecError(f"No message type for topic {topic}")
+    return cls.decode(raw)
+
+
+def benchmark(count):
+    """Time decode/encode of a temperature payload: codec vs plain json + dict."""
+    raw = TemperatureMessage(value=23.4, unit="celsius", sensor_id="dht_bench",
+                             timestamp=format_timestamp()).encode()
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(count):
+        payload = json.loads(raw.decode())
+        float(payload.get("value"))
+    results["json decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        TemperatureMessage.decode(raw).value
+    results["codec decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        json.dumps({"value": 23.4, "unit": "celsius", "sensor_id": "dht_bench",
+                    "timestamp": datetime.now().isoformat()})
+    results["json encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        TemperatureMessage(value=23.4, unit="celsius", sensor_id="dht_bench",
+                           timestamp=format_timestamp()).encode()
+    results["codec encode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        datetime.now().isoformat()
+    results["isoformat"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(count):
+        format_timestamp()
+    results["format_timestamp"] = time.perf_counter() - start
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="MQTT payload codec microbenchmark")
+    parser.add_argument("--count", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"JSON backend: {JSON_BACKEND}")
+    for name, elapsed in benchmark(args.count).items():
+        print(f"{name:>18}: {elapsed / args.count * 1e6:7.3f} us/op")
@@ -10,8 +10,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Broker configuration - Using HiveMQ public broker
-BROKER_IP = 'broker.hivemq.com'
-BROKER_PORT = 1883
+# MQTT_BROKER / MQTT_PORT override it, e.g. to use the local stand-in in mqtt_local.py
+BROKER_IP = os.getenv('MQTT_BROKER', 'broker.hivemq.com')
+BROKER_PORT = int(os.getenv('MQTT_PORT', 1883))
 USERNAME = ''  # No authentication needed for public broker
 PASSWORD = ''
 
@@ -25,6 +26,7 @@ SETPOINT_TOPIC = f"{BASE_TOPIC}/setpoint"  # Temperature setpoint from knob
 CONTROL_TOPIC = f"{BASE_TOPIC}/control"    # Control commands to relay
 STATUS_TOPIC = f"{BASE_TOPIC}/status"      # Relay status updates
 ALARM_TOPIC = f"{BASE_TOPIC}/alarm"        # System alarms
+DEBUG_PROFILE_TOPIC = f"{BASE_TOPIC}/debug/profile"  # Runtime profiling requests
 
 # QoS levels
 DEFAULT_QOS = 1  # At least once delivery
@@ -42,11 +44,10 @@ temp_topic = "pr/home/dht_456_YY/temp"  # Define the topic for temperature
 import socket
 
 nb=1 # 0- HIT-"139.162.222.115", 1 - open HiveMQ - broker.hivemq.com
-brokers=[str(socket.gethostbyname('vmm1.saaintertrade.com')), str(socket.gethostbyname('broker.hivemq.com'))]
+broker_hosts = ['vmm1.saaintertrade.com', 'broker.hivemq.com']
 ports = ['80','1883'] # should be modified for HIT
 usernames = ['MATZI',''] # should be modified for HIT
 passwords = ['MATZI',''] # should be modified for HIT
-broker_ip=brokers[nb]
 port=ports[nb]
 username = usernames[nb]
 password = passwords[nb]
@@ -55,10 +56,19 @@ mzs=['matzi/','']
 sub_topics =[mzs[nb]+'#','#']
 pub_topics = [mzs[nb]+'test','test']
 
-broker_ip=brokers[nb]
 broker_port=ports[nb]
 username = usernames[nb]
 password = passwords[nb]
 sub_topic_dynamic = sub_topics[nb]
 pub_topic_dynamic = pub_topics[nb]
 pub_topic = pub_topics[nb]
+
+
+def __getattr__(name):
+    # brokers / broker_ip need DNS lookups: resolve them on first use so that
+    # importing this module never blocks (or fails) on the network
+    if name in ('brokers', 'broker_ip'):
+        resolved = [str(socket.gethostbyname(host)) for host in broker_hosts]
+        globals().update(brokers=resolved, broker_ip=resolved[nb])
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,491 @@
+# MQTT broker failover
+"""
+Health-checked multi-broker connections for the Smart AC apps.
+
+FailoverClient stands in for paho.mqtt.client.Client (the subset the
+apps use, like BusClient in mqtt_bus.py) and owns the connection
+lifecycle instead of paho's fixed-host reconnect loop:
+
+    brokers     MQTT_BROKERS ("host:port,host:port"), or MQTT_BROKER alone,
+                or the default broker followed by the ones listed in
+                mqtt_config (broker_hosts/ports/usernames/passwords)
+    health      a background TCP probe of every broker; unhealthy ones
+                are skipped, and the client fails back to a preferred
+                broker once it has passed several checks in a row
+    reconnect   right after a loss, moving straight on to the next broker
+                after a failed attempt (refused, unreachable or no CONNACK
+                in time); once every broker has failed, jittered
+                exponential backoff before the next round
+    recovery    subscriptions are restored, the app's on_connect runs,
+                then publishes buffered while disconnected are flushed
+                in order (entries older than pending_max_age are dropped)
+
+"Disconnected" is measured from the loss to the next CONNACK and "time to
+recover" until subscriptions and the backlog are restored; both are
+exported as histograms next to failover and health metrics.
+
+Usage (failover drill against two local brokers):
+    python mqtt_failover.py --messages 200
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+import mqtt_config
+from mqtt_config import KEEP_ALIVE
+from metrics import REGISTRY
+
+RECOVERY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+MQTT_FAILOVERS = REGISTRY.counter("mqtt_failovers_total", "Connections to a different broker than the last one",
+                                  ("broker",))
+MQTT_CONNECT_FAILURES = REGISTRY.counter("mqtt_connect_failures_total", "Failed broker connection attempts",
+                                         ("broker",))
+MQTT_DISCONNECTED_SECONDS = REGISTRY.histogram("mqtt_disconnected_seconds",
+                                               "Connection lost until the next CONNACK", buckets=RECOVERY_BUCKETS)
+MQTT_RECOVERY_SECONDS = REGISTRY.histogram("mqtt_time_to_recover_seconds",
+                                           "Connection lost until resubscribed and backlog flushed",
+                                           buckets=RECOVERY_BUCKETS)
+MQTT_BROKER_UP = REGISTRY.gauge("mqtt_broker_up", "Result of the last health check", ("broker",))
+MQTT_BROKER_CONNECT_SECONDS = REGISTRY.gauge("mqtt_broker_connect_seconds", "TCP connect time of the last health check",
+                                             ("broker",))
+MQTT_PENDING = REGISTRY.gauge("mqtt_pending_publishes", "Publishes buffered while disconnected")
+MQTT_PENDING_DROPPED = REGISTRY.counter("mqtt_pending_dropped_total", "Buffered publishes dropped (full or too old)")
+
+# Backoff after a round in which every broker failed: min(BACKOFF_MAX, BACKOFF_BASE * 2^n), half jittered (seconds)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# TCP connected but no CONNACK within this time counts as a failed attempt
+CONNECT_TIMEOUT = 5.0
+# Broker health probe period and timeout, and passes needed before failing back
+HEALTH_INTERVAL = 30.0
+HEALTH_TIMEOUT = 2.0
+FAILBACK_CHECKS = 2
+# Publishes kept while disconnected, and how old they may get before being dropped
+MAX_PENDING = 1000
+PENDING_MAX_AGE = 60.0
+# Network loop wait per iteration
+LOOP_TIMEOUT = 0.2
+
+
+class Broker:
+    """One configured broker and its last health state."""
+
+    __slots__ = ("host", "port", "username", "password", "healthy", "passes")
+
+    def __init__(self, host, port, username="", password=""):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.healthy = None  # unknown until checked or tried
+        self.passes = 0
+
+    @property
+    def label(self):
+        return f"{self.host}:{self.port}"
+
+    def __repr__(self):
+        return f"Broker({self.label})"
+
+
+def parse_brokers(text, username="", password=""):
+    """'host:port,host:port' -> [Broker]; the port defaults to 1883."""
+    brokers = []
+    for item in (part.strip() for part in text.split(",")):
+        if item:
+            host, _, port = item.rpartition(":") if ":" in item else (item, "", "1883")
+            brokers.append(Broker(host, port or 1883, username, password))
+    return brokers
+
+
+def configured_brokers(host, port, username="", password=""):
+    """Broker list in priority order for a client told to connect to host:port."""
+    if os.getenv("MQTT_BROKERS"):
+        return parse_brokers(os.environ["MQTT_BROKERS"], username, password)
+    brokers = [Broker(host, port, username, password)]
+    if os.getenv("MQTT_BROKER"):
+        # An explicit single broker (e.g. the local stand-in) never fails over to public ones
+        return brokers
+    for index, other in enumerate(mqtt_config.broker_hosts):
+        candidate = Broker(other, mqtt_config.ports[index], mqtt_config.usernames[index],
+                           mqtt_config.passwords[index])
+        if all(candidate.label != broker.label for broker in brokers):
+            brokers.append(candidate)
+    return brokers
+
+
+def probe(broker, timeout=HEALTH_TIMEOUT):
+    """TCP connect time in seconds, or None if the broker is unreachable."""
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((broker.host, broker.port), timeout=timeout):
+            return time.perf_counter() - start
+    except OSError:
+        return None
+
+
+def backoff_delay(rounds, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Equal jitter: half of the exponential delay is fixed, half random."""
+    delay = min(cap, base * 2 ** max(rounds - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _normalize(topic, qos):
+    if isinstance(topic, str):
+        return [(topic, qos)]
+    if isinstance(topic, tuple):
+        return [topic]
+    return list(topic)
+
+
+class FailoverClient:
+    """paho Client look-alike that connects to the healthiest configured broker and fails over."""
+
+    def __init__(self, client_id="", brokers=None, keepalive=KEEP_ALIVE, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, health_interval=HEALTH_INTERVAL, max_pending=MAX_PENDING,
+                 pending_max_age=PENDING_MAX_AGE):
+        self.client_id = client_id
+        self.brokers = brokers
+        self.keepalive = keepalive
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_interval = health_interval
+        self.pending_max_age = pending_max_age
+        self.username = ""
+        self.password = ""
+
+        # Application callbacks (paho v1 signatures, called with this object as client)
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+        self.client = mqtt.Client(client_id=client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        # With a write callback set, paho only queues packets from other threads; run() writes them
+        self.client.on_socket_register_write = self._write_queued
+        self.client.on_socket_unregister_write = self._write_queued
+
+        self.lock = threading.Lock()
+        self.subscriptions = {}  # topic -> qos, restored on every connect
+        self.pending = deque(maxlen=max_pending)  # (queued at, topic, payload, qos, retain)
+        self.ready = False  # connected, resubscribed and flushed
+        self.session_up = False
+        self.stopping = False
+        self.current = None  # broker of the current or last attempt
+        self.last_broker = None  # broker of the last successful connection
+        self.attempt_started = None
+        self.rounds = 0  # consecutive rounds in which every broker failed
+        self.tried = set()  # brokers failed in the current round
+        self.down_since = None
+        self.switch_requested = False
+        self.resubscribed = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.health_thread = None
+        self.last_recovery = None  # (disconnected seconds, time to recover)
+
+    # paho-compatible surface
+
+    def username_pw_set(self, username, password=None):
+        self.username = username or ""
+        self.password = password or ""
+
+    def connect(self, host, port=1883, keepalive=KEEP_ALIVE):
+        """Set the preferred broker; the connection itself is made by loop_start()."""
+        self.keepalive = keepalive
+        if self.brokers is None:
+            self.brokers = configured_brokers(host, port, self.username, self.password)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        if self.brokers is None:
+            raise RuntimeError("connect() must be called before loop_start()")
+        if self.thread is not None:
+            return mqtt.MQTT_ERR_INVAL
+        self.stopping = False
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f"mqtt-failover-{self.client_id}", daemon=True)
+        self.thread.start()
+        if len(self.brokers) > 1:
+            self.health_thread = threading.Thread(target=self.health_loop, name="mqtt-health", daemon=True)
+            self.health_thread.start()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False):
+        self.stopping = True
+        self.stop_event.set()
+        for thread in (self.thread, self.health_thread):
+            if thread is not None:
+                thread.join(timeout=5)
+        self.thread = self.health_thread = None
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        self.stopping = True
+        with self.lock:
+            self.ready = False
+        rc = self.client.disconnect()
+        if self.thread is None and self.client.socket() is not None:
+            # No network loop running (loop_stop() came first): send the DISCONNECT here
+            self.client.loop_write()
+        return rc
+
+    def is_connected(self):
+        return self.ready
+
+    def subscribe(self, topic, qos=0):
+        entries = _normalize(topic, qos)
+        with self.lock:
+            for name, entry_qos in entries:
+                self.subscriptions[name] = entry_qos
+                self.resubscribed.add(name)
+        if self.session_up:
+            return self.client.subscribe(entries)
+        return mqtt.MQTT_ERR_NO_CONN, None
+
+    def unsubscribe(self, topic):
+        topics = [topic] if isinstance(topic, str) else list(topic)
+        with self.lock:
+            for name in topics:
+                self.subscriptions.pop(name, None)
+        if self.session_up:
+            return self.client.unsubscribe(topics)
+        return mqtt.MQTT_ERR_NO_CONN, None
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        """Publish now, or buffer until the next connection is restored (rc MQTT_ERR_NO_CONN, as paho)."""
+        with self.lock:
+            if self.ready:
+                return self.client.publish(topic, payload, qos, retain)
+            if len(self.pending) == self.pending.maxlen:
+                MQTT_PENDING_DROPPED.inc()
+            self.pending.append((time.monotonic(), topic, payload, qos, retain))
+            MQTT_PENDING.set(len(self.pending))
+        info = mqtt.MQTTMessageInfo(0)
+        info.rc = mqtt.MQTT_ERR_NO_CONN
+        return info
+
+    # Connection supervision
+
+    def run(self):
+        """Network loop plus reconnect/failover; the only thread touching the socket."""
+        while not self.stop_event.is_set():
+            if self.switch_requested and self.session_up:
+                self.switch_requested = False
+                self.client.disconnect()
+            if self.client.socket() is None:
+                if self.stopping:
+                    self.stop_event.wait(LOOP_TIMEOUT)
+                elif len(self.tried) >= len(self.brokers):
+                    self.rounds += 1
+                    self.tried.clear()
+                    self.stop_event.wait(backoff_delay(self.rounds, self.backoff_base, self.backoff_max))
+                else:
+                    self.attempt()
+                continue
+            self.client.loop(timeout=LOOP_TIMEOUT)
+            if (not self.session_up and self.attempt_started is not None
+                    and time.monotonic() - self.attempt_started > CONNECT_TIMEOUT):
+                self.failed(self.current, "no CONNACK")
+                self.client.disconnect()
+                self.client.loop(timeout=0)
+
+    @staticmethod
+    def _write_queued(client, userdata, sock):
+        """Socket write interest callback: nothing to do, run() polls for writes."""
+
+    def choose(self):
+        """First broker in priority order not yet tried this round, preferring healthy ones."""
+        untried = [broker for broker in self.brokers if broker not in self.tried]
+        return next((broker for broker in untried if broker.healthy is not False), untried[0])
+
+    def attempt(self):
+        broker = self.choose()
+        self.current = broker
+        self.client.username_pw_set(broker.username or self.username, broker.password or self.password)
+        try:
+            self.client.connect(broker.host, broker.port, self.keepalive)
+        except (OSError, ValueError) as e:
+            self.failed(broker, e)
+            return
+        self.attempt_started = time.monotonic()
+
+    def failed(self, broker, reason):
+        MQTT_CONNECT_FAILURES.labels(broker.label).inc()
+        broker.healthy = False
+        broker.passes = 0
+        self.tried.add(broker)
+        self.attempt_started = None
+        print(f"MQTT connection to {broker.label} failed ({reason})")
+
+    def _on_connect(self, client, userdata, flags, rc):
+        broker = self.current
+        if rc != mqtt.CONNACK_ACCEPTED:
+            self.failed(broker, mqtt.connack_string(rc))
+            if self.on_connect is not None:
+                self.on_connect(self, userdata, flags, rc)
+            client.disconnect()
+            return
+
+        connected_at = time.monotonic()
+        previous, self.last_broker = self.last_broker, broker
+        self.session_up = True
+        self.attempt_started = None
+        self.rounds = 0
+        self.tried.clear()
+        broker.healthy = True
+        if previous is not None and previous is not broker:
+            MQTT_FAILOVERS.labels(broker.label).inc()
+            print(f"MQTT failover: {previous.label} -> {broker.label}")
+
+        # The app's on_connect usually subscribes itself; restore whatever it does not
+        with self.lock:
+            self.resubscribed = set()
+        if self.on_connect is not None:
+            self.on_connect(self, userdata, flags, rc)
+        with self.lock:
+            missing = [(topic, qos) for topic, qos in self.subscriptions.items() if topic not in self.resubscribed]
+        if missing:
+            client.subscribe(missing)
+
+        flushed, dropped = self.flush()
+        if self.down_since is not None:
+            down = connected_at - self.down_since
+            recovered = time.monotonic() - self.down_since
+            MQTT_DISCONNECTED_SECONDS.observe(down)
+            MQTT_RECOVERY_SECONDS.observe(recovered)
+            self.last_recovery = (down, recovered)
+            self.down_since = None
+            print(f"MQTT recovered on {broker.label}: disconnected {down:.2f}s, recovered in {recovered:.2f}s, "
+                  f"{flushed} buffered publishes sent" + (f", {dropped} too old" if dropped else ""))
+
+    def flush(self):
+        """Send buffered publishes in order and open the gate for direct publishing."""
+        now = time.monotonic()
+        sent = dropped = 0
+        with self.lock:
+            while self.pending:
+                queued_at, topic, payload, qos, retain = self.pending.popleft()
+                if now - queued_at > self.pending_max_age:
+                    dropped += 1
+                    continue
+                self.client.publish(topic, payload, qos, retain)
+                sent += 1
+            self.ready = True
+            MQTT_PENDING.set(0)
+        if dropped:
+            MQTT_PENDING_DROPPED.inc(dropped)
+        return sent, dropped
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self.lock:
+            self.ready = False
+        if not self.session_up:
+            return  # a failed attempt, not a lost connection
+        self.session_up = False
+        if not self.stopping and self.down_since is None:
+            self.down_since = time.monotonic()
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, userdata, rc)
+
+    def _on_message(self, client, userdata, message):
+        if self.on_message is not None:
+            self.on_message(self, userdata, message)
+
+    # Health checks
+
+    def health_loop(self):
+        while not self.stop_event.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        """Probe every broker; request a fail back once a preferred one keeps passing."""
+        for broker in self.brokers:
+            elapsed = probe(broker)
+            broker.healthy = elapsed is not None
+            broker.passes = broker.passes + 1 if broker.healthy else 0
+            MQTT_BROKER_UP.labels(broker.label).set(1 if broker.healthy else 0)
+            if elapsed is not None:
+                MQTT_BROKER_CONNECT_SECONDS.labels(broker.label).set(elapsed)
+
+        current = self.current
+        if self.ready and current in self.brokers:
+            preferred = self.brokers[:self.brokers.index(current)]
+            target = next((broker for broker in preferred if broker.passes >= FAILBACK_CHECKS), None)
+            if target is not None:
+                print(f"MQTT failing back from {current.label} to {target.label}")
+                self.switch_requested = True
+
+
+def drill(messages, interval):
+    """Publish through one FailoverClient while its broker is stopped; report loss and recovery."""
+    from mqtt_local import LocalBroker
+
+    primary, secondary = LocalBroker().start(), LocalBroker().start()
+    brokers = [Broker(primary.host, primary.port), Broker(secondary.host, secondary.port)]
+    received = []
+    # Brokers share no sessions: what is published while the subscriber is between brokers is lost to it
+    unsubscribed = set()
+    connected = threading.Event()
+
+    subscriber = FailoverClient("drill_sub", brokers=[Broker(b.host, b.port) for b in brokers], health_interval=0.5)
+    subscriber.on_message = lambda client, userdata, msg: received.append(int(msg.payload))
+    subscriber.on_connect = lambda client, userdata, flags, rc: rc == 0 and connected.set()
+    subscriber.subscribe("drill/#", 1)
+    subscriber.connect(primary.host, primary.port)
+    subscriber.loop_start()
+    publisher = FailoverClient("drill_pub", brokers=brokers, health_interval=0.5)
+    publisher.connect(primary.host, primary.port)
+    publisher.loop_start()
+    connected.wait(5)
+    while not (subscriber.is_connected() and publisher.is_connected()):
+        time.sleep(0.01)
+    time.sleep(0.2)  # let the SUBSCRIBE reach the broker before the first publish
+
+    try:
+        for i in range(messages):
+            if i == messages // 3:
+                print("Stopping the primary broker")
+                primary.stop()
+            if i >= messages // 3 and subscriber.last_recovery is None:
+                unsubscribed.add(i)
+            publisher.publish("drill/seq", str(i), qos=1)
+            time.sleep(interval)
+        deadline = time.monotonic() + 10
+        while len(set(received)) < messages and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        subscriber.loop_stop()
+        subscriber.disconnect()
+        secondary.stop()
+
+    missing = sorted(set(range(messages)) - set(received))
+    lost = [i for i in missing if i not in unsubscribed]
+    for name, client in (("publisher", publisher), ("subscriber", subscriber)):
+        if client.last_recovery:
+            down, recovered = client.last_recovery
+            print(f"{name}: disconnected {down:.2f}s, time to recover {recovered:.2f}s")
+    print(f"{len(set(received))}/{messages} delivered, {len(received) - len(set(received))} duplicates, "
+          f"missing {missing[:10]}{'...' if len(missing) > 10 else ''} "
+          f"({len(missing) - len(lost)} published while the subscriber was between brokers)")
+    return not lost
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Broker failover drill with two local brokers")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between publishes")
+    args = parser.parse_args()
+    sys.exit(0 if drill(args.messages, args.interval) else 1)
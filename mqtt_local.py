@@ -0,0 +1,286 @@
+# Local MQTT broker stand-in
+"""
+Minimal in-process MQTT 3.1.1 broker for offline runs and soak tests.
+
+Supports what the Smart AC apps use: CONNECT, PUBLISH with QoS 0/1,
+retained messages, SUBSCRIBE/UNSUBSCRIBE with '+'/'#' wildcards, PING
+and DISCONNECT. QoS 2 subscriptions are granted as QoS 1 and there is no
+persistent session state. One thread serves every client through a
+selector, so unmodified paho clients can connect to it.
+
+Usage:
+    python mqtt_local.py --port 1883
+    MQTT_BROKER=127.0.0.1 MQTT_PORT=1883 python data_manager/manager.py
+"""
+
+import time
+import socket
+import struct
+import argparse
+import selectors
+import threading
+
+from paho.mqtt.client import topic_matches_sub
+
+# Packet types
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def _encode_length(length):
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _packet(first_byte, body):
+    return bytes((first_byte,)) + _encode_length(len(body)) + body
+
+
+def _string(data, offset):
+    (length,) = struct.unpack_from("!H", data, offset)
+    start = offset + 2
+    return data[start:start + length].decode("utf-8"), start + length
+
+
+class _Session:
+    __slots__ = ("sock", "inbuf", "outbuf", "client_id", "subscriptions", "next_id", "closed")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.client_id = None
+        self.subscriptions = {}  # filter -> granted qos
+        self.next_id = 0
+        self.closed = False
+
+    def packet_id(self):
+        self.next_id = self.next_id % 65535 + 1
+        return self.next_id
+
+
+class LocalBroker:
+    """Single-threaded MQTT broker on a local TCP port."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.listener = socket.create_server((host, port))
+        self.listener.setblocking(False)
+        self.host = host
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        self.sessions = {}
+        self.retained = {}
+        self.running = False
+        self.thread = None
+        self.received = 0
+        self.delivered = 0
+        # client id -> perf_counter() of its latest CONNECT, for startup timing
+        self.connect_times = {}
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name="mqtt-local-broker", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        for session in list(self.sessions.values()):
+            self.close(session)
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        self.selector.close()
+
+    def serve(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.2):
+                if key.data is None:
+                    self.accept()
+                    continue
+                session = key.data
+                if events & selectors.EVENT_READ:
+                    self.read(session)
+                if events & selectors.EVENT_WRITE and not session.closed:
+                    self.flush(session)
+
+    def accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = _Session(sock)
+        self.sessions[sock] = session
+        self.selector.register(sock, selectors.EVENT_READ, session)
+
+    def read(self, session):
+        try:
+            data = session.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.close(session)
+            return
+        session.inbuf += data
+        while not session.closed:
+            packet = self.next_packet(session.inbuf)
+            if packet is None:
+                break
+            first_byte, body = packet
+            self.handle(session, first_byte >> 4, first_byte & 0x0F, body)
+        self.flush(session)
+
+    @staticmethod
+    def next_packet(buf):
+        """Remove and return (first byte, body) of the next complete packet in buf, or None."""
+        length, multiplier, pos = 0, 1, 1
+        while True:
+            if pos >= len(buf):
+                return None
+            byte = buf[pos]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            pos += 1
+            if not byte & 0x80:
+                break
+        if len(buf) < pos + length:
+            return None
+        first_byte = buf[0]
+        body = bytes(buf[pos:pos + length])
+        del buf[:pos + length]
+        return first_byte, body
+
+    def handle(self, session, packet_type, flags, body):
+        if packet_type == CONNECT:
+            _, offset = _string(body, 0)
+            offset += 4  # level, flags, keep alive
+            client_id, _ = _string(body, offset)
+            # A reconnecting client id takes over the old session
+            for other in list(self.sessions.values()):
+                if other is not session and other.client_id == client_id and client_id:
+                    self.close(other)
+            session.client_id = client_id
+            self.connect_times[client_id] = time.perf_counter()
+            self.send(session, _packet(CONNACK << 4, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            retain = bool(flags & 0x01)
+            topic, offset = _string(body, 0)
+            if qos:
+                (packet_id,) = struct.unpack_from("!H", body, offset)
+                offset += 2
+                self.send(session, _packet(PUBACK << 4, struct.pack("!H", packet_id)))
+            payload = body[offset:]
+            self.received += 1
+            if retain:
+                if payload:
+                    self.retained[topic] = (payload, min(qos, 1))
+                else:
+                    self.retained.pop(topic, None)
+            self.route(topic, payload, min(qos, 1))
+        elif packet_type == SUBSCRIBE:
+            (packet_id,) = struct.unpack_from("!H", body, 0)
+            offset, granted, new_filters = 2, bytearray(), []
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                qos = min(body[offset], 1)
+                offset += 1
+                session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                new_filters.append((topic_filter, qos))
+            self.send(session, _packet(SUBACK << 4, struct.pack("!H", packet_id) + bytes(granted)))
+            for topic, (payload, qos) in list(self.retained.items()):
+                for topic_filter, granted_qos in new_filters:
+                    if topic_matches_sub(topic_filter, topic):
+                        self.deliver(session, topic, payload, min(qos, granted_qos), retain=True)
+                        break
+        elif packet_type == UNSUBSCRIBE:
+            (packet_id,) = struct.unpack_from("!H", body, 0)
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                session.subscriptions.pop(topic_filter, None)
+            self.send(session, _packet(UNSUBACK << 4, struct.pack("!H", packet_id)))
+        elif packet_type == PINGREQ:
+            self.send(session, _packet(PINGRESP << 4, b""))
+        elif packet_type == DISCONNECT:
+            self.close(session)
+        # PUBACKs from subscribers need no action: QoS 1 is not retransmitted
+
+    def route(self, topic, payload, qos):
+        for session in list(self.sessions.values()):
+            granted = None
+            for topic_filter, sub_qos in session.subscriptions.items():
+                if topic_matches_sub(topic_filter, topic):
+                    granted = sub_qos if granted is None else max(granted, sub_qos)
+            if granted is not None:
+                self.deliver(session, topic, payload, min(qos, granted))
+
+    def deliver(self, session, topic, payload, qos, retain=False):
+        encoded = topic.encode("utf-8")
+        body = struct.pack("!H", len(encoded)) + encoded
+        if qos:
+            body += struct.pack("!H", session.packet_id())
+        self.send(session, _packet((PUBLISH << 4) | (qos << 1) | int(retain), body + payload))
+        self.delivered += 1
+
+    def send(self, session, data):
+        if not session.closed:
+            idle = not session.outbuf
+            session.outbuf += data
+            if len(session.outbuf) > 65536:
+                self.flush(session)
+            elif idle:
+                # Wake the select loop for this socket, not only for the sender's
+                self.selector.modify(session.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, session)
+
+    def flush(self, session):
+        if session.closed:
+            return
+        try:
+            if session.outbuf:
+                sent = session.sock.send(session.outbuf)
+                del session.outbuf[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.close(session)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if session.outbuf else 0)
+        self.selector.modify(session.sock, events, session)
+
+    def close(self, session):
+        if session.closed:
+            return
+        session.closed = True
+        self.sessions.pop(session.sock, None)
+        try:
+            self.selector.unregister(session.sock)
+        except (KeyError, ValueError):
+            pass
+        session.sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local MQTT broker stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    broker = LocalBroker(args.host, args.port).start()
+    print(f"Local MQTT broker listening on {broker.host}:{broker.port}")
+    try:
+        broker.thread.join()
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,244 @@
+# MQTT connection pooling
+"""
+Shared MQTT connections for many logical devices.
+
+A ConnectionPool owns a handful of paho clients and drives all of them
+from a single I/O thread (select() over their sockets), so simulating N
+devices no longer costs N sockets and N network threads. Each
+LogicalDevice is pinned to one pooled connection, which keeps its
+messages in order. Reconnects run on short-lived threads with a
+per-connection backoff, so one unreachable connection never stalls the
+others.
+"""
+
+import os
+import time
+import socket
+import select
+import zlib
+import threading
+import paho.mqtt.client as mqtt
+
+from mqtt_config import CLIENT_ID_PREFIX, KEEP_ALIVE
+from mqtt_router import TopicRouter
+
+
+def _alnum(text, limit):
+    return "".join(ch for ch in text if ch.isalnum())[:limit]
+
+
+def device_name(role, index=None):
+    """
+    Stable device name <role>_<host>[_<instance>][_<index>], the same on
+    every start. DEVICE_NAME (alphanumeric) names the instance when one
+    host runs several processes of a role; index numbers pooled
+    connections. Used for client ids, sensor ids and per-device files.
+    """
+    name = f"{role}_{_alnum(socket.gethostname(), 32) or 'host'}"
+    instance = _alnum(os.environ.get("DEVICE_NAME", ""), 32)
+    if instance:
+        name += f"_{instance}"
+    if index is not None:
+        name += f"_{index}"
+    return name
+
+
+def make_client_id(role, index=None):
+    """
+    Deterministic client id: CLIENT_ID_PREFIX + device_name(role, index).
+    A restart reuses the id, which keeps broker sessions and sensor ids
+    continuous; processes sharing a host and role need distinct DEVICE_NAMEs.
+    """
+    return CLIENT_ID_PREFIX + device_name(role, index)
+
+
+class PooledConnection:
+    """One paho client in the pool plus the subscriptions routed through it."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.client_id = make_client_id(pool.role, index)
+        self.client = mqtt.Client(client_id=self.client_id)
+        if pool.username:
+            self.client.username_pw_set(pool.username, pool.password)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.connected = False
+        self.reconnecting = False  # a reconnect thread owns the client until it returns
+        self.next_retry = 0.0
+        self.retry_delay = 1.0
+        # Topic pattern -> list of (device_id, callback)
+        self.subscriptions = {}
+        self.router = TopicRouter()
+        self.lock = threading.Lock()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"Pool connection {self.client_id} failed with code {rc}")
+            return
+        self.connected = True
+        self.retry_delay = 1.0
+        with self.lock:
+            patterns = list(self.subscriptions)
+        if patterns:
+            client.subscribe([(pattern, 1) for pattern in patterns])
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        self.next_retry = time.monotonic() + self.retry_delay
+
+    def on_message(self, client, userdata, msg):
+        with self.lock:
+            targets = [list(self.subscriptions[pattern]) for pattern, _ in self.router.resolve(msg.topic)]
+        for callbacks in targets:
+            for device_id, callback in callbacks:
+                try:
+                    callback(device_id, msg)
+                except Exception as e:
+                    print(f"Error in handler for {device_id}: {e}")
+
+    def subscribe(self, pattern, device_id, callback, qos=1):
+        with self.lock:
+            callbacks = self.subscriptions.setdefault(pattern, [])
+            first = not callbacks
+            callbacks.append((device_id, callback))
+            if first:
+                self.router.add(pattern, pattern)
+        # One broker subscription serves every device using the pattern
+        if first and self.connected:
+            self.client.subscribe(pattern, qos)
+
+    def unsubscribe_device(self, device_id):
+        with self.lock:
+            for pattern in list(self.subscriptions):
+                remaining = [entry for entry in self.subscriptions[pattern] if entry[0] != device_id]
+                if remaining:
+                    self.subscriptions[pattern] = remaining
+                else:
+                    del self.subscriptions[pattern]
+                    self.router.remove(pattern, pattern)
+                    if self.connected:
+                        self.client.unsubscribe(pattern)
+
+
+class ConnectionPool:
+    """A few MQTT connections shared by many logical devices, one I/O thread for all."""
+
+    def __init__(self, host, port, username="", password="", size=2, role="pool"):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.role = role
+        self.connections = [PooledConnection(self, i) for i in range(size)]
+        self.devices = {}
+        self.running = False
+        self.thread = None
+
+    def device(self, device_id):
+        """Return the logical device handle for device_id, creating it on first use."""
+        device = self.devices.get(device_id)
+        if device is None:
+            # Stable hash so a device always uses the same connection
+            index = zlib.crc32(device_id.encode()) % len(self.connections)
+            device = LogicalDevice(self, device_id, self.connections[index])
+            self.devices[device_id] = device
+        return device
+
+    def start(self):
+        """Start the shared I/O thread; it connects every pooled client in the background."""
+        for conn in self.connections:
+            conn.client.connect_async(self.host, self.port, KEEP_ALIVE)
+        self.running = True
+        self.thread = threading.Thread(target=self.io_loop, name=f"mqtt-pool-{self.role}", daemon=True)
+        self.thread.start()
+
+    def io_loop(self):
+        """Single network loop for all pooled connections."""
+        while self.running:
+            sockets = {}
+            for conn in self.connections:
+                if conn.reconnecting:
+                    continue
+                sock = conn.client.socket()
+                if sock is None:
+                    self.reconnect(conn)
+                else:
+                    sockets[sock] = conn
+
+            if not sockets:
+                time.sleep(0.2)
+                continue
+
+            writable = [sock for sock, conn in sockets.items() if conn.client.want_write()]
+            try:
+                readable, writable, _ = select.select(list(sockets), writable, [], 0.2)
+            except (OSError, ValueError):
+                # A socket was closed under us; rebuild the list next round
+                continue
+
+            for sock in readable:
+                sockets[sock].client.loop_read()
+            for sock in writable:
+                sockets[sock].client.loop_write()
+            for conn in sockets.values():
+                conn.client.loop_misc()
+
+    def reconnect(self, conn):
+        """
+        Start a reconnect when its backoff has passed. The blocking connect
+        runs on its own short-lived thread, so an unreachable broker only
+        holds up that connection; the I/O loop leaves the client alone
+        until it returns.
+        """
+        if time.monotonic() < conn.next_retry:
+            return
+        conn.reconnecting = True
+        threading.Thread(target=self._reconnect, args=(conn,), name=f"mqtt-pool-connect-{conn.index}",
+                         daemon=True).start()
+
+    def _reconnect(self, conn):
+        try:
+            conn.client.reconnect()
+        except Exception as e:
+            print(f"Pool connection {conn.client_id} error: {e}")
+            conn.retry_delay = min(conn.retry_delay * 2, 60.0)
+            conn.next_retry = time.monotonic() + conn.retry_delay
+        finally:
+            conn.reconnecting = False
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        for conn in self.connections:
+            try:
+                conn.client.disconnect()
+            except Exception:
+                pass
+
+
+class LogicalDevice:
+    """A device identity multiplexed over one pooled connection."""
+
+    def __init__(self, pool, device_id, connection):
+        self.pool = pool
+        self.device_id = device_id
+        self.connection = connection
+
+    @property
+    def connected(self):
+        return self.connection.connected
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        return self.connection.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def subscribe(self, pattern, callback, qos=1):
+        """callback(device_id, msg) is called for every matching message."""
+        self.connection.subscribe(pattern, self.device_id, callback, qos)
+
+    def close(self):
+        self.connection.unsubscribe_device(self.device_id)
+        self.pool.devices.pop(self.device_id, None)
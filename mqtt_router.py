@@ -0,0 +1,168 @@
+# MQTT topic routing
+"""
+Pre-compiled MQTT topic router.
+
+Subscription patterns ('+', '#', or named levels like '{device_id}') are
+compiled into a trie keyed by topic level, so resolving a topic costs one
+walk down the trie (bounded by the topic depth) no matter how many
+patterns are registered. Named levels are returned as path parameters.
+
+Handlers can be registered directly with add()/route(), or declared on a
+class with @topic_handler and collected with TopicRouter.from_object().
+"""
+
+
+def compile_pattern(pattern):
+    """
+    Split a pattern into MQTT filter levels and wildcard parameter names.
+    '{name}' becomes '+', '{name...}' becomes '#'; plain wildcards get no name.
+    """
+    levels, names = [], []
+    parts = pattern.split("/")
+    for i, part in enumerate(parts):
+        if part.startswith("{") and part.endswith("}"):
+            name = part[1:-1]
+            if name.endswith("..."):
+                part, name = "#", name[:-3]
+            else:
+                part = "+"
+        elif part in ("+", "#"):
+            name = None
+        else:
+            if "+" in part or "#" in part or "{" in part:
+                raise ValueError(f"Invalid topic pattern level '{part}' in {pattern}")
+            levels.append(part)
+            continue
+        if part == "#" and i != len(parts) - 1:
+            raise ValueError(f"'#' must be the last level of {pattern}")
+        levels.append(part)
+        names.append(name)
+    return levels, tuple(names)
+
+
+def topic_handler(pattern):
+    """Mark a method as the handler for an MQTT topic pattern."""
+    def decorator(func):
+        func.__dict__.setdefault("_topic_patterns", []).append(pattern)
+        return func
+    return decorator
+
+
+class _Node:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children = {}
+        self.routes = []  # (handler, parameter names)
+
+
+class TopicRouter:
+    """Trie of MQTT subscription patterns resolving topics to handlers and parameters."""
+
+    def __init__(self, cache_size=10000):
+        self.root = _Node()
+        self.patterns = {}  # MQTT filter -> number of routes using it
+        self.cache = {}
+        self.cache_size = cache_size
+
+    @classmethod
+    def from_object(cls, obj):
+        """Build a router from the @topic_handler methods of obj."""
+        router = cls()
+        for name in dir(type(obj)):
+            func = getattr(type(obj), name, None)
+            for pattern in getattr(func, "_topic_patterns", ()):
+                router.add(pattern, getattr(obj, name))
+        return router
+
+    def add(self, pattern, handler):
+        levels, names = compile_pattern(pattern)
+        node = self.root
+        for level in levels:
+            node = node.children.setdefault(level, _Node())
+        node.routes.append((handler, names))
+        mqtt_filter = "/".join(levels)
+        self.patterns[mqtt_filter] = self.patterns.get(mqtt_filter, 0) + 1
+        self.cache.clear()
+
+    def remove(self, pattern, handler):
+        levels, _ = compile_pattern(pattern)
+        node = self.root
+        for level in levels:
+            node = node.children.get(level)
+            if node is None:
+                return
+        before = len(node.routes)
+        node.routes = [route for route in node.routes if route[0] != handler]
+        removed = before - len(node.routes)
+        if removed:
+            mqtt_filter = "/".join(levels)
+            remaining = self.patterns[mqtt_filter] - removed
+            if remaining:
+                self.patterns[mqtt_filter] = remaining
+            else:
+                del self.patterns[mqtt_filter]
+            self.cache.clear()
+
+    def route(self, pattern):
+        """Decorator form of add()."""
+        def decorator(handler):
+            self.add(pattern, handler)
+            return handler
+        return decorator
+
+    def subscriptions(self, qos=1):
+        """MQTT (filter, qos) list covering every registered pattern."""
+        return [(mqtt_filter, qos) for mqtt_filter in self.patterns]
+
+    def resolve(self, topic):
+        """Return [(handler, params)] for every pattern matching topic."""
+        matches = self.cache.get(topic)
+        if matches is not None:
+            return matches
+
+        levels = topic.split("/")
+        # Wildcards never match '$SYS'-style topics at the first level
+        system_topic = topic.startswith("$")
+        matches = []
+        stack = [(self.root, 0, ())]
+        while stack:
+            node, depth, captured = stack.pop()
+            wildcard_ok = not (system_topic and depth == 0)
+
+            rest = node.children.get("#") if wildcard_ok else None
+            if rest is not None:
+                value = "/".join(levels[depth:])
+                for handler, names in rest.routes:
+                    matches.append((handler, self._params(names, captured + (value,))))
+
+            if depth == len(levels):
+                for handler, names in node.routes:
+                    matches.append((handler, self._params(names, captured)))
+                continue
+
+            level = levels[depth]
+            child = node.children.get(level)
+            if child is not None:
+                stack.append((child, depth + 1, captured))
+            plus = node.children.get("+") if wildcard_ok else None
+            if plus is not None:
+                stack.append((plus, depth + 1, captured + (level,)))
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[topic] = matches
+        return matches
+
+    @staticmethod
+    def _params(names, values):
+        if not names:
+            return {}
+        return {name: value for name, value in zip(names, values) if name}
+
+    def dispatch(self, topic, *args):
+        """Call handler(*args, **params) for every match; returns the number of handlers run."""
+        matches = self.resolve(topic)
+        for handler, params in matches:
+            handler(*args, **params)
+        return len(matches)
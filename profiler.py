@@ -0,0 +1,285 @@
+# Runtime profiling
+"""
+On-demand profiling for a running Smart AC process.
+
+A profiling session runs for a bounded time and writes its results to
+profiles/<time>_<role>/:
+
+    stacks.txt   all-thread stack samples in folded format (flamegraph.pl,
+                 speedscope), taken from sys._current_frames()
+    summary.txt  hottest functions per thread and per-stage timings
+    memory.txt   tracemalloc top allocations and growth during the session
+    trace.json   per-stage timing trace (chrome://tracing, Perfetto)
+    yappi.prof   pstats file, when mode is "yappi" and yappi is installed
+
+Sessions are started at runtime, from an MQTT request on
+DEBUG_PROFILE_TOPIC or with SIGUSR1, so a stalled process can be
+profiled without a restart. A new session may start at most once per
+MIN_START_INTERVAL, and only the newest KEEP_PROFILES result directories
+of a role are kept. Code marks its stages with
+`with profiler.stage("name"):`, which costs one attribute check while no
+session is active.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import signal
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+try:
+    import yappi
+except ImportError:
+    yappi = None
+
+# Upper bound for one session, whatever was requested (seconds)
+MAX_DURATION = 300.0
+DEFAULT_DURATION = 30.0
+# Stack sampling period (seconds)
+DEFAULT_INTERVAL = 0.005
+# Stage trace events kept per session
+MAX_TRACE_EVENTS = 200000
+# Shortest time between two session starts (seconds)
+MIN_START_INTERVAL = 60.0
+# Result directories kept per role; older ones are deleted
+KEEP_PROFILES = 10
+
+_NO_STAGE = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("session", "name", "start")
+
+    def __init__(self, session, name):
+        self.session = session
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.session.record_stage(self.name, self.start, time.perf_counter())
+        return False
+
+
+class ProfileSession:
+    """One bounded profiling run: stack sampler thread, tracemalloc and stage traces."""
+
+    def __init__(self, out_dir, duration, interval=DEFAULT_INTERVAL, memory=True, mode="sample"):
+        self.out_dir = out_dir
+        self.duration = min(max(float(duration), 0.1), MAX_DURATION)
+        self.interval = interval
+        self.memory = memory
+        self.mode = "yappi" if mode == "yappi" and yappi is not None else "sample"
+        self.stacks = Counter()
+        self.samples = 0
+        self.events = []
+        self.dropped_events = 0
+        self.stage_totals = defaultdict(lambda: [0, 0.0, 0.0])  # count, total, max
+        self.events_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started_memory = False
+        self.memory_start = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self.started_memory = True
+            self.memory_start = tracemalloc.take_snapshot()
+        if self.mode == "yappi":
+            yappi.set_clock_type("wall")
+            yappi.start(builtins=False, profile_threads=True)
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Sample every thread until stopped or the duration has elapsed."""
+        own = threading.get_ident()
+        deadline = self.start_time + self.duration
+        while not self.stop_event.is_set() and time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self.stop_event.wait(self.interval)
+        self.finish()
+
+    def record_stage(self, name, start, end):
+        with self.events_lock:
+            totals = self.stage_totals[name]
+            totals[0] += 1
+            totals[1] += end - start
+            totals[2] = max(totals[2], end - start)
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append((name, threading.get_ident(), start, end))
+            else:
+                self.dropped_events += 1
+
+    def stop(self):
+        self.stop_event.set()
+
+    def finish(self):
+        """Stop collectors and write every report."""
+        elapsed = time.perf_counter() - self.start_time
+        memory_end = tracemalloc.take_snapshot() if self.memory else None
+        if self.started_memory:
+            tracemalloc.stop()
+        if self.mode == "yappi":
+            yappi.stop()
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.write_stacks()
+        self.write_summary(elapsed)
+        self.write_trace()
+        if memory_end is not None:
+            self.write_memory(memory_end)
+        if self.mode == "yappi":
+            yappi.get_func_stats().save(os.path.join(self.out_dir, "yappi.prof"), type="pstat")
+            yappi.clear_stats()
+        print(f"Profile written to {self.out_dir} ({self.samples} samples, {elapsed:.1f}s)")
+
+    def write_stacks(self):
+        with open(os.path.join(self.out_dir, "stacks.txt"), "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def write_summary(self, elapsed):
+        # Self time: the innermost frame of each sample, per thread
+        per_thread = defaultdict(Counter)
+        for stack, count in self.stacks.items():
+            parts = stack.split(";")
+            per_thread[parts[0]][parts[-1] if len(parts) > 1 else "<idle>"] += count
+
+        lines = [f"Duration: {elapsed:.2f}s, {self.samples} samples every {self.interval * 1000:.1f} ms",
+                 f"Mode: {self.mode}", ""]
+        for thread_name, functions in sorted(per_thread.items()):
+            lines.append(f"Thread {thread_name}:")
+            for function, count in functions.most_common(15):
+                lines.append(f"  {count / max(self.samples, 1) * 100:6.1f}%  {function}")
+            lines.append("")
+
+        with self.events_lock:
+            stages = sorted(self.stage_totals.items(), key=lambda item: -item[1][1])
+        if stages:
+            lines.append(f"{'Stage':<28}{'calls':>9}{'total ms':>12}{'mean ms':>10}{'max ms':>10}")
+            for name, (count, total, longest) in stages:
+                lines.append(f"{name:<28}{count:>9}{total * 1000:>12.1f}"
+                             f"{total / count * 1000:>10.3f}{longest * 1000:>10.2f}")
+            if self.dropped_events:
+                lines.append(f"({self.dropped_events} trace events not recorded)")
+
+        with open(os.path.join(self.out_dir, "summary.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write_trace(self):
+        with self.events_lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                  "ts": (start - self.start_time) * 1e6, "dur": (end - start) * 1e6}
+                 for name, tid, start, end in events]
+        with open(os.path.join(self.out_dir, "trace.json"), "w") as f:
+            json.dump({"traceEvents": trace}, f)
+
+    def write_memory(self, snapshot):
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        snapshot = snapshot.filter_traces(filters)
+        lines = ["Top allocations:"]
+        lines += [f"  {stat}" for stat in snapshot.statistics("lineno")[:30]]
+        if self.memory_start is not None:
+            lines += ["", "Growth during the session:"]
+            growth = snapshot.compare_to(self.memory_start.filter_traces(filters), "lineno")
+            lines += [f"  {stat}" for stat in growth[:30]]
+        with open(os.path.join(self.out_dir, "memory.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class RuntimeProfiler:
+    """Starts bounded profiling sessions on request; at most one at a time."""
+
+    def __init__(self, role, base_dir="profiles", keep=KEEP_PROFILES, min_interval=MIN_START_INTERVAL):
+        self.role = role
+        self.base_dir = base_dir
+        self.keep = keep
+        self.min_interval = min_interval
+        self.session = None
+        self.last_start = None
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.session is not None
+
+    def start(self, duration=DEFAULT_DURATION, mode="sample", memory=True, interval=DEFAULT_INTERVAL):
+        """Start a session; returns its output directory, or None if one is running or started too recently."""
+        with self.lock:
+            if self.session is not None:
+                return None
+            now = time.monotonic()
+            if self.last_start is not None and now - self.last_start < self.min_interval:
+                return None
+            self.last_start = now
+            stamp = time.strftime("%Y%m%d_%H%M%S")
+            out_dir = os.path.join(self.base_dir, f"{stamp}_{self.role}")
+            session = self.session = ProfileSession(out_dir, duration, interval, memory, mode)
+            session.start()
+            threading.Thread(target=self._wait, args=(session,), name="profiler-wait",
+                             daemon=True).start()
+        print(f"Profiling {self.role} for {session.duration:.0f}s ({session.mode}) -> {out_dir}")
+        return out_dir
+
+    def _wait(self, session):
+        session.thread.join()
+        with self.lock:
+            if self.session is session:
+                self.session = None
+        self.prune()
+
+    def prune(self):
+        """Delete all but the newest `keep` result directories of this role."""
+        pattern = os.path.join(glob.escape(self.base_dir), f"*_{glob.escape(self.role)}")
+        old = sorted(glob.glob(pattern))[:-self.keep] if self.keep > 0 else []
+        for path in old:
+            shutil.rmtree(path, ignore_errors=True)
+        return len(old)
+
+    def stop(self):
+        with self.lock:
+            session = self.session
+        if session is not None:
+            session.stop()
+            session.thread.join()
+
+    def stage(self, name):
+        """Context manager timing one pipeline stage while a session is active."""
+        session = self.session
+        if session is None:
+            return _NO_STAGE
+        return _Stage(session, name)
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR1", None)):
+        """Start a default session on signum (SIGUSR1); no-op where unsupported."""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        # Start from a thread so the handler never waits on self.lock
+        signal.signal(signum, lambda *_: threading.Thread(target=self.start, daemon=True).start())
+        return True
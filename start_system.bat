@@ -29,6 +29,7 @@ if not exist "emulators\dht_emulator.py" set /A MISSING_FILES+=1
 if not exist "emulators\knob_emulator.py" set /A MISSING_FILES+=1
 if not exist "emulators\relay_emulator.py" set /A MISSING_FILES+=1
 if not exist "gui\main_gui.py" set /A MISSING_FILES+=1
+if not exist "gui\all_in_one.py" set /A MISSING_FILES+=1
 
 if !MISSING_FILES! NEQ 0 (
     color 0C
@@ -66,9 +67,10 @@ echo [3] Start Only DHT Emulator
 echo [4] Start Only Knob Emulator
 echo [5] Start Only Relay Emulator
 echo [6] Start Main GUI Launcher
-echo [7] Exit
+echo [7] Start All-in-One (single process, no broker needed)
+echo [8] Exit
 echo.
-set /p choice="Enter your choice (1-7): "
+set /p choice="Enter your choice (1-8): "
 
 if "%choice%"=="1" goto start_all
 if "%choice%"=="2" goto start_manager
@@ -76,7 +78,8 @@ if "%choice%"=="3" goto start_dht
 if "%choice%"=="4" goto start_knob
 if "%choice%"=="5" goto start_relay
 if "%choice%"=="6" goto start_gui
-if "%choice%"=="7" goto end
+if "%choice%"=="7" goto start_all_in_one
+if "%choice%"=="8" goto end
 
 echo Invalid choice! Please try again.
 timeout /t 2 /nobreak > nul
@@ -118,6 +121,12 @@ echo Starting Main GUI...
 start "Main GUI" cmd /k "color 0D && python gui\main_gui.py || (color 0C && echo ERROR: Main GUI failed to start! && pause)"
 goto end
 
+:start_all_in_one
+echo.
+echo Starting all components in one process...
+start "Smart AC All-in-One" cmd /k "color 0B && python gui\all_in_one.py || (color 0C && echo ERROR: All-in-One failed to start! && pause)"
+goto end
+
 :end
 echo.
 echo ========================================================
@@ -0,0 +1,210 @@
+# Startup budget
+"""
+Startup profiling and regression check for every Smart AC entry point.
+
+For each entry point it reports:
+
+    import time        python -X importtime of the module, with the
+                       heaviest direct imports and self-time hotspots
+    time to connected  from launching the script until its MQTT CONNECT
+                       reaches a local broker (mqtt_local.py), median of
+                       several runs, offscreen and in a scratch directory
+
+The run fails (exit code 1) when a time to connected exceeds its budget,
+or grows past a saved baseline by more than the tolerance.
+
+Usage:
+    python startup.py
+    python startup.py --entry manager --runs 5
+    python startup.py --save startup_baseline.json
+    python startup.py --baseline startup_baseline.json --tolerance 0.25
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+from mqtt_config import CLIENT_ID_PREFIX
+from mqtt_local import LocalBroker
+
+# DEVICE_NAME per launch, so each launch connects under its own client id
+LAUNCHES = itertools.count(1)
+# Entry point -> (script, module); the launcher never connects to the broker
+ENTRY_POINTS = {
+    "manager": ("data_manager/manager.py", "data_manager.manager"),
+    "dht": ("emulators/dht_emulator.py", "emulators.dht_emulator"),
+    "knob": ("emulators/knob_emulator.py", "emulators.knob_emulator"),
+    "relay": ("emulators/relay_emulator.py", "emulators.relay_emulator"),
+    "gui": ("gui/main_gui.py", "gui.main_gui"),
+}
+# Time-to-connected budgets (ms)
+DEFAULT_BUDGETS_MS = {
+    "manager": 1500,
+    "dht": 1200,
+    "knob": 1200,
+    "relay": 1200,
+}
+
+
+def _child_env(**extra):
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["METRICS_PORT"] = "0"
+    env.update(extra)
+    return env
+
+
+def parse_importtime(text):
+    """Parse -X importtime output into (self us, cumulative us, depth, module) rows."""
+    rows = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(fields[0]), int(fields[1]), depth, name.strip()))
+    return rows
+
+
+def import_report(module, top=8):
+    """Import module in a fresh interpreter; returns total ms and the heaviest imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=_child_env(), capture_output=True, text=True)
+    rows = parse_importtime(result.stderr)
+    entry = next((row for row in rows if row[2] == 0 and row[3] == module), None)
+    if result.returncode != 0 or entry is None:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    # Rows are printed after their children, so the entry point's own
+    # imports are the depth-1 rows just before it, back to the previous top-level row
+    index = rows.index(entry)
+    start = index
+    while start > 0 and rows[start - 1][2] > 0:
+        start -= 1
+    children = [row for row in rows[start:index] if row[2] == 1]
+    return {
+        "total_ms": entry[1] / 1000,
+        "direct": [(name, cumulative / 1000) for _, cumulative, _, name in
+                   sorted(children, key=lambda row: -row[1])[:top]],
+        "self": [(name, self_us / 1000) for self_us, _, _, name in
+                 sorted(rows[start:index + 1], key=lambda row: -row[0])[:top]],
+    }
+
+
+def time_to_connected(key, broker, timeout=20.0):
+    """Launch one entry point and return ms until its CONNECT reached the broker (None on failure)."""
+    script, _ = ENTRY_POINTS[key]
+    with tempfile.TemporaryDirectory(prefix="startup_") as workdir:
+        name = f"startup{next(LAUNCHES)}"
+        env = _child_env(MQTT_BROKER=broker.host, MQTT_PORT=str(broker.port), DEVICE_NAME=name)
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], cwd=workdir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        prefix, suffix = f"{CLIENT_ID_PREFIX}{key}_", f"_{name}"
+        elapsed = None
+        try:
+            while time.perf_counter() - start < timeout and process.poll() is None:
+                connected = [at for client_id, at in list(broker.connect_times.items())
+                             if client_id.startswith(prefix) and client_id.endswith(suffix)]
+                if connected:
+                    elapsed = (min(connected) - start) * 1000
+                    break
+                time.sleep(0.005)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    return elapsed
+
+
+def check(results, budgets, baseline=None, tolerance=0.25):
+    """Return a list of failure messages for results {key: median ms or None}."""
+    failures = []
+    for key, median in results.items():
+        if median is None:
+            failures.append(f"{key}: never connected")
+            continue
+        budget = budgets.get(key)
+        if budget is not None and median > budget:
+            failures.append(f"{key}: {median:.0f} ms over the {budget:.0f} ms budget")
+        previous = (baseline or {}).get(key)
+        if previous and median > previous * (1 + tolerance):
+            failures.append(f"{key}: {median:.0f} ms, {median / previous - 1:.0%} slower than the "
+                            f"{previous:.0f} ms baseline")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time report and time-to-connected check")
+    parser.add_argument("--entry", action="append", choices=list(ENTRY_POINTS),
+                        help="entry point to measure (repeatable, default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="launches per entry point")
+    parser.add_argument("--top", type=int, default=8, help="imports listed per entry point")
+    parser.add_argument("--no-imports", action="store_true", help="skip the import-time report")
+    parser.add_argument("--save", help="write the measured medians as a baseline JSON file")
+    parser.add_argument("--baseline", help="fail on regressions against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+    entries = args.entry or list(ENTRY_POINTS)
+
+    if not args.no_imports:
+        for key in entries:
+            report = import_report(ENTRY_POINTS[key][1], args.top)
+            print(f"\n{key}: imports take {report['total_ms']:.1f} ms")
+            print("  heaviest imports (cumulative ms):")
+            for name, ms in report["direct"]:
+                print(f"    {ms:8.1f}  {name}")
+            print("  hotspots (self ms):")
+            for name, ms in report["self"]:
+                print(f"    {ms:8.1f}  {name}")
+
+    broker = LocalBroker().start()
+    results = {}
+    try:
+        print()
+        for key in entries:
+            if key not in DEFAULT_BUDGETS_MS:
+                continue
+            samples = [time_to_connected(key, broker) for _ in range(args.runs)]
+            measured = [sample for sample in samples if sample is not None]
+            results[key] = statistics.median(measured) if len(measured) == len(samples) else None
+            shown = ", ".join(f"{sample:.0f}" for sample in measured) or "-"
+            print(f"{key}: time to connected {results[key] or float('nan'):.0f} ms "
+                  f"(runs: {shown}; budget {DEFAULT_BUDGETS_MS[key]} ms)")
+    finally:
+        broker.stop()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({key: value for key, value in results.items() if value is not None}, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check(results, DEFAULT_BUDGETS_MS, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("Startup within budget")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.energy import EnergyAccounting, day_slices, device_key, parse_rated_power
+
+
+@pytest.fixture
+def berlin(monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def at(text):
+    return datetime.fromisoformat(text).timestamp()
+
+
+def test_day_slices_split_at_local_midnight(berlin):
+    assert day_slices(at("2026-10-18T23:00"), at("2026-10-19T01:30")) == [
+        ("2026-10-18", 3600.0), ("2026-10-19", 5400.0)]
+    assert day_slices(at("2026-10-19T10:00"), at("2026-10-19T10:00")) == []
+    # The day the clocks go back has 25 hours
+    slices = day_slices(at("2026-10-24T12:00"), at("2026-10-26T12:00"))
+    assert slices == [("2026-10-24", 12 * 3600.0), ("2026-10-25", 25 * 3600.0), ("2026-10-26", 12 * 3600.0)]
+
+
+def test_run_across_midnight_is_split(berlin):
+    energy = EnergyAccounting(rated_kw=2.0, short_cycle_seconds=300)
+    energy.update("relay", False, at("2026-10-18T22:00"))
+    energy.update("relay", True, at("2026-10-18T23:30"))
+    assert energy.update("relay", False, at("2026-10-19T00:45")) == 4500
+    now = at("2026-10-19T12:00")
+    first, second = energy.day("relay", "2026-10-18", now=now), energy.day("relay", "2026-10-19", now=now)
+    assert (first["on_seconds"], first["cycles"], first["kwh"]) == (1800, 1, pytest.approx(1.0))
+    assert (second["on_seconds"], second["cycles"], second["kwh"]) == (2700, 0, pytest.approx(1.5))
+    month = energy.month("relay", "2026-10", now=now)
+    assert month["on_seconds"] == 4500 and month["cycles"] == 1
+
+
+def test_open_run_counts_up_to_now_and_flushes_once(berlin, tmp_path):
+    from data_manager.db import Database
+
+    db = Database(str(tmp_path / "test.db"))
+    try:
+        energy = EnergyAccounting(db, rated_kw=1.0)
+        energy.update("relay", False, at("2026-10-18T23:00"))
+        energy.update("relay", True, at("2026-10-18T23:50"))
+        assert energy.flush(at("2026-10-19T00:10")) == 2
+        # Flushing again later only adds the new time; the run is still open
+        energy.flush(at("2026-10-19T00:20"))
+        assert energy.day("relay", "2026-10-18", now=at("2026-10-19T00:20"))["on_seconds"] == 600
+        today = energy.day("relay", "2026-10-19", now=at("2026-10-19T00:30"))
+        assert today["on_seconds"] == 1800
+        assert today["duty_cycle"] == pytest.approx(1.0)
+        assert energy.devices() == ["relay"]
+    finally:
+        db.close()
+
+
+def test_first_report_and_short_cycles():
+    energy = EnergyAccounting(short_cycle_seconds=300)
+    assert energy.update("relay", True, 1000.0) is None  # start unknown: no cycle, no run
+    assert energy.update("relay", True, 1100.0) is None
+    assert energy.update("relay", False, 1200.0) is None
+    energy.update("relay", True, 1300.0)
+    assert energy.update("relay", False, 1400.0) == 100
+    totals = energy.usage("relay", "1970-01-01", "1970-01-02", now=1500.0)
+    assert (totals["cycles"], totals["short_cycles"], totals["on_seconds"]) == (1, 1, 300)
+
+
+def test_device_key():
+    assert device_key("smart_ac_relay_host") == "relay_host"
+    assert device_key("smart_ac_relay_host_livingroom_3") == "relay_host_livingroom_3"
+    assert device_key("livingroom") == "livingroom"
+    assert device_key(None) == "relay"
+
+
+def test_parse_rated_power():
+    assert parse_rated_power("1.2,relay_livingroom=2.0") == (1.2, {"relay_livingroom": 2.0})
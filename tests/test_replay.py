@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.db import Database
+from data_manager.replay import iter_readings, run_replay
+
+
+def test_late_and_malformed_rows_are_skipped(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = Database(db_file)
+    try:
+        db.insert_readings([(f"2026-10-19T10:0{i}:00", 24.0, 45.0, 22.0, 1) for i in range(4)])
+        # A late sample flushed from an outbox: new id, old timestamp, no setpoint or status
+        db.insert_readings([("2026-10-19T09:00:00", 30.0, None, None, None)])
+        db.insert_readings([("not a timestamp", 24.0, 45.0, 22.0, 1),
+                            ("2026-10-19T10:04:00", 24.0, 45.0, 22.0, 1)])
+    finally:
+        db.close()
+
+    rows = [row for chunk in iter_readings(db_file, chunk_size=2) for row in chunk]
+    assert [row[1] for row in rows] == [24.0] * 5
+    assert all(b[0] - a[0] == 60 for a, b in zip(rows, rows[1:]))
+
+    recorded = run_replay(db_file, [])[0]
+    assert (recorded.samples, recorded.total_seconds, recorded.on_seconds) == (5, 240.0, 240.0)
+    assert recorded.actuations == 1
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime, timedelta, time as dtime
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.scheduler import SetpointScheduler, WeeklyProgram, load_schedules, parse_days
+
+# Weekday and weekend programs plus a daily change inside the hour DST skips or repeats
+ENTRIES = ([(day, "06:30", 22) for day in range(5)] + [(day, "23:00", 26) for day in range(5)] +
+           [(day, "08:00", 23) for day in (5, 6)] + [(day, "23:30", 26) for day in (5, 6)] +
+           [(day, "02:30", 24) for day in range(7)])
+
+
+@pytest.fixture
+def berlin(monkeypatch):
+    """Local time with DST changes (last Sundays of March and October)."""
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def at(text):
+    return datetime.fromisoformat(text).timestamp()
+
+
+def program_instants(ts, days):
+    """(epoch time, setpoint) of every program change from days before to days after ts."""
+    today = datetime.fromtimestamp(ts).date()
+    instants = []
+    for back in range(-days, days + 1):
+        day = today + timedelta(days=back)
+        for weekday, clock, setpoint in ENTRIES:
+            if day.weekday() == weekday:
+                hours, minutes = map(int, clock.split(":"))
+                instants.append((datetime.combine(day, dtime(hours, minutes)).timestamp(), setpoint))
+    return sorted(instants)
+
+
+def brute_setpoint(ts, overrides):
+    """Latest program change at or before ts, unless an override is active (latest start wins)."""
+    setpoint = [value for instant, value in program_instants(ts, 8) if instant <= ts][-1]
+    active = sorted(entry for entry in overrides if entry[0] <= ts < entry[1])
+    return active[-1][2] if active else setpoint
+
+
+def transitions(start, end, overrides):
+    edges = {instant for instant, _ in program_instants(start, 12) if start < instant <= end}
+    edges.update(edge for entry in overrides for edge in entry[:2] if start < edge <= end)
+    return edges
+
+
+@pytest.mark.parametrize("start", ["2026-03-25T12:00", "2026-10-21T12:00"])
+def test_scheduler_matches_brute_force_across_dst(berlin, start):
+    start = at(start)
+    end = start + 9 * 86400
+    overrides = [
+        (start + 86400 + 2 * 3600, start + 86400 + 6 * 3600, 21.0),
+        (start + 86400 + 3 * 3600, start + 86400 + 4 * 3600, 19.0),  # nested, starts later: wins
+        (start + 4 * 86400 - 1800, start + 4 * 86400 + 7200, 20.0),
+    ]
+    # An override ending in the hour the clocks change, just before the 02:30 program change
+    night = datetime.fromtimestamp(start + 4 * 86400).date()
+    overrides.append((datetime.combine(night, dtime(1, 0)).timestamp(),
+                      datetime.combine(night, dtime(2, 15)).timestamp(), 25.0))
+
+    scheduler = SetpointScheduler()
+    applied = scheduler.set_program("home", WeeklyProgram(ENTRIES), start)
+    for begin, finish, value in overrides:
+        applied = scheduler.add_override("home", value, begin, finish, start)
+    assert applied == brute_setpoint(start, overrides)
+
+    now, wakeups = start, 0
+    while True:
+        due = scheduler.next_due()
+        assert due is not None and due > now
+        if due > end:
+            break
+        # Nothing may change between two wakeups
+        for sample in range(int(now) + 60, int(due), 600):
+            assert brute_setpoint(sample, overrides) == applied, datetime.fromtimestamp(sample)
+        now = due
+        applied = dict(scheduler.run_due(now)).get("home", applied)
+        assert applied == brute_setpoint(now, overrides), datetime.fromtimestamp(now)
+        wakeups += 1
+    # One wakeup per transition at most: no polling, no re-arming loop around DST
+    assert wakeups <= len(transitions(start, end, overrides))
+
+
+def test_repeated_hour_keeps_setpoint(berlin):
+    program = WeeklyProgram([(6, "02:30", 20), (6, "12:00", 25)])
+    first = at("2026-10-25T02:30")  # the first 02:30; the clocks go back at 03:00
+    assert program.lookup(first - 60) == (25.0, first)
+    # The repeated 02:00-03:00 must neither restore 25 nor return a change in the past
+    for ts in (first + 60, first + 1800, first + 3600 + 60):
+        assert program.lookup(ts) == (20.0, at("2026-10-25T12:00"))
+
+
+def test_override_precedence():
+    scheduler = SetpointScheduler()
+    program = WeeklyProgram([(day, "00:00", 24) for day in range(7)])
+    now = at("2026-10-19T09:00")
+    scheduler.set_program("home", program, now)
+    scheduler.add_override("home", 21, now + 3600, now + 4 * 3600, now)
+    scheduler.add_override("home", 19, now + 2 * 3600, now + 3 * 3600, now)
+    expected = [(now + 1800, 24), (now + 3600 + 60, 21), (now + 2 * 3600 + 60, 19),
+                (now + 3 * 3600 + 60, 21), (now + 4 * 3600 + 60, 24)]
+    for ts, setpoint in expected:
+        assert scheduler.setpoint("home", ts) == setpoint
+    with pytest.raises(ValueError):
+        scheduler.add_override("home", 20, now, now, now)
+
+
+def test_stale_heap_entries_are_skipped():
+    scheduler = SetpointScheduler()
+    now = at("2026-10-19T09:00")
+    scheduler.set_program("a", WeeklyProgram([(0, "10:00", 22), (0, "20:00", 26)]), now)
+    scheduler.set_program("a", WeeklyProgram([(0, "12:00", 23), (0, "20:00", 26)]), now)
+    scheduler.set_program("b", WeeklyProgram([(0, "11:00", 21)]), now)
+    scheduler.remove_zone("b")
+    assert scheduler.next_due() == at("2026-10-19T12:00")
+    assert scheduler.run_due(at("2026-10-19T12:00")) == [("a", 23.0)]
+    assert scheduler.next_due() == at("2026-10-19T20:00")
+
+
+def test_parse_days():
+    assert parse_days("mon-fri") == [0, 1, 2, 3, 4]
+    assert parse_days("sat,sun") == [5, 6]
+    assert parse_days("fri-mon") == [0, 4, 5, 6]
+    assert parse_days("daily") == list(range(7))
+
+
+def test_load_schedules(tmp_path):
+    path = tmp_path / "schedules.json"
+    path.write_text(json.dumps({
+        "programs": {"workday": [{"days": "mon-fri", "at": "06:30", "setpoint": 22},
+                                 {"days": "mon-fri", "at": "23:00", "setpoint": 26}]},
+        "zones": {
+            "home": {"program": "workday",
+                     "overrides": [{"start": "2026-10-19T14:00", "end": "2026-10-19T18:00", "setpoint": 21}]},
+            "office": {"program": [{"days": "daily", "at": "08:00", "setpoint": 23}]},
+        },
+    }))
+    now = at("2026-10-19T12:00")  # a Monday
+    scheduler = load_schedules(str(path), now=now)
+    assert len(scheduler) == 2
+    assert scheduler.setpoint("home", now) == 22
+    assert scheduler.setpoint("home", at("2026-10-19T15:00")) == 21
+    assert scheduler.setpoint("office", now) == 23
+
+    path.write_text(json.dumps({"zones": {"home": {"program": "missing"}}}))
+    with pytest.raises(ValueError):
+        load_schedules(str(path), now=now)
@@ -0,0 +1,131 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager.storage import HotCache, open_storage
+
+# One-decimal sensor values; the columnar backend stores them as float32
+ROWS = [(f"2026-10-18T10:{i // 60:02d}:{i % 60:02d}.500000", round(20.0 + (i % 8) / 10 + 2.2, 1), 45.1,
+         None if i % 5 == 0 else 22.3, None if i % 7 == 0 else i % 2) for i in range(40)]
+
+
+def make_storage(backend, tmp_path):
+    options = {}
+    if backend != "memory":
+        options["db_file"] = str(tmp_path / "test.db")
+    if backend == "columnar":
+        options["columnar_dir"] = str(tmp_path / "columnar")
+    return open_storage(backend, **options)
+
+
+@pytest.fixture
+def memory():
+    storage = open_storage("memory")
+    storage.insert_readings(ROWS)
+    return storage
+
+
+@pytest.fixture(params=["sqlite", "columnar", "memory"])
+def storage(request, tmp_path):
+    storage = make_storage(request.param, tmp_path)
+    storage.insert_readings(ROWS)
+    yield storage
+    storage.close()
+
+
+def test_backends_agree(storage, memory):
+    assert storage.get_recent_readings(10) == memory.get_recent_readings(10)
+    assert storage.get_recent_readings(100) == list(reversed(ROWS))
+    start, end = ROWS[5][0], ROWS[12][0]
+    assert storage.get_readings_between(start, end) == ROWS[5:12]
+    assert storage.get_readings_since(0) == [row + (i + 1,) for i, row in enumerate(ROWS)]
+    assert storage.get_readings_since(len(ROWS)) == []
+
+
+def test_cursor_paging_sees_every_row_once(storage):
+    cursor, seen = 0, []
+    while True:
+        page = storage.get_readings_since(cursor, limit=7)
+        if not page:
+            break
+        assert len(page) <= 7
+        seen.extend(page)
+        cursor = page[-1][-1]
+    assert [row[:5] for row in seen] == ROWS
+    assert [row[-1] for row in seen] == list(range(1, len(ROWS) + 1))
+
+
+def test_alarms(storage):
+    for i in range(3):
+        storage.insert_alarm(f"alarm {i}")
+    recent = storage.get_recent_alarms(2)
+    assert [row[1] for row in recent] == ["alarm 2", "alarm 1"]
+    assert [row[1] for row in storage.get_alarms_since(recent[-1][-1])] == ["alarm 2"]
+
+
+def test_columnar_rows_survive_reopen(tmp_path):
+    storage = make_storage("columnar", tmp_path)
+    storage.insert_readings(ROWS[:10])
+    storage.insert_reading(22.3, 45.1, 22.0, 1)
+    storage.close()
+    storage = make_storage("columnar", tmp_path)
+    try:
+        rows = storage.get_readings_since(0)
+        assert [row[:5] for row in rows[:10]] == ROWS[:10]
+        assert rows[10][1:5] == (22.3, 45.1, 22.0, 1)
+    finally:
+        storage.close()
+
+
+def test_sqlite_cache_misses_fall_back_to_sql(tmp_path):
+    from data_manager.db import Database
+
+    db = Database(str(tmp_path / "test.db"), cache_rows=5)
+    try:
+        db.insert_readings(ROWS)
+        # The cache only holds ids 36-40: older cursors and long limits must query SQLite
+        assert db.get_readings_since(0) == [row + (i + 1,) for i, row in enumerate(ROWS)]
+        assert db.get_readings_since(34, limit=3) == [ROWS[i] + (i + 1,) for i in range(34, 37)]
+        assert db.get_recent_readings(8) == list(reversed(ROWS[-8:]))
+    finally:
+        db.close()
+
+    # A reopened database warms its cache from the file
+    db = Database(str(tmp_path / "test.db"), cache_rows=5)
+    try:
+        assert db.reading_cache.since(35) == [ROWS[i] + (i + 1,) for i in range(35, 40)]
+    finally:
+        db.close()
+
+
+def cache_with_ids(first, last, max_rows):
+    cache = HotCache(max_rows)
+    cache.extend((f"row {i}", i) for i in range(first, last + 1))
+    return cache
+
+
+def test_hot_cache_since_eviction_boundary():
+    cache = cache_with_ids(1, 10, max_rows=4)  # holds ids 7-10, ids 1-6 evicted
+    assert cache.since(6) == [("row 7", 7), ("row 8", 8), ("row 9", 9), ("row 10", 10)]
+    assert cache.since(5) is None  # id 6 was evicted
+    assert cache.since(0) is None
+    assert cache.since(8) == [("row 9", 9), ("row 10", 10)]
+    assert cache.since(6, limit=2) == [("row 7", 7), ("row 8", 8)]
+    assert cache.since(10) == []
+    assert cache.since(99) == []
+
+
+def test_hot_cache_not_full_holds_whole_table():
+    cache = cache_with_ids(1, 3, max_rows=4)
+    assert cache.since(0) == [("row 1", 1), ("row 2", 2), ("row 3", 3)]
+    assert HotCache(4).since(0) == []
+
+
+def test_hot_cache_newest():
+    cache = cache_with_ids(1, 10, max_rows=4)
+    assert cache.newest(2) == [("row 10", 10), ("row 9", 9)]
+    assert cache.newest(4) == [("row 10", 10), ("row 9", 9), ("row 8", 8), ("row 7", 7)]
+    assert cache.newest(5) is None
+    assert cache.newest(0) == []